@@ -0,0 +1,4 @@
+"""
+Offline latency benchmarks for the chatbot pipeline
+Run with: python -m benchmarks --help
+"""
@@ -0,0 +1,26 @@
+"""
+Fixed benchmark question set - one group per routing path
+"""
+
+QUESTIONS = [
+    # Calamity: semantic classification -> history-aware retrieval -> grading -> calamity chain
+    {"path": "calamity", "question": "How do I defeat Yharon in Revengeance mode?"},
+    {"path": "calamity", "question": "What is the best weapon to craft after Providence?"},
+    {"path": "calamity", "question": "Which boss drops the Ark of the Cosmos in Terraria Calamity?"},
+
+    # GeM single document: doc number -> hybrid extraction
+    {"path": "gem_document", "question": "What is the bid opening date for 7893321?"},
+    {"path": "gem_document", "question": "What documents are required from the seller in bid 8046605?"},
+
+    # GeM multi document: multi_document_search -> single large prompt
+    {"path": "gem_multi_document", "question": "List all bid opening times for all documents"},
+    {"path": "gem_multi_document", "question": "Compare the bid end dates in each pdf"},
+
+    # GeM general: keyword routing -> history-aware retrieval -> grading
+    {"path": "gem_general", "question": "What is the evaluation method used in the tender?"},
+    {"path": "gem_general", "question": "Is EMD required for this procurement?"},
+
+    # General knowledge: semantic/keyword classification -> general chain
+    {"path": "general", "question": "What is 2+2?"},
+    {"path": "general", "question": "Who wrote the novel Pride and Prejudice?"},
+]
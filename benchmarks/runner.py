@@ -0,0 +1,227 @@
+"""
+Benchmark Runner
+Runs the real graph, GemProcessor searches and QuestionClassifier against the
+local model stand-ins and synthetic indexes, and reports latency distributions
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+from .questions import QUESTIONS
+
+RESULTS_DIR = "bench_results"
+
+
+def summarize(samples):
+    """Latency distribution in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(values.mean()), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p90_ms": round(float(np.percentile(values, 90)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_graph(app, iterations: int):
+    """End-to-end and per-node latency for every question in the set"""
+    end_to_end = []
+    by_path = defaultdict(list)
+    by_node = defaultdict(list)
+    routes = defaultdict(lambda: defaultdict(int))
+
+    for _ in range(iterations):
+        for item in QUESTIONS:
+            config = {"configurable": {"thread_id": f"bench-{uuid.uuid4()}"}}
+            initial_state = {"question": item["question"], "chat_history": [], "user_choice": ""}
+
+            start = time.perf_counter()
+            last = start
+            final_update = {}
+            for update in app.stream(initial_state, config=config, stream_mode="updates"):
+                now = time.perf_counter()
+                for node, node_update in update.items():
+                    by_node[node].append(now - last)
+                    if node_update:
+                        final_update.update(node_update)
+                last = now
+
+            elapsed = time.perf_counter() - start
+            end_to_end.append(elapsed)
+            by_path[item["path"]].append(elapsed)
+            routes[item["path"]][final_update.get("generation_source", "unknown")] += 1
+
+    return {
+        "end_to_end": summarize(end_to_end),
+        "nodes": {node: summarize(samples) for node, samples in by_node.items()},
+        "paths": {path: summarize(samples) for path, samples in by_path.items()},
+        "routes": {path: dict(counts) for path, counts in routes.items()},
+    }
+
+
+def bench_gem_search(gem_processor, iterations: int):
+    """Latency of the individual GeM retrieval strategies"""
+    samples = defaultdict(list)
+    for _ in range(iterations):
+        samples["smart_gem_search"].append(
+            _timed(gem_processor.smart_gem_search, "What documents are required from the seller in bid 8046605?")[1]
+        )
+        samples["smart_gem_search_general"].append(
+            _timed(gem_processor.smart_gem_search, "What is the evaluation method?")[1]
+        )
+        samples["multi_document_search"].append(
+            _timed(gem_processor.multi_document_search, "List all bid opening times for all documents")[1]
+        )
+        samples["hybrid_gem_extraction"].append(
+            _timed(gem_processor.hybrid_gem_extraction, "bid opening date for 7893321", "7893321")[1]
+        )
+    return {name: summarize(values) for name, values in samples.items()}
+
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def bench_gem_index(gem_db, gem_path):
+    """Index size and the retrieval depth needed to reach every bid"""
+    from chat.near_duplicates import chunk_sources
+    from .synthetic import BID_NUMBERS
+
+    depths = {}
+    for question in ("List all bid opening times for all documents", "What documents are required from the seller?"):
+        covered = set()
+        depth = None
+        for rank, doc in enumerate(gem_db.similarity_search(question, k=gem_db.index.ntotal), start=1):
+            covered.update(number for number in BID_NUMBERS for source in chunk_sources(doc.metadata) if number in source)
+            if len(covered) == len(BID_NUMBERS):
+                depth = rank
+                break
+        depths[question] = depth
+    return {"vectors": gem_db.index.ntotal, "bytes": _directory_bytes(gem_path), "coverage_k": depths}
+
+
+def bench_classifier(classifier, iterations: int):
+    """Classifier latency per routing path"""
+    samples = defaultdict(list)
+    for _ in range(iterations):
+        for item in QUESTIONS:
+            samples[item["path"]].append(_timed(classifier.classify_question_type, item["question"])[1])
+    return {path: summarize(values) for path, values in samples.items()}
+
+
+def compare(current, previous_path):
+    """Print p50/p95 deltas against an earlier results file"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+
+    def rows(results):
+        graph = results["results"].get("graph", {})
+        yield "end_to_end", graph.get("end_to_end", {})
+        for node, stats in graph.get("nodes", {}).items():
+            yield f"node:{node}", stats
+
+    old = dict(rows(previous))
+    print(f"\nComparison against {previous_path}")
+    for name, stats in rows(current):
+        if name not in old or not stats.get("count"):
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            delta = stats[key] - old[name].get(key, 0)
+            print(f"  {name:30} {key}: {old[name].get(key, 0):9.2f} -> {stats[key]:9.2f} ({delta:+.2f})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline chatbot latency benchmarks")
+    parser.add_argument("--iterations", type=int, default=3, help="Passes over the question set")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Simulated LLM latency (seconds)")
+    parser.add_argument("--llm-jitter", type=float, default=0.02, help="Extra deterministic LLM jitter (seconds)")
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="Simulated embedding latency (seconds)")
+    parser.add_argument("--embedding-jitter", type=float, default=0.005)
+    parser.add_argument("--gem-chunks-per-bid", type=int, default=40)
+    parser.add_argument("--calamity-chunks", type=int, default=300)
+    parser.add_argument("--suite", choices=["all", "graph", "gem_search", "classifier"], default="all")
+    parser.add_argument("--speculative", action="store_true", help="Retrieve from both stores while classifying")
+    parser.add_argument("--dedup", action="store_true", help="Deduplicate GeM chunks at ingest")
+    parser.add_argument("--output", help=f"Results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+
+    from chat.local_models import LocalEmbeddings
+    from .synthetic import build_indexes
+
+    print(f"Building synthetic indexes in {workdir}")
+    calamity_path, gem_path = build_indexes(
+        workdir, LocalEmbeddings(), args.gem_chunks_per_bid, args.calamity_chunks, dedup=args.dedup
+    )
+
+    # Must be in place before chat.chatbot_service is imported
+    os.environ.update({
+        "CHATBOT_MODEL_PROVIDER": "local",
+        "LOCAL_LLM_LATENCY": str(args.llm_latency),
+        "LOCAL_LLM_JITTER": str(args.llm_jitter),
+        "LOCAL_EMBEDDING_LATENCY": str(args.embedding_latency),
+        "LOCAL_EMBEDDING_JITTER": str(args.embedding_jitter),
+        "CALAMITY_VECTOR_STORE_PATH": calamity_path,
+        "GEM_VECTOR_STORE_PATH": gem_path,
+        "GEM_SUMMARY_STORE_PATH": f"{workdir}/faiss_gem_summaries",
+    })
+
+    from langgraph.checkpoint.memory import MemorySaver
+    from chat.chatbot_graph import create_graph
+    from chat.chatbot_service import get_chatbot_service
+
+    service = get_chatbot_service()
+    results = {"gem_index": bench_gem_index(service.gem_db, gem_path)}
+
+    if args.suite in ("all", "graph"):
+        print("Running graph benchmark...")
+        results["graph"] = bench_graph(
+            create_graph(checkpointer=MemorySaver(), speculative=args.speculative), args.iterations
+        )
+    if args.suite in ("all", "gem_search"):
+        print("Running GeM search benchmark...")
+        results["gem_search"] = bench_gem_search(service.gem_processor, args.iterations)
+    if args.suite in ("all", "classifier"):
+        print("Running classifier benchmark...")
+        results["classifier"] = bench_classifier(service.classifier, args.iterations)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+    return report
@@ -0,0 +1,97 @@
+"""
+Synthetic Calamity and GeM vector stores for benchmarking
+"""
+import random
+
+from langchain.schema import Document
+from langchain_community.vectorstores import FAISS
+
+from chat.docstore import save_vector_store
+from chat.gem_summaries import build_bid_summaries
+from chat.near_duplicates import deduplicate_chunks
+
+BID_NUMBERS = ['7893321', '7908419', '7975925', '7987151', '8046605', '8089475', '8102343', '8127013']
+
+GEM_SECTIONS = [
+    "Bid Details Bid End Date/Time {end} Bid Opening Date/Time {opening} Bid Offer Validity (From End Date) 120 (Days)",
+    "Ministry Of Defence Department Of Military Affairs Organisation Name Indian Army Office Name {office}",
+    "Item Category Annual Maintenance Service - {item} Contract Period 1 Year(s)",
+    "Documents required from seller Experience Criteria, Past Performance, Bidder Turnover, Certificate (Requested in ATC)",
+    "Evaluation Method Total value wise evaluation. Arbitration Clause No. Mediation Clause No",
+    "EMD Detail Required No. ePBG Detail Required No. MII Purchase Preference Yes. MSE Purchase Preference Yes",
+    "General Terms and Conditions The seller shall comply with all buyer added terms and conditions of the bid",
+    "Buyer instructions Bidders are advised to read the bid document carefully before submitting the offer",
+]
+
+CALAMITY_SECTIONS = [
+    "{boss} is a post-Moon Lord boss. It drops {weapon} and requires {item} to summon.",
+    "The {weapon} is a {rarity} weapon crafted at the Draedon's Forge using {item}.",
+    "To defeat {boss}, use the {weapon} with an arena of platforms and wings for mobility.",
+    "{item} is a crafting material obtained after defeating {boss} in Revengeance mode.",
+]
+
+BOSSES = ["Yharon", "Providence", "Devourer of Gods", "Astrum Deus", "Supreme Calamitas", "Exo Mechs"]
+WEAPONS = ["Ark of the Cosmos", "Murasama", "Zenith", "Eternity", "Scarlet Devil", "Drataliornus"]
+ITEMS = ["Auric Bar", "Ascendant Spirit Essence", "Cosmilite Bar", "Yharon Soul Fragment", "Exo Prism"]
+
+
+def _gem_documents(chunks_per_bid: int, rng: random.Random):
+    documents = []
+    for bid_number in BID_NUMBERS:
+        source = f"GeM-Bidding-{bid_number}.pdf"
+        day = rng.randint(1, 28)
+        values = {
+            "end": f"{day:02d}-08-2025 11:00:00",
+            "opening": f"{day:02d}-08-2025 {rng.choice(['09', '10', '11', '12', '14'])}:30:00",
+            "office": rng.choice(["Pune", "Delhi", "Lucknow", "Chennai"]),
+            "item": rng.choice(["Generators", "Air Conditioners", "Vehicles", "Computers"]),
+        }
+        for chunk_id in range(chunks_per_bid):
+            section = GEM_SECTIONS[chunk_id % len(GEM_SECTIONS)].format(**values)
+            documents.append(Document(
+                page_content=f"GEM/2025/B/{bid_number} {section}",
+                metadata={
+                    "source": source,
+                    "bid_number": f"GEM/2025/B/{bid_number}",
+                    "ministry": "Defence",
+                    "chunk_id": chunk_id,
+                    "total_chunks": chunks_per_bid,
+                }
+            ))
+    return documents
+
+
+def _calamity_documents(count: int, rng: random.Random):
+    documents = []
+    for i in range(count):
+        section = CALAMITY_SECTIONS[i % len(CALAMITY_SECTIONS)].format(
+            boss=rng.choice(BOSSES),
+            weapon=rng.choice(WEAPONS),
+            item=rng.choice(ITEMS),
+            rarity=rng.choice(["Turquoise", "Pure Green", "Dark Blue", "Violet"]),
+        )
+        documents.append(Document(page_content=section, metadata={"source": f"calamity_wiki_{i // 10}"}))
+    return documents
+
+
+def build_indexes(target_dir, embeddings, gem_chunks_per_bid: int = 40, calamity_chunks: int = 300, seed: int = 7,
+                  dedup: bool = False):
+    """Build both stores (plus the GeM bid summaries) under target_dir and return their paths
+
+    With dedup=True the GeM chunks go through the ingest duplicate pass first.
+    """
+    rng = random.Random(seed)
+    calamity_path = f"{target_dir}/faiss_index_combined"
+    gem_path = f"{target_dir}/faiss_gem_index"
+
+    save_vector_store(FAISS.from_documents(_calamity_documents(calamity_chunks, rng), embeddings), calamity_path)
+    gem_documents = _gem_documents(gem_chunks_per_bid, rng)
+    if dedup:
+        gem_documents, report = deduplicate_chunks(gem_documents)
+        print(f"Deduplicated GeM chunks: {report['chunks_before']} -> {report['chunks_after']}")
+    save_vector_store(FAISS.from_documents(gem_documents, embeddings), gem_path)
+    save_vector_store(
+        FAISS.from_documents(build_bid_summaries(gem_documents), embeddings), f"{target_dir}/faiss_gem_summaries"
+    )
+
+    return calamity_path, gem_path
@@ -0,0 +1,82 @@
+"""
+Batch Caches
+Shared state for `manage.py answer_batch`: question embeddings computed in
+bulk up front, plus retrieval results and grader verdicts reused by every
+item of the batch. Only active inside batch_scope(); interactive requests
+never see it.
+"""
+import contextvars
+import threading
+from contextlib import contextmanager
+
+from .metrics import record_cache
+from .singleflight import SingleFlight
+
+_batch_cache = contextvars.ContextVar("chatbot_batch_cache", default=None)
+
+
+class BatchCache:
+    """Embeddings, retrievals and grades shared across one batch
+
+    Concurrent items computing the same entry share one computation.
+    """
+
+    def __init__(self):
+        self._embeddings = {}
+        self._retrievals = {}
+        self._grades = {}
+        self._inflight = SingleFlight("batch")
+        self._lock = threading.Lock()
+
+    def add_embeddings(self, texts, vectors):
+        with self._lock:
+            self._embeddings.update(zip(texts, vectors))
+
+    def missing_embeddings(self, texts) -> list:
+        with self._lock:
+            return [text for text in dict.fromkeys(texts) if text not in self._embeddings]
+
+    def embedding(self, text):
+        with self._lock:
+            vector = self._embeddings.get(text)
+        record_cache("batch_embedding", hit=vector is not None)
+        return vector
+
+    def retrieval(self, key, compute) -> list:
+        return list(self._get("batch_retrieval", self._retrievals, key, compute))
+
+    def grade(self, key, compute):
+        return self._get("batch_grade", self._grades, key, compute)
+
+    def _get(self, name, table, key, compute):
+        with self._lock:
+            if key in table:
+                record_cache(name, hit=True)
+                return table[key]
+        record_cache(name, hit=False)
+        value = self._inflight.do((name, key), compute)
+        with self._lock:
+            table[key] = value
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "embeddings": len(self._embeddings),
+                "retrievals": len(self._retrievals),
+                "grades": len(self._grades),
+            }
+
+
+def batch_cache():
+    """BatchCache of the batch being run, or None outside one"""
+    return _batch_cache.get()
+
+
+@contextmanager
+def batch_scope(cache: BatchCache):
+    token = _batch_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _batch_cache.reset(token)
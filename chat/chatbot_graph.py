@@ -1,65 +1,143 @@
 """
 Enhanced Chatbot Graph - Supports both Calamity mod and GeM procurement
 """
-from typing import List, TypedDict
+import contextvars
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import List, Optional, TypedDict
 from langchain_core.messages import BaseMessage
 from langchain.schema import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers.json import JsonOutputParser
 from langgraph.graph import StateGraph, END
 
+from .batch import batch_cache
 from .chatbot_service import get_chatbot_service
+from .domains import GEM
+from .deadline import DeadlineExceeded, can_afford, deadline_scope, mark_degraded, new_deadline, remaining, with_deadline
+from .gem_summaries import is_summary
+from .grading import log_verdict, score_gate, scores_of
+from .query_analysis import QueryPlan, analyze_query, plan_for
+from .metrics import (
+    CHUNKS_RETRIEVED, DEGRADED_ANSWERS, SPECULATION_SAVED_SECONDS, SPECULATION_WASTED_SECONDS,
+    SPECULATIVE_RETRIEVALS, current_trace, span, traced_node,
+)
+from .resilience import UNAVAILABLE_ERRORS
+from .singleflight import SingleFlight
 
 # Get fresh service instance
 chatbot_service = get_chatbot_service()
 
+# Identical questions asked concurrently share one graph run
+_graph_runs = SingleFlight("graph")
+
+# Recent good answers, served when generation is unavailable
+_recent_answers = OrderedDict()
+_recent_answers_lock = threading.Lock()
+RECENT_ANSWERS_SIZE = 256
+
+# Retrieve from both stores while the classifier runs (see create_graph)
+SPECULATIVE_RETRIEVAL = os.getenv("CHATBOT_SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+_speculation_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CHATBOT_SPECULATION_WORKERS", "16")), thread_name_prefix="speculative-retrieve"
+)
+
 class GraphState(TypedDict):
     question: str
     chat_history: List[BaseMessage]
     documents: List[Document]
+    scores: List[Optional[float]]  # FAISS distance per document, None if unknown
     answer: str
     generation_source: str
-    question_type: str  # "calamity", "gem", or "general"
+    question_type: str  # A registered domain name ("calamity", "gem", "general", ...)
     user_choice: str    # For disambiguation
+    query_plan: QueryPlan  # Set once by the first node
+    deadline: Optional[float]  # Wall-clock time the answer is due by (None: no deadline)
+    degraded_stages: List[str]  # Stages skipped or cut short to meet the deadline
 
+@traced_node("classify")
+@with_deadline
 def classify_question(state: GraphState):
     """Classify the question type"""
     print("---NODE: CLASSIFY QUESTION---")
     question = state["question"]
+    plan = analyze_query(question)
     
     # Check for user choice (disambiguation)
     user_choice = state.get("user_choice", "")
-    if user_choice in ["calamity", "gem", "general"]:
+    if user_choice in chatbot_service.domains:
         question_type = user_choice
         print(f"---CLASSIFICATION: User chose '{question_type}'---")
     else:
-        question_type = chatbot_service.classify_question_type(question)
+        question_type = chatbot_service.classify_question_type(question, plan)
         print(f"---CLASSIFICATION: Auto-detected '{question_type}'---")
     
-    return {"question_type": question_type}
+    return {"question_type": question_type, "query_plan": plan}
 
+def _history_aware_retrieve(history_aware_retriever, retriever, question, chat_history):
+    """History-aware retrieval; uses the raw question while the rewrite model is unavailable
+    or the deadline leaves no time for rewriting"""
+    if not can_afford():
+        mark_degraded("rewrite")
+        return retriever.invoke(question)
+    try:
+        return history_aware_retriever.invoke({"input": question, "chat_history": chat_history})
+    except UNAVAILABLE_ERRORS as e:
+        print(f"---REWRITE UNAVAILABLE ({e}): Retrieving with the original question---")
+        return retriever.invoke(question)
+
+@traced_node("retrieve")
+@with_deadline
 def retrieve_documents(state: GraphState):
     """Retrieve documents based on question type"""
     print("---NODE: RETRIEVE DOCUMENTS---")
-    question = state["question"]
-    chat_history = state["chat_history"]
     question_type = state["question_type"]
+    documents = _retrieve_in_budget(question_type, state["question"], state["chat_history"], plan_for(state))
     
+    print(f"---RETRIEVED: {len(documents)} documents---")
+    CHUNKS_RETRIEVED.observe(len(documents), domain=question_type)
+    return {"documents": documents, "scores": scores_of(documents)}
+
+def _retrieve_in_budget(question_type, question, chat_history, plan):
+    """_retrieve_for, or no documents when the request deadline passes first"""
+    try:
+        return _retrieve_for(question_type, question, chat_history, plan)
+    except DeadlineExceeded:
+        mark_degraded("retrieval")
+        return []
+
+def _retrieve_for(question_type, question, chat_history, plan):
+    """Documents for a question from the store of the given domain (shared across a batch)"""
+    cache = batch_cache()
+    if cache is None or chat_history:
+        return _retrieve_from_store(question_type, question, chat_history, plan)
+    return cache.retrieval(
+        (question_type, _normalize_question(question)),
+        lambda: _retrieve_from_store(question_type, question, chat_history, plan),
+    )
+
+def _retrieve_from_store(question_type, question, chat_history, plan):
     documents = []
+    spec = chatbot_service.domains.get(question_type)
+    retriever, history_aware_retriever = chatbot_service.retrievers_for(question_type)
     
-    if question_type == "calamity" and chatbot_service.calamity_history_aware_retriever:
-        print("---RETRIEVING: Calamity mod documents---")
-        documents = chatbot_service.calamity_history_aware_retriever.invoke(
-            {"input": question, "chat_history": chat_history}
-        )
-    elif question_type == "gem" and chatbot_service.gem_history_aware_retriever:
+    if spec is None or history_aware_retriever is None:
+        print(f"---RETRIEVING: No documents for type '{question_type}'---")
+    elif spec.retrieval != GEM:
+        print(f"---RETRIEVING: {spec.title} documents---")
+        documents = _history_aware_retrieve(history_aware_retriever, retriever, question, chat_history)
+    else:
         print("---RETRIEVING: GeM procurement documents---")
         
         # Use hybrid extraction for specific document queries
-        import re
-        doc_match = re.search(r'\b(\d{7})\b', question)
-        if doc_match:
-            doc_number = doc_match.group(1)
+        if plan.doc_number:
+            doc_number = plan.doc_number
             print(f"---USING: Hybrid extraction for document {doc_number}---")
             documents = chatbot_service.hybrid_gem_extraction(question, doc_number)
             
@@ -67,27 +145,98 @@ def retrieve_documents(state: GraphState):
                 print(f"---HYBRID EXTRACTION SUCCESS: {len(documents)} results---")
             else:
                 print("---HYBRID FAILED: Falling back to smart search---")
-                documents = chatbot_service.smart_gem_search(question)
+                documents = chatbot_service.smart_gem_search(question, plan=plan)
         else:
             # Check for multi-document queries first
-            multi_doc_indicators = ['all documents', 'each document', 'all pdf', 'each pdf', 'for all', 'systematic manner', 'compare', 'list all']
-            is_multi_doc = any(indicator in question.lower() for indicator in multi_doc_indicators)
-            
-            if is_multi_doc:
+            if plan.is_multi_doc:
                 print("---MULTI-DOC QUERY DETECTED: Using smart search across all PDFs---")
-                documents = chatbot_service.smart_gem_search(question, k=50)
+                documents = chatbot_service.smart_gem_search(question, k=50, plan=plan)
             else:
                 # Use regular history-aware retrieval for single queries
-                documents = chatbot_service.gem_history_aware_retriever.invoke(
-                    {"input": question, "chat_history": chat_history}
-                )
+                # (small-to-big neighbours are added after grading, around the hits that pass)
+                documents = _history_aware_retrieve(history_aware_retriever, retriever, question, chat_history)
                 print(f"---REGULAR SEARCH RETURNED: {len(documents)} documents---")
-    else:
-        print(f"---RETRIEVING: No documents for type '{question_type}'---")
+    
+    return documents
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def _record_wasted(future):
+    """Done-callback for a speculative retrieval whose domain was not chosen"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    SPECULATION_WASTED_SECONDS.observe(future.result()[1])
+
+@traced_node("classify_and_retrieve")
+@with_deadline
+def classify_and_retrieve(state: GraphState):
+    """Classify while retrieving from both stores; keep the branch that matches"""
+    print("---NODE: CLASSIFY AND RETRIEVE (speculative)---")
+    question = state["question"]
+    chat_history = state["chat_history"]
+    plan = analyze_query(question)
+    
+    user_choice = state.get("user_choice", "")
+    if user_choice in chatbot_service.domains:
+        print(f"---CLASSIFICATION: User chose '{user_choice}'---")
+        documents = _retrieve_in_budget(user_choice, question, chat_history, plan)
+        CHUNKS_RETRIEVED.observe(len(documents), domain=user_choice)
+        return {
+            "question_type": user_choice, "query_plan": plan,
+            "documents": documents, "scores": scores_of(documents),
+        }
+    
+    # Only domains already in memory - speculation must not pull in cold stores
+    start = time.perf_counter()
+    futures = {
+        domain: _speculation_executor.submit(
+            contextvars.copy_context().run, _timed, _retrieve_for, domain, question, chat_history, plan
+        )
+        for domain in chatbot_service.loaded_domains()
+    }
+    
+    with span("stage", "classify"):
+        classify_start = time.perf_counter()
+        question_type = chatbot_service.classify_question_type(question, plan)
+        classify_seconds = time.perf_counter() - classify_start
+    print(f"---CLASSIFICATION: Auto-detected '{question_type}'---")
+    
+    for domain, future in futures.items():
+        if domain == question_type:
+            continue
+        if future.cancel():
+            SPECULATIVE_RETRIEVALS.inc(outcome="cancelled")
+        else:
+            SPECULATIVE_RETRIEVALS.inc(outcome="wasted")
+            future.add_done_callback(_record_wasted)
+    
+    documents = []
+    if question_type not in futures and question_type in chatbot_service.domains:
+        documents = _retrieve_in_budget(question_type, question, chat_history, plan)
+    elif question_type in futures:
+        SPECULATIVE_RETRIEVALS.inc(outcome="used")
+        try:
+            left = remaining()
+            documents, retrieve_seconds = futures[question_type].result(timeout=None if left is None else max(0.0, left))
+        except (DeadlineExceeded, FutureTimeoutError):
+            mark_degraded("retrieval")
+            documents, retrieve_seconds = [], 0.0
+        # What classify -> retrieve in sequence would have cost, minus what this took
+        saved = classify_seconds + retrieve_seconds - (time.perf_counter() - start)
+        SPECULATION_SAVED_SECONDS.observe(max(0.0, saved))
     
     print(f"---RETRIEVED: {len(documents)} documents---")
-    return {"documents": documents}
+    CHUNKS_RETRIEVED.observe(len(documents), domain=question_type)
+    return {
+        "question_type": question_type, "query_plan": plan,
+        "documents": documents, "scores": scores_of(documents),
+    }
 
+@traced_node("grade_documents")
+@with_deadline
 def grade_documents(state: GraphState):
     """Grade document relevance based on question type"""
     print("---NODE: GRADE DOCUMENTS---")
@@ -98,62 +247,165 @@ def grade_documents(state: GraphState):
     if not documents:
         return {"documents": []}
     
+    plan = plan_for(state)
+    
     # Skip grading for document-specific searches and multi-document queries
-    import re
-    if re.search(r'\b\d{7}\b', question):  # If question contains document number
+    if plan.doc_numbers:  # If question contains document number
         print("---GRADE: Skipping grading for document-specific search - using all retrieved docs---")
         return {"documents": documents}
     
+    # Summary records already cover exactly one bid each
+    if all(is_summary(doc) for doc in documents):
+        print("---GRADE: Skipping grading for bid summaries---")
+        return {"documents": documents}
+    
     # Skip grading for multi-document queries to preserve all documents
-    multi_doc_indicators = ['all documents', 'each document', 'all pdf', 'each pdf', 'for all', 'systematic manner']
-    if any(indicator in question.lower() for indicator in multi_doc_indicators):
+    if plan.is_multi_doc:
         print("---GRADE: Skipping grading for multi-document query - using all retrieved docs---")
         return {"documents": documents}
     
-    # Different grading prompts for different types
-    if question_type == "calamity":
-        grading_prompt = (
-            "You are a grader assessing if a document is relevant to a Terraria Calamity mod question. "
-            "A document is relevant if it contains specific information about Calamity mod content "
-            "(weapons, bosses, items, mechanics, etc.). "
-            "Give a binary JSON output with 'is_relevant': 'yes' or 'no'."
-        )
-    elif question_type == "gem":
-        grading_prompt = (
-            "You are a grader assessing if a document is relevant to a GeM procurement question. "
-            "A document is relevant if it contains information about government bidding, procurement processes, "
-            "requirements, or procedures. "
-            "Give a binary JSON output with 'is_relevant': 'yes' or 'no'."
-        )
-    else:
-        # For general questions, be more lenient
-        return {"documents": documents[:3]}
+    spec = chatbot_service.domains.get(question_type)
+    scores = state.get("scores") or scores_of(documents)
+    graded = _grade_hits(question, question_type, spec, documents, scores)
+    
+    # Small-to-big: neighbours are fetched only around the hits that passed grading
+    if (graded["documents"] and spec is not None and spec.retrieval == GEM
+            and chatbot_service.gem_processor.retrieval_mode == "small_to_big"):
+        expanded = chatbot_service.gem_processor.expand_neighbours(graded["documents"])
+        graded = {"documents": expanded, "scores": scores_of(expanded)}
+    return graded
+
+def _grade_hits(question, question_type, spec, documents, scores):
+    """Top retrieved documents that are relevant to the question"""
+    # Each domain brings its own grading prompt; domains without one keep the top documents
+    grading_prompt = spec.grading_prompt if spec else None
+    if not grading_prompt:
+        return {"documents": documents[:3], "scores": scores[:3]}
+    
+    # No time for the LLM grader - keep whatever the score gate doesn't reject
+    if not can_afford():
+        mark_degraded("grading")
+        kept = [(doc, score) for doc, score in zip(documents[:3], scores[:3]) if score_gate(doc, score) != "reject"]
+        return {"documents": [doc for doc, _ in kept], "scores": [score for _, score in kept]}
     
     prompt = ChatPromptTemplate.from_template(
         f"{grading_prompt}\nDocument: {{document_content}}\nUser Question: {{question}}"
     )
-    grader_chain = prompt | chatbot_service.llm | JsonOutputParser()
-    
+    grader_chain = prompt | chatbot_service.llm_for("grade") | JsonOutputParser()
     relevant_docs = []
+    relevant_scores = []
     relevant_count = 0
     
-    # Check top 3 documents for relevance
+    # Check top 3 documents for relevance - the score decides clear cases, the LLM the rest
     for i, doc in enumerate(documents[:3]):
+        score = scores[i] if i < len(scores) else None
+        decision = score_gate(doc, score)
+        if decision == "reject":
+            continue
+        if decision == "accept":
+            relevant_docs.append(doc)
+            relevant_scores.append(score)
+            relevant_count += 1
+            continue
         try:
-            result = grader_chain.invoke({
-                "question": question, 
-                "document_content": doc.page_content[:1000]
-            })
-            if result.get("is_relevant") == "yes":
+            verdict = _grade(grader_chain, question, question_type, doc, score)
+            if verdict == "yes":
                 relevant_docs.append(doc)
+                relevant_scores.append(score)
                 relevant_count += 1
+        except UNAVAILABLE_ERRORS as e:
+            print(f"---GRADER UNAVAILABLE ({e}): Using retrieved docs ungraded---")
+            if isinstance(e, DeadlineExceeded):
+                mark_degraded("grading")
+            return {"documents": documents[:3], "scores": scores[:3]}
         except Exception as e:
             print(f"---ERROR IN GRADER for doc {i}: {e}---")
     
     print(f"---GRADE: {relevant_count} out of {min(3, len(documents))} documents are relevant---")
-    return {"documents": relevant_docs if relevant_count > 0 else []}
+    if relevant_count == 0:
+        return {"documents": [], "scores": []}
+    return {"documents": relevant_docs, "scores": relevant_scores}
+
+def _grade(grader_chain, question, question_type, doc, score):
+    """LLM grader verdict for one chunk (each question/chunk pair graded once per batch)"""
+    def ask():
+        result = grader_chain.invoke({
+            "question": question, 
+            "document_content": doc.page_content[:1000]
+        })
+        verdict = result.get("is_relevant")
+        if score is not None:
+            log_verdict(doc, score, verdict, question_type)
+        return verdict
+
+    cache = batch_cache()
+    if cache is None:
+        return ask()
+    return cache.grade((question_type, _normalize_question(question), doc.page_content), ask)
+
+def _normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+def _remember_answer(question_type, question, answer):
+    key = (question_type, _normalize_question(question))
+    with _recent_answers_lock:
+        _recent_answers[key] = answer
+        _recent_answers.move_to_end(key)
+        if len(_recent_answers) > RECENT_ANSWERS_SIZE:
+            _recent_answers.popitem(last=False)
 
+def _degraded_answer(state: GraphState):
+    """Best answer available without the LLM: cached answer, structured field, or retrieved passages"""
+    question = state["question"]
+    question_type = state["question_type"]
+    documents = state.get("documents") or []
+
+    with _recent_answers_lock:
+        cached = _recent_answers.get((question_type, _normalize_question(question)))
+    if cached:
+        DEGRADED_ANSWERS.inc(domain=question_type, reason="cached")
+        return cached
+
+    spec = chatbot_service.domains.get(question_type)
+    doc_number = plan_for(state).doc_number
+    if spec is not None and spec.retrieval == GEM and doc_number and documents and chatbot_service.gem_processor:
+        full_text = "\n".join(doc.page_content for doc in documents)
+        extracted = chatbot_service.gem_processor.extract_structured_field(question, full_text, doc_number)
+        if extracted:
+            DEGRADED_ANSWERS.inc(domain=question_type, reason="structured")
+            return extracted[0].page_content
+
+    if documents:
+        DEGRADED_ANSWERS.inc(domain=question_type, reason="snippets")
+        passages = []
+        for doc in documents[:3]:
+            source = doc.metadata.get('source', 'unknown')
+            passages.append(f"**{source}**: {doc.page_content[:300].strip()}...")
+        return (
+            "I can't generate a full answer right now. The most relevant passages I found are:\n\n"
+            + "\n\n".join(passages)
+        )
+
+    DEGRADED_ANSWERS.inc(domain=question_type, reason="unavailable")
+    return "I'm experiencing technical difficulties. Please try again in a moment."
+
+@traced_node("generate_answer")
+@with_deadline
 def generate_answer(state: GraphState):
+    """Generate the answer, degrading gracefully while the LLM is unavailable"""
+    try:
+        result = _generate_answer(state)
+    except UNAVAILABLE_ERRORS as e:
+        print(f"---GENERATION UNAVAILABLE ({e}): Serving degraded answer---")
+        if isinstance(e, DeadlineExceeded):
+            mark_degraded("generation")
+        question_type = state["question_type"]
+        return {"answer": _degraded_answer(state), "generation_source": question_type, "question_type": question_type}
+
+    _remember_answer(state["question_type"], state["question"], result["answer"])
+    return result
+
+def _generate_answer(state: GraphState):
     """Generate answer using specialized chains"""
     print("---NODE: GENERATE ANSWER---")
     question = state["question"]
@@ -161,16 +413,18 @@ def generate_answer(state: GraphState):
     documents = state["documents"]
     question_type = state["question_type"]
     
-    if question_type == "calamity":
-        print("---GENERATING: Calamity mod answer---")
-        answer = chatbot_service.calamity_chain.invoke({
+    spec = chatbot_service.domains.get(question_type)
+    
+    if spec and spec.retrieval != GEM and spec.answer_prompt:
+        print(f"---GENERATING: {spec.title} answer---")
+        answer = chatbot_service.answer_chain(question_type).invoke({
             "input": question, 
             "chat_history": chat_history, 
             "context": documents
         })
-        return {"answer": answer, "generation_source": "calamity", "question_type": question_type}
+        return {"answer": answer, "generation_source": question_type, "question_type": question_type}
     
-    elif question_type == "gem":
+    elif spec and spec.retrieval == GEM:
         print("---GENERATING: GeM procurement answer---")
         
         # Debug: Show what documents we're using
@@ -181,7 +435,7 @@ def generate_answer(state: GraphState):
             if documents and documents[0].metadata.get('extraction_type') == 'structured':
                 print("---DEBUG: Using structured extraction result---")
                 # Return the pre-formatted response directly
-                return {"answer": documents[0].page_content, "generation_source": "gem", "question_type": question_type}
+                return {"answer": documents[0].page_content, "generation_source": question_type, "question_type": question_type}
             
             for i, doc in enumerate(documents[:2]):
                 source = doc.metadata.get('source', 'unknown')
@@ -193,9 +447,10 @@ def generate_answer(state: GraphState):
         answer = chatbot_service.gem_chain.invoke({
             "input": question, 
             "chat_history": chat_history, 
-            "context": documents
+            "context": documents,
+            "query_plan": plan_for(state)
         })
-        return {"answer": answer, "generation_source": "gem", "question_type": question_type}
+        return {"answer": answer, "generation_source": question_type, "question_type": question_type}
     
     else:
         print("---GENERATING: General answer---")
@@ -205,16 +460,18 @@ def generate_answer(state: GraphState):
         })
         return {"answer": general_response.content, "generation_source": "general", "question_type": question_type}
 
+@traced_node("generate_disambiguation")
+@with_deadline
 def generate_disambiguation(state: GraphState):
     """Generate disambiguation when question type is unclear"""
     print("---NODE: GENERATE DISAMBIGUATION---")
     
+    domains = list(chatbot_service.domains)
+    choices = [f"'{spec.name}'" for spec in domains]
     disambiguation_text = (
         "I can help you with different types of questions:\n\n"
-        "**Calamity** - For Terraria Calamity mod questions (weapons, bosses, items)\n"
-        "**GeM** - For Government procurement and bidding questions\n"
-        "**General** - For general knowledge questions\n\n"
-        "Which topic is your question about? Please type 'calamity', 'gem', or 'general'."
+        + "".join(f"**{spec.title}** - {spec.description}\n" for spec in domains)
+        + f"\nWhich topic is your question about? Please type {', '.join(choices[:-1])}, or {choices[-1]}."
     )
     
     return {"answer": disambiguation_text, "generation_source": "disambiguation"}
@@ -226,18 +483,20 @@ def decide_path(state: GraphState):
     question_type = state["question_type"]
     documents = state.get("documents", [])
     
+    spec = chatbot_service.domains.get(question_type)
+    
     # If we have a clear question type and relevant documents, generate answer
-    if question_type in ["calamity", "gem"] and documents:
+    if spec and spec.has_store and documents:
         print(f"---DECISION: Routing to {question_type} generation---")
         return "generate_answer"
     
     # If we have a clear question type but no documents, still try
-    elif question_type in ["calamity", "gem"]:
+    elif spec and spec.has_store:
         print(f"---DECISION: No relevant docs, but routing to {question_type} generation---")
         return "generate_answer"
     
-    # If question type is general, generate general answer
-    elif question_type == "general":
+    # Domains without a store get a general answer
+    elif spec:
         print("---DECISION: Routing to general generation---")
         return "generate_answer"
     
@@ -246,23 +505,34 @@ def decide_path(state: GraphState):
         print("---DECISION: Routing to disambiguation---")
         return "generate_disambiguation"
 
-def create_graph(checkpointer):
-    """Create the enhanced chatbot graph"""
+def create_graph(checkpointer, speculative=None):
+    """Create the enhanced chatbot graph
+
+    With speculative=True (default: CHATBOT_SPECULATIVE_RETRIEVAL) classification
+    and retrieval from both stores run concurrently in one node.
+    """
+    if speculative is None:
+        speculative = SPECULATIVE_RETRIEVAL
     workflow = StateGraph(GraphState)
 
     # Add nodes
-    workflow.add_node("classify", classify_question)
-    workflow.add_node("retrieve", retrieve_documents)
+    if speculative:
+        workflow.add_node("classify_and_retrieve", classify_and_retrieve)
+    else:
+        workflow.add_node("classify", classify_question)
+        workflow.add_node("retrieve", retrieve_documents)
     workflow.add_node("grade_documents", grade_documents)
     workflow.add_node("generate_answer", generate_answer)
     workflow.add_node("generate_disambiguation", generate_disambiguation)
 
-    # Set entry point
-    workflow.set_entry_point("classify")
-    
-    # Add edges
-    workflow.add_edge("classify", "retrieve")
-    workflow.add_edge("retrieve", "grade_documents")
+    # Set entry point and add edges
+    if speculative:
+        workflow.set_entry_point("classify_and_retrieve")
+        workflow.add_edge("classify_and_retrieve", "grade_documents")
+    else:
+        workflow.set_entry_point("classify")
+        workflow.add_edge("classify", "retrieve")
+        workflow.add_edge("retrieve", "grade_documents")
     
     # Conditional edge from grading
     workflow.add_conditional_edges(
@@ -278,4 +548,87 @@ def create_graph(checkpointer):
     workflow.add_edge("generate_answer", END)
     workflow.add_edge("generate_disambiguation", END)
 
-    return workflow.compile(checkpointer=checkpointer)
\ No newline at end of file
+    return workflow.compile(checkpointer=checkpointer)
+
+def _run_key(initial_state):
+    """Normalized question + chosen domain + digest of the chat history"""
+    question = _normalize_question(initial_state["question"])
+    history = "\n".join(f"{m.type}:{m.content}" for m in initial_state.get("chat_history", []))
+    history_digest = hashlib.sha1(history.encode("utf-8")).hexdigest()
+    return (question, initial_state.get("user_choice", ""), history_digest)
+
+def _fast_path_answer(initial_state):
+    """Final state from a local answerer (arithmetic, units, date/time, greetings, help), or None"""
+    if initial_state.get("user_choice"):
+        return None
+    with span("stage", "fast_path"):
+        hit = chatbot_service.fast_path.answer(initial_state["question"])
+    if hit is None:
+        return None
+    answerer, answer = hit
+    print(f"---FAST PATH: Answered by {answerer}---")
+    return {"answer": answer, "generation_source": "fast_path", "question_type": "general", "degraded_stages": []}
+
+def _faq_answer(initial_state):
+    """Final state served from the FAQ index, or None to run the graph
+
+    Follow-ups ("what's its EMD?") depend on the conversation, so only
+    questions without chat history are looked up.
+    """
+    if initial_state.get("user_choice") or initial_state.get("chat_history"):
+        return None
+    try:
+        with span("stage", "faq"):
+            entry = chatbot_service.faq.lookup(initial_state["question"], chatbot_service.embeddings)
+    except Exception as e:
+        print(f"---FAQ LOOKUP FAILED ({e}): Running the graph---")
+        return None
+    if entry is None:
+        return None
+    print(f"---FAQ: Answering from entry {entry['id']} ({entry['votes']} votes)---")
+    return {"answer": entry["answer"], "generation_source": "faq", "question_type": entry["domain"], "degraded_stages": []}
+
+def run_graph(app, initial_state, config, budget=None):
+    """Run the graph to completion and return the final node's state update
+
+    The run gets a fresh deadline (CHATBOT_REQUEST_BUDGET seconds unless
+    `budget` is given) and an empty degraded_stages list, and is served from
+    the index bundle current when it starts. Concurrent runs for the same key
+    are coalesced; only the leader's thread gets a checkpoint written, and
+    the other requests' traces point at the leader's (coalesced_from).
+    Trivial questions and questions matching an FAQ entry are answered
+    without running the graph.
+    """
+    shortcut = _fast_path_answer(initial_state) or _faq_answer(initial_state)
+    if shortcut is not None:
+        return shortcut
+    
+    initial_state = {
+        **initial_state,
+        "deadline": new_deadline() if budget is None else new_deadline(budget),
+        "degraded_stages": [],
+    }
+
+    ran = False
+
+    def execute():
+        nonlocal ran
+        ran = True
+        final_state = None
+        start = time.perf_counter()
+        with chatbot_service.pin_indexes(), deadline_scope(initial_state["deadline"]):
+            for state in app.stream(initial_state, config=config):
+                final_state = state
+        
+        if final_state and isinstance(final_state, dict) and len(final_state) == 1:
+            final_state = list(final_state.values())[0]
+        # Baseline for what fast-path answers save
+        if isinstance(final_state, dict) and final_state.get("generation_source") == "general":
+            chatbot_service.fast_path.observe_graph(time.perf_counter() - start)
+        return final_state, current_trace()
+
+    final_state, leader_trace = _graph_runs.do(_run_key(initial_state), execute)
+    trace = current_trace()
+    if not ran and trace is not None:
+        trace.coalesced_from = leader_trace
+    return final_state
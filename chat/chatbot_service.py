@@ -1,23 +1,81 @@
 """
 Main Chatbot Service - Refactored and Clean
 """
+import contextvars
 import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
 from dotenv import load_dotenv
 from langgraph.checkpoint.sqlite import SqliteSaver
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains import create_history_aware_retriever
 from langchain.chains.combine_documents import create_stuff_documents_chain
 
 from .question_classifier import QuestionClassifier
 from .gem_processor import GemProcessor
+from .docstore import load_vector_store
+from .domains import GEM, STORE_RETRY_SECONDS, DomainRegistry, StoreCache, StoreUnavailable
+from .fast_path import FastPath
+from .faq import FaqIndex
+from .gem_shards import GEM_SHARD_STORE_PATH, ShardedGemStore, has_shards
+from .gem_summaries import GEM_SUMMARY_STORE_PATH
+from .grading import ScoredRetriever
+from .index_versions import IndexWatcher, resolve_store, store_dir
+from .metrics import INDEX_RELOAD_SECONDS, INDEX_RELOADS
+from .model_wrappers import TracedChatModel, TracedEmbeddings
+from .model_config import load_role_configs
+from .rate_limit import RateLimitScheduler, priority
 
 load_dotenv(override=True)
 
-CALAMITY_VECTOR_STORE_PATH = "faiss_index_combined"
-GEM_VECTOR_STORE_PATH = "faiss_gem_index"
+GEM_VECTOR_STORE_PATH = os.getenv("GEM_VECTOR_STORE_PATH", "faiss_gem_index")
+# Check versioned stores for a new CURRENT every N seconds (0 = only on demand)
+INDEX_POLL_SECONDS = float(os.getenv("CHATBOT_INDEX_POLL_SECONDS", "0"))
+INDEX_WARMUP_SEARCHES = int(os.getenv("CHATBOT_INDEX_WARMUP_SEARCHES", "3"))
+# Domains whose stores load at startup instead of on first use, e.g. "gem,calamity"
+PRELOAD_DOMAINS = [name for name in os.getenv("CHATBOT_PRELOAD_DOMAINS", "").split(",") if name.strip()]
+
+# Index bundle a graph run started with, so a reload mid-request doesn't mix versions
+_pinned_indexes = contextvars.ContextVar("pinned_indexes", default=None)
+
+
+class IndexBundle:
+    """Store versions plus the GeM stores and everything wired to them, swapped as one reference on reload
+
+    The GeM part loads on first use. Other domains' stores live in the
+    service's StoreCache, keyed by the version directories recorded here.
+    """
+
+    GEM_FIELDS = (
+        "gem_db", "gem_retriever", "gem_summary_db", "gem_processor", "gem_history_aware_retriever", "gem_chain",
+    )
+
+    def __init__(self, versions, load_gem):
+        self.versions = versions
+        self._load_gem = load_gem
+        self._gem = None
+        self._lock = threading.Lock()
+
+    @property
+    def gem_loaded(self) -> bool:
+        return self._gem is not None
+
+    def gem(self) -> dict:
+        with self._lock:
+            if self._gem is None:
+                self._gem = self._load_gem(self.versions)
+            return self._gem
+
+    def __getattr__(self, name):
+        if name in IndexBundle.GEM_FIELDS:
+            return self.gem()[name]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
 
 class ChatbotService:
     _instance = None
@@ -33,69 +91,282 @@ class ChatbotService:
             return
             
         print("Initializing ChatbotService...")
-        api_key = os.getenv("GOOGLE_API_KEY")
-        
-        if not api_key or api_key == "PASTE_YOUR_NEW_API_KEY_HERE":
-            raise ValueError("Please set a valid GOOGLE_API_KEY in your .env file")
-            
-        self._initialized = True
+        provider = os.getenv("CHATBOT_MODEL_PROVIDER", "google")
+        self.role_configs = load_role_configs()
 
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
-            temperature=0.1,
-            google_api_key=api_key
-        )
+        if provider == "local":
+            self._init_local_models()
+        else:
+            self._init_google_models()
 
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/text-embedding-004",
-            google_api_key=api_key,
-            transport="rest"
-        )
+        # Every LLM/embedding call is timed, counted per role and goes through the quota scheduler
+        self.llm_scheduler = RateLimitScheduler.from_env("llm")
+        self.embedding_scheduler = RateLimitScheduler.from_env("embedding")
+        self.llms = {
+            role: TracedChatModel(model, role, self.role_configs[role], self.llm_scheduler)
+            for role, model in self.llms.items()
+        }
+        self.llm = self.llms["generate"]
+        self.embeddings = TracedEmbeddings(self.embeddings, self.embedding_scheduler)
+
+        self._initialized = True
 
-        # Load vector stores
-        self._load_vector_stores()
+        # Knowledge domains; their stores load on first use
+        self.domains = DomainRegistry.from_env()
+        self.stores = StoreCache(self._load_domain_store)
+        self._answer_chains = {}
+        
+        # Store versions and the GeM pieces (replaced as a whole on reload)
+        self._reload_lock = threading.Lock()
+        self.indexes = self._new_bundle()
+        for name in PRELOAD_DOMAINS:
+            self.retrievers_for(name.strip())
         
         # Initialize processors
-        self.classifier = QuestionClassifier(self.embeddings, self.llm)
-        self.gem_processor = GemProcessor(self.gem_db, self.llm)
+        self.classifier = QuestionClassifier(self.embeddings, self.llm_for("classify"), self.domains)
         
         # Setup chains
-        self.calamity_history_aware_retriever = self._setup_history_aware_retriever(self.calamity_retriever)
-        self.gem_history_aware_retriever = self._setup_history_aware_retriever(self.gem_retriever)
-        
-        self.calamity_chain = self._setup_calamity_chain()
-        self.gem_chain = self.gem_processor.setup_gem_chain()
         self.general_knowledge_chain = self._setup_general_chain()
         
+        # Local answers for trivial questions, and answers to frequent, well-rated ones (manage.py build_faq)
+        self.fast_path = FastPath(self.domains)
+        self.faq = FaqIndex()
+        
+        self.index_watcher = None
+        if INDEX_POLL_SECONDS > 0:
+            self.index_watcher = IndexWatcher(self.store_versions, self.reload_indexes, INDEX_POLL_SECONDS)
+            self.index_watcher.start()
+        
         print("All chains initialized successfully")
         print("ChatbotService initialized successfully.")
 
-    def _load_vector_stores(self):
-        """Load both Calamity and GeM vector stores"""
+    def __getattr__(self, name):
+        # Store-dependent attributes come from the bundle the current request is pinned to
+        if name in IndexBundle.GEM_FIELDS:
+            return getattr(self.active_indexes(), name)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def active_indexes(self) -> IndexBundle:
+        return _pinned_indexes.get() or self.indexes
+
+    @contextmanager
+    def pin_indexes(self):
+        """Serve everything inside the block from the bundle that is current now"""
+        token = _pinned_indexes.set(self.indexes)
         try:
-            calamity_db = FAISS.load_local(
-                CALAMITY_VECTOR_STORE_PATH, 
-                self.embeddings, 
-                allow_dangerous_deserialization=True
+            yield self.indexes
+        finally:
+            _pinned_indexes.reset(token)
+
+    def _init_google_models(self):
+        """Gemini chat models (one per role) and embeddings"""
+        api_key = os.getenv("GOOGLE_API_KEY")
+        
+        if not api_key or api_key == "PASTE_YOUR_NEW_API_KEY_HERE":
+            raise ValueError("Please set a valid GOOGLE_API_KEY in your .env file")
+
+        self.llms = {}
+        for role, config in self.role_configs.items():
+            self.llms[role] = ChatGoogleGenerativeAI(
+                model=config.model,
+                temperature=config.temperature,
+                timeout=config.timeout,
+                max_output_tokens=config.max_output_tokens,
+                google_api_key=api_key
             )
-            self.calamity_retriever = calamity_db.as_retriever(search_kwargs={"k": 5})
-            print("SUCCESS: Calamity mod vector store loaded")
-        except Exception as e:
-            print(f"WARNING: Could not load Calamity vector store: {e}")
-            self.calamity_retriever = None
 
-        try:
-            self.gem_db = FAISS.load_local(
-                GEM_VECTOR_STORE_PATH, 
-                self.embeddings, 
-                allow_dangerous_deserialization=True
+        self.embeddings = GoogleGenerativeAIEmbeddings(
+            model="models/text-embedding-004",
+            google_api_key=api_key,
+            transport="rest"
+        )
+
+    def _init_local_models(self):
+        """Deterministic local stand-ins (CHATBOT_MODEL_PROVIDER=local)"""
+        from .local_models import LocalChatModel, LocalEmbeddings
+
+        print("Using local model stand-ins instead of the Gemini API")
+        self.llms = {}
+        for role in self.role_configs:
+            self.llms[role] = LocalChatModel(
+                latency=float(os.getenv(f"LOCAL_LLM_LATENCY_{role.upper()}", os.getenv("LOCAL_LLM_LATENCY", "0"))),
+                jitter=float(os.getenv("LOCAL_LLM_JITTER", "0"))
             )
-            self.gem_retriever = self.gem_db.as_retriever(search_kwargs={"k": 5})
-            print("SUCCESS: GeM procurement vector store loaded")
+        self.embeddings = LocalEmbeddings(
+            latency=float(os.getenv("LOCAL_EMBEDDING_LATENCY", "0")),
+            jitter=float(os.getenv("LOCAL_EMBEDDING_JITTER", "0"))
+        )
+
+    def store_roots(self) -> list:
+        roots = [spec.store_path for spec in self.domains.with_store()] + [GEM_SHARD_STORE_PATH, GEM_SUMMARY_STORE_PATH]
+        return list(dict.fromkeys(roots))
+
+    def store_versions(self) -> dict:
+        """Version each store path currently points at (None for unversioned stores)"""
+        return {root: resolve_store(root)[1] for root in self.store_roots()}
+
+    def _new_bundle(self, strict: bool = False) -> IndexBundle:
+        return IndexBundle(self.store_versions(), lambda versions: self._load_gem(versions, strict))
+
+    def _load_store(self, root, version):
+        """One version of a store, named after its root so grading thresholds carry over"""
+        db = load_vector_store(store_dir(root, version), self.embeddings)
+        db.store_name = os.path.basename(os.path.normpath(root))
+        return db
+
+    def _load_domain_store(self, domain, directory):
+        """StoreCache loader: (retriever, history-aware retriever) over one store directory"""
+        spec = self.domains.get(domain)
+        db = load_vector_store(directory, self.embeddings)
+        db.store_name = os.path.basename(os.path.normpath(spec.store_path))
+        retriever = ScoredRetriever(vectorstore=db, k=spec.k)
+        return retriever, self._setup_history_aware_retriever(retriever)
+
+    def _load_gem(self, versions, strict: bool = False) -> dict:
+        """Load the GeM stores and wire them up
+
+        With strict=True (reloads) a failing GeM store aborts the load instead
+        of leaving the domain without documents.
+        """
+        gem_db = gem_summary_db = None
+        try:
+            shard_dir = store_dir(GEM_SHARD_STORE_PATH, versions.get(GEM_SHARD_STORE_PATH))
+            if has_shards(shard_dir):
+                gem_db = ShardedGemStore(shard_dir, self.embeddings)
+                gem_db.store_name = os.path.basename(os.path.normpath(GEM_SHARD_STORE_PATH))
+                print(f"SUCCESS: GeM procurement store loaded ({len(gem_db.manifest['shards'])} shards by {gem_db.key})")
+            else:
+                gem_db = self._load_store(GEM_VECTOR_STORE_PATH, versions.get(GEM_VECTOR_STORE_PATH))
+                print("SUCCESS: GeM procurement vector store loaded")
         except Exception as e:
+            if strict:
+                raise
             print(f"WARNING: Could not load GeM vector store: {e}")
-            self.gem_retriever = None
-            self.gem_db = None
+        gem_retriever = ScoredRetriever(vectorstore=gem_db, k=5) if gem_db is not None else None
+
+        try:
+            gem_summary_db = self._load_store(GEM_SUMMARY_STORE_PATH, versions.get(GEM_SUMMARY_STORE_PATH))
+            print("SUCCESS: GeM bid summaries loaded")
+        except Exception as e:
+            print(f"INFO: No GeM bid summaries ({e}) - cross-document questions use raw chunks")
+
+        gem_processor = GemProcessor(gem_db, self.llm, gem_summary_db, merge_llm=self.llm_for("summarize"))
+        return {
+            "gem_db": gem_db,
+            "gem_retriever": gem_retriever,
+            "gem_summary_db": gem_summary_db,
+            "gem_processor": gem_processor,
+            "gem_history_aware_retriever": self._setup_history_aware_retriever(gem_retriever),
+            "gem_chain": gem_processor.setup_gem_chain(),
+        }
+
+    def retrievers_for(self, domain: str, bundle: IndexBundle = None):
+        """(retriever, history-aware retriever) for a domain, loading its store if needed"""
+        spec = self.domains.get(domain)
+        if spec is None or not spec.has_store:
+            return None, None
+        bundle = bundle or self.active_indexes()
+        if spec.retrieval == GEM:
+            return bundle.gem_retriever, bundle.gem_history_aware_retriever
+        try:
+            return self.stores.get(domain, store_dir(spec.store_path, bundle.versions.get(spec.store_path)))
+        except StoreUnavailable:
+            return None, None
+        except Exception as e:
+            print(f"WARNING: Could not load {spec.title} vector store (retrying in {STORE_RETRY_SECONDS:.0f}s): {e}")
+            return None, None
+
+    def loaded_domains(self) -> list:
+        """Domains whose stores are in memory right now (no load triggered)"""
+        loaded = set(self.stores.loaded().values())
+        if self.active_indexes().gem_loaded:
+            loaded.update(spec.name for spec in self.domains.with_store() if spec.retrieval == GEM)
+        return [spec.name for spec in self.domains.with_store() if spec.name in loaded]
+
+    def answer_chain(self, domain: str):
+        """Stuff-documents chain answering from a domain's retrieved context"""
+        chain = self._answer_chains.get(domain)
+        if chain is None:
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", self.domains.get(domain).answer_prompt),
+                MessagesPlaceholder("chat_history"),
+                ("human", "{input}"),
+            ])
+            chain = self._answer_chains[domain] = create_stuff_documents_chain(self.llm, prompt)
+        return chain
+
+    def _load_new_versions(self, bundle: IndexBundle) -> dict:
+        """Load the bundle's versions of the domain stores in memory now, raising on any failure
+
+        Returns {directory: (domain, (retriever, history-aware retriever))} for
+        the stores not loaded yet; nothing enters the store cache before the swap.
+        """
+        loaded = self.stores.loaded()
+        new_stores = {}
+        for domain in self.loaded_domains():
+            spec = self.domains.get(domain)
+            if spec.retrieval == GEM:
+                continue
+            directory = store_dir(spec.store_path, bundle.versions.get(spec.store_path))
+            if directory not in loaded:
+                new_stores[directory] = (domain, self._load_domain_store(domain, directory))
+        return new_stores
+
+    def _warm(self, bundle: IndexBundle, new_stores: dict):
+        """Page in index files and fill docstore caches before the bundle takes traffic
+
+        Searches use random vectors, so warming costs no embedding calls. Sharded
+        stores stay lazy.
+        """
+        stores = []
+        if self.indexes.gem_loaded:
+            stores += [bundle.gem_db, bundle.gem_summary_db]
+        stores += [retriever.vectorstore for _, (retriever, _) in new_stores.values()]
+
+        rng = np.random.default_rng(0)
+        for store in stores:
+            if store is None or not hasattr(store, "similarity_search_with_score_by_vector"):
+                continue
+            for _ in range(INDEX_WARMUP_SEARCHES):
+                store.similarity_search_with_score_by_vector(rng.standard_normal(store.index.d).tolist(), k=5)
+
+    def reload_indexes(self, force: bool = False):
+        """Load the stores' current versions, warm them and swap them in
+
+        Requests already running finish on the bundle they pinned. Returns the
+        new versions, or None if nothing changed or a reload is already running.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return None
+        try:
+            versions = self.store_versions()
+            if versions == self.indexes.versions and not force:
+                return None
+            print(f"Reloading vector stores: {versions}")
+            start = time.perf_counter()
+            try:
+                with priority("batch"):
+                    bundle = self._new_bundle(strict=True)
+                    if self.indexes.gem_loaded:
+                        bundle.gem()
+                    # Every store in memory must load in its new version, or the old ones stay
+                    new_stores = self._load_new_versions(bundle)
+                    self._warm(bundle, new_stores)
+            except Exception:
+                INDEX_RELOADS.inc(outcome="failed")
+                raise
+            self.indexes = bundle
+            self.stores.retain({
+                store_dir(spec.store_path, bundle.versions.get(spec.store_path)) for spec in self.domains.with_store()
+            })
+            for directory, (domain, store) in new_stores.items():
+                self.stores.put(domain, directory, store)
+            INDEX_RELOADS.inc(outcome="swapped")
+            INDEX_RELOAD_SECONDS.observe(time.perf_counter() - start)
+            print(f"Vector stores swapped in after {time.perf_counter() - start:.2f}s")
+            return bundle.versions
+        finally:
+            self._reload_lock.release()
 
     def _setup_history_aware_retriever(self, retriever):
         """Setup history-aware retriever for any vector store"""
@@ -107,25 +378,7 @@ class ChatbotService:
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ])
-        return create_history_aware_retriever(self.llm, retriever, contextualize_q_prompt)
-
-    def _setup_calamity_chain(self):
-        """Setup Calamity mod QA chain"""
-        system_prompt = (
-            "You are a Terraria Calamity mod expert assistant. "
-            "CRITICAL RULES:\n"
-            "1. Answer ONLY using information from the provided context\n"
-            "2. If the context doesn't contain enough information, say 'I don't have enough information about that in my knowledge base'\n"
-            "3. Focus specifically on Calamity mod content (weapons, bosses, items, mechanics)\n"
-            "4. Be precise and factual - no speculation or general Terraria advice\n\n"
-            "Context:\n{context}"
-        )
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}"),
-        ])
-        return create_stuff_documents_chain(self.llm, prompt)
+        return create_history_aware_retriever(self.llm_for("rewrite"), retriever, contextualize_q_prompt)
 
     def _setup_general_chain(self):
         """Setup general knowledge chain"""
@@ -136,13 +389,17 @@ class ChatbotService:
         ])
         return prompt | self.llm
 
-    def classify_question_type(self, question: str) -> str:
+    def llm_for(self, role: str):
+        """Chat model configured for a role (rewrite, grade, classify, generate, summarize)"""
+        return self.llms[role]
+
+    def classify_question_type(self, question: str, plan=None) -> str:
         """Classify question type using the classifier"""
-        return self.classifier.classify_question_type(question)
+        return self.classifier.classify_question_type(question, plan)
     
-    def smart_gem_search(self, question: str, k: int = 8):
+    def smart_gem_search(self, question: str, k: int = 8, plan=None):
         """Smart GeM search using the processor"""
-        return self.gem_processor.smart_gem_search(question, k)
+        return self.gem_processor.smart_gem_search(question, k, plan)
     
     def hybrid_gem_extraction(self, question: str, doc_number: str):
         """Hybrid extraction using the processor"""
@@ -0,0 +1,141 @@
+"""
+Context Packing
+Turns retrieved chunks into a compact prompt context: adjacent chunks of the
+same source are merged with their split overlap removed, boilerplate lines
+repeated across chunks are dropped, and blocks are added in relevance order
+until the token budget is spent.
+"""
+import os
+import re
+
+from .metrics import CONTEXT_TOKENS
+
+GEM_CONTEXT_TOKEN_BUDGET = int(os.getenv("GEM_CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Chunks are split with chunk_overlap=100, but the splitter cuts on separators
+# so the repeated span can be a little longer
+MAX_OVERLAP_CHARS = 400
+# Lines shorter than this are table cells and labels, not boilerplate
+MIN_BOILERPLATE_CHARS = 40
+# Don't bother with a truncated block smaller than this
+MIN_BLOCK_TOKENS = 50
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) - no tokenizer needed"""
+    return (len(text) + 3) // 4
+
+
+def _chunk_id(doc):
+    try:
+        return int(doc.metadata.get("chunk_id"))
+    except (TypeError, ValueError):
+        return None
+
+
+def strip_overlap(previous: str, following: str) -> str:
+    """Remove the start of `following` that repeats the end of `previous`"""
+    limit = min(len(previous), len(following), MAX_OVERLAP_CHARS)
+    for size in range(limit, 0, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"\W+", " ", line).strip().lower()
+
+
+class ContextBlock:
+    """A run of consecutive chunks from one source"""
+
+    def __init__(self, source, rank, chunk_ids, text):
+        self.source = source
+        self.rank = rank
+        self.chunk_ids = chunk_ids
+        self.text = text
+
+
+def merge_adjacent(docs):
+    """Group chunks by source and merge consecutive chunk_ids into blocks.
+    A block's rank is the best (lowest) retrieval rank of its chunks.
+    """
+    by_source = {}
+    loose = []
+    for rank, doc in enumerate(docs):
+        source = doc.metadata.get("source", "Unknown")
+        chunk_id = _chunk_id(doc)
+        if chunk_id is None:
+            loose.append(ContextBlock(source, rank, [], doc.page_content))
+            continue
+        # The same chunk can be retrieved by several searches - keep its best rank
+        chunks = by_source.setdefault(source, {})
+        if chunk_id not in chunks:
+            chunks[chunk_id] = (rank, doc.page_content)
+
+    blocks = loose
+    for source, chunks in by_source.items():
+        current = None
+        for chunk_id in sorted(chunks):
+            rank, text = chunks[chunk_id]
+            if current and current.chunk_ids[-1] == chunk_id - 1:
+                rest = strip_overlap(current.text, text)
+                current.text += rest if len(rest) < len(text) else "\n" + text
+                current.chunk_ids.append(chunk_id)
+                current.rank = min(current.rank, rank)
+            else:
+                current = ContextBlock(source, rank, [chunk_id], text)
+                blocks.append(current)
+
+    return sorted(blocks, key=lambda block: block.rank)
+
+
+def drop_boilerplate(blocks):
+    """Drop long lines already seen in a higher-ranked block (headers, disclaimers)"""
+    seen = set()
+    for block in blocks:
+        kept = []
+        for line in block.text.split("\n"):
+            key = _normalize_line(line)
+            if len(key) >= MIN_BOILERPLATE_CHARS:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        block.text = "\n".join(kept).strip()
+    return [block for block in blocks if block.text]
+
+
+def pack_context(docs, token_budget: int = GEM_CONTEXT_TOKEN_BUDGET, per_source: bool = False) -> str:
+    """Build the prompt context for `docs` (in relevance order) within token_budget
+
+    With per_source=True the budget is split evenly between sources so that
+    multi-document questions keep every document represented.
+    """
+    raw_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+    blocks = drop_boilerplate(merge_adjacent(docs))
+
+    sources = {block.source for block in blocks}
+    source_budget = token_budget // max(1, len(sources)) if per_source else token_budget
+    source_spent = {}
+
+    parts = []
+    remaining = token_budget
+    for block in blocks:
+        header = f"[Source: {block.source}]\n"
+        available = min(remaining, source_budget - source_spent.get(block.source, 0))
+        cost = estimate_tokens(header + block.text)
+        if cost > available:
+            if available - estimate_tokens(header) < MIN_BLOCK_TOKENS:
+                continue
+            block.text = block.text[: (available - estimate_tokens(header)) * 4]
+            cost = estimate_tokens(header + block.text)
+        parts.append(header + block.text)
+        remaining -= cost
+        source_spent[block.source] = source_spent.get(block.source, 0) + cost
+
+    context = "\n\n".join(parts)
+    CONTEXT_TOKENS.observe(raw_tokens, stage="raw")
+    CONTEXT_TOKENS.observe(estimate_tokens(context), stage="packed")
+    print(f"Packed {len(docs)} chunks into {len(parts)} blocks (~{raw_tokens} -> ~{estimate_tokens(context)} tokens)")
+    return context
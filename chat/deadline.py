@@ -0,0 +1,97 @@
+"""
+Request Deadlines
+Every graph run carries an absolute deadline in its state (wall-clock time, so
+it survives the checkpointer). Nodes skip optional stages when little time is
+left, and model, embedding and search calls clamp their timeouts to what
+remains; waits for provider quota, shared in-flight calls and worker
+futures give up when it passes. Skipped stages are listed in the state's degraded_stages.
+"""
+import contextvars
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from .metrics import DEGRADED_STAGES
+
+# Seconds a request may take end to end (0 = no deadline)
+CHATBOT_REQUEST_BUDGET = float(os.getenv("CHATBOT_REQUEST_BUDGET", "30"))
+# Optional stages only run while more than this is left for generation
+CHATBOT_GENERATION_RESERVE = float(os.getenv("CHATBOT_GENERATION_RESERVE", "8"))
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+_degraded = contextvars.ContextVar("degraded_stages", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request has no time left for this call"""
+
+
+def new_deadline(budget: float = CHATBOT_REQUEST_BUDGET):
+    return time.time() + budget if budget > 0 else None
+
+
+@contextmanager
+def deadline_scope(deadline):
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline (None without one)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.time()
+
+
+def check_deadline(what: str = "call"):
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"No time left for {what}")
+
+
+def clamp_timeout(timeout, what: str = "call"):
+    """(timeout, clamped): timeout cut to the time left, and whether the deadline was the limit"""
+    left = remaining()
+    if left is None:
+        return timeout, False
+    if left <= 0:
+        raise DeadlineExceeded(f"No time left for {what}")
+    if timeout is None or left < timeout:
+        return left, True
+    return timeout, False
+
+
+def can_afford(reserve: float = CHATBOT_GENERATION_RESERVE) -> bool:
+    """Whether an optional stage still fits while keeping `reserve` seconds for generation"""
+    left = remaining()
+    return left is None or left > reserve
+
+
+def mark_degraded(stage: str):
+    """Record that the current node skipped or cut short a stage"""
+    stages = _degraded.get()
+    if stages is not None and stage not in stages:
+        stages.append(stage)
+    DEGRADED_STAGES.inc(stage=stage)
+    print(f"---DEADLINE: Skipping {stage} ({remaining() or 0:.1f}s left)---")
+
+
+def with_deadline(node):
+    """Run a graph node under the state's deadline and carry degraded_stages forward"""
+    @functools.wraps(node)
+    def wrapper(state):
+        stages = []
+        token = _degraded.set(stages)
+        try:
+            with deadline_scope(state.get("deadline")):
+                result = node(state)
+        finally:
+            _degraded.reset(token)
+        if isinstance(result, dict):
+            previous = state.get("degraded_stages") or []
+            result["degraded_stages"] = previous + [stage for stage in stages if stage not in previous]
+        return result
+    return wrapper
@@ -0,0 +1,289 @@
+"""
+Disk-backed Docstore for FAISS Vector Stores
+Keeps chunk text and metadata in SQLite and fetches it by id on demand
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+
+import faiss
+from langchain.schema import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+
+from .deadline import check_deadline
+from .metrics import record_cache, span
+from .near_duplicates import chunk_refs
+
+DOCSTORE_FILENAME = "docstore.sqlite"
+DOCSTORE_CACHE_SIZE = int(os.getenv("DOCSTORE_CACHE_SIZE", "256"))
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore backed by a SQLite file with a small LRU in front of it"""
+
+    def __init__(self, db_path: str, cache_size: int = DOCSTORE_CACHE_SIZE):
+        self.db_path = str(db_path)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS positions (
+                position INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                source TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                doc_id TEXT NOT NULL,
+                PRIMARY KEY (source, chunk_id)
+            );
+            """
+        )
+        self._conn.commit()
+        self._backfill_chunks()
+
+    @staticmethod
+    def _chunk_rows(doc_id, metadata):
+        """(source, chunk_id, doc_id) for every position the chunk stands for"""
+        return [(source, int(chunk_id), doc_id) for source, chunk_id in chunk_refs(metadata) if chunk_id is not None]
+
+    def _backfill_chunks(self):
+        """Index (source, chunk_id) for docstores written before the chunks table existed"""
+        with self._lock:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+                return
+            rows = self._conn.execute("SELECT doc_id, metadata FROM documents").fetchall()
+            chunk_rows = [row for doc_id, metadata in rows for row in self._chunk_rows(doc_id, json.loads(metadata))]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (source, chunk_id, doc_id) VALUES (?, ?, ?)", chunk_rows
+            )
+            self._conn.execute("PRAGMA user_version = 1")
+            self._conn.commit()
+
+    def search(self, search: str):
+        """Return the Document stored under an id, or a not-found message"""
+        with self._lock:
+            if search in self._cache:
+                self._cache.move_to_end(search)
+                record_cache("docstore", hit=True)
+                return self._cache[search]
+            record_cache("docstore", hit=False)
+
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM documents WHERE doc_id = ?", (search,)
+            ).fetchone()
+            if row is None:
+                return f"ID {search} not found."
+
+            doc = Document(page_content=row[0], metadata=json.loads(row[1]))
+            self._cache[search] = doc
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return doc
+
+    def add(self, texts):
+        """Add documents keyed by id"""
+        rows = [
+            (doc_id, doc.page_content, json.dumps(doc.metadata))
+            for doc_id, doc in texts.items()
+        ]
+        chunk_rows = [row for doc_id, doc in texts.items() for row in self._chunk_rows(doc_id, doc.metadata)]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (doc_id, page_content, metadata) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (source, chunk_id, doc_id) VALUES (?, ?, ?)", chunk_rows
+            )
+            self._conn.commit()
+            for doc_id in texts:
+                self._cache.pop(doc_id, None)
+
+    def delete(self, ids):
+        """Delete documents by id"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(i,) for i in ids])
+            self._conn.executemany("DELETE FROM chunks WHERE doc_id = ?", [(i,) for i in ids])
+            self._conn.commit()
+            for doc_id in ids:
+                self._cache.pop(doc_id, None)
+
+    def get_chunks(self, source: str, chunk_ids):
+        """Documents for the given chunk_ids of one source, in chunk order"""
+        chunk_ids = sorted(set(int(i) for i in chunk_ids))
+        if not chunk_ids:
+            return []
+        placeholders = ",".join("?" * len(chunk_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id FROM chunks WHERE source = ? AND chunk_id IN ({placeholders}) ORDER BY chunk_id",
+                [source, *chunk_ids],
+            ).fetchall()
+        docs = [self.search(row[0]) for row in rows]
+        return [doc for doc in docs if isinstance(doc, Document)]
+
+    def iter_documents(self):
+        """Every stored Document (bypasses the cache)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT page_content, metadata FROM documents").fetchall()
+        return [Document(page_content=row[0], metadata=json.loads(row[1])) for row in rows]
+
+    def id_for_position(self, position: int):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id FROM positions WHERE position = ?", (int(position),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_positions(self, mapping):
+        """Store FAISS row position -> docstore id pairs"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO positions (position, doc_id) VALUES (?, ?)",
+                [(int(position), doc_id) for position, doc_id in mapping.items()],
+            )
+            self._conn.commit()
+
+    def delete_position(self, position: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM positions WHERE position = ?", (int(position),))
+            self._conn.commit()
+
+    def iter_positions(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT position FROM positions ORDER BY position").fetchall()
+        return [row[0] for row in rows]
+
+    def count_positions(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SQLiteIndexMapping(MutableMapping):
+    """index_to_docstore_id mapping that reads positions from the docstore file"""
+
+    def __init__(self, docstore: SQLiteDocstore):
+        self.docstore = docstore
+
+    def __getitem__(self, position):
+        doc_id = self.docstore.id_for_position(position)
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __setitem__(self, position, doc_id):
+        self.docstore.set_positions({position: doc_id})
+
+    def __delitem__(self, position):
+        self.docstore.delete_position(position)
+
+    def __iter__(self):
+        return iter(self.docstore.iter_positions())
+
+    def __len__(self):
+        return self.docstore.count_positions()
+
+    def update(self, other=(), **kwargs):
+        self.docstore.set_positions(dict(other, **kwargs))
+
+
+class TracedFAISS(FAISS):
+    """FAISS store that records a span for every index search"""
+
+    store_name = "faiss"
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20, **kwargs):
+        check_deadline("search")
+        with span("search", "faiss_search", store=self.store_name):
+            return super().similarity_search_with_score_by_vector(
+                embedding, k=k, filter=filter, fetch_k=fetch_k, **kwargs
+            )
+
+
+def _read_index(index_path: Path):
+    """Memory-map the FAISS index where the index type allows it"""
+    try:
+        return faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP)
+    except RuntimeError:
+        return faiss.read_index(str(index_path))
+
+
+def load_vector_store(folder_path: str, embeddings, index_name: str = "index") -> FAISS:
+    """Load a FAISS store whose docstore lives in SQLite (no pickle involved)"""
+    path = Path(folder_path)
+    docstore_path = path / DOCSTORE_FILENAME
+
+    if not docstore_path.exists():
+        if (path / f"{index_name}.pkl").exists():
+            raise FileNotFoundError(
+                f"{folder_path} still uses the pickled docstore. "
+                f"Run 'python manage.py migrate_docstore {folder_path}' once to convert it."
+            )
+        raise FileNotFoundError(f"No docstore found at {docstore_path}")
+
+    index = _read_index(path / f"{index_name}.faiss")
+    docstore = SQLiteDocstore(docstore_path)
+    db = TracedFAISS(embeddings, index, docstore, SQLiteIndexMapping(docstore))
+    db.store_name = path.name
+    return db
+
+
+def save_vector_store(db: FAISS, folder_path: str, index_name: str = "index"):
+    """Write a FAISS store as index file plus SQLite docstore"""
+    path = Path(folder_path)
+    path.mkdir(exist_ok=True, parents=True)
+
+    faiss.write_index(db.index, str(path / f"{index_name}.faiss"))
+
+    docstore_path = path / DOCSTORE_FILENAME
+    if isinstance(db.docstore, SQLiteDocstore) and Path(db.docstore.db_path).resolve() == docstore_path.resolve():
+        # Already writing straight into this file
+        return
+
+    if docstore_path.exists():
+        docstore_path.unlink()
+
+    target = SQLiteDocstore(docstore_path)
+    positions = dict(db.index_to_docstore_id.items())
+    target.add({doc_id: db.docstore.search(doc_id) for doc_id in positions.values()})
+    target.set_positions(positions)
+    target.close()
+
+
+def migrate_legacy_store(folder_path: str, index_name: str = "index") -> int:
+    """Convert a pickled docstore (index.pkl) into docstore.sqlite
+
+    Only run this on index files you built yourself - it unpickles them.
+    """
+    path = Path(folder_path)
+    with open(path / f"{index_name}.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    docstore_path = path / DOCSTORE_FILENAME
+    if docstore_path.exists():
+        docstore_path.unlink()
+
+    target = SQLiteDocstore(docstore_path)
+    target.add({doc_id: docstore.search(doc_id) for doc_id in index_to_docstore_id.values()})
+    target.set_positions(index_to_docstore_id)
+    count = target.count_positions()
+    target.close()
+    return count
@@ -0,0 +1,290 @@
+"""
+Domain Registry
+Each knowledge domain declares its vector store, prompts, classifier
+exemplars, routing phrases and retrieval policy. Besides the built-in
+Calamity, GeM and general domains, more can be listed in domains.json:
+
+    [{"name": "hr", "title": "HR", "description": "Leave, payroll and HR policy questions",
+      "store_path": "faiss_hr_policies", "exemplars": "leave policy payroll holidays reimbursement",
+      "keywords": ["leave", "payroll"], "answer_prompt": "You answer HR policy questions... Context:\\n{context}"}]
+
+Stores of "history_aware" domains load on first use and are evicted least
+recently used once their index files exceed CHATBOT_STORE_MEMORY_MB. A store
+that fails to load is not retried for STORE_RETRY_SECONDS.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .metrics import DOMAIN_STORE_BYTES, DOMAIN_STORE_EVICTIONS, DOMAIN_STORE_LOADS
+from .query_analysis import PHRASES, PhraseMatcher
+
+CHATBOT_DOMAINS_PATH = os.getenv("CHATBOT_DOMAINS_PATH", "domains.json")
+# Memory budget for lazily loaded domain stores (0 = never evict)
+CHATBOT_STORE_MEMORY_MB = float(os.getenv("CHATBOT_STORE_MEMORY_MB", "0"))
+# How long a store that failed to load is reported unavailable before the next attempt
+STORE_RETRY_SECONDS = 60.0
+
+# Retrieval policies
+HISTORY_AWARE = "history_aware"  # rewrite with chat history, then similarity search
+GEM = "gem"                      # GemProcessor (hybrid extraction, multi-document search)
+NO_RETRIEVAL = "none"            # answer from the model alone
+
+
+@dataclass(frozen=True)
+class DomainSpec:
+    name: str
+    title: str
+    description: str
+    exemplars: str = ""  # text the question embedding is compared with
+    store_path: Optional[str] = None
+    retrieval: str = HISTORY_AWARE
+    k: int = 5
+    indicators: Tuple[str, ...] = ()  # phrases that route here before semantic classification
+    keywords: Tuple[str, ...] = ()    # phrases that route here when semantic classification is unclear
+    claims_doc_numbers: bool = False  # questions with a bid/document number route here
+    grading_prompt: Optional[str] = None  # None: keep the top documents ungraded
+    answer_prompt: Optional[str] = None   # system prompt with {context}; None: general chain
+
+    @property
+    def has_store(self) -> bool:
+        return self.retrieval != NO_RETRIEVAL and self.store_path is not None
+
+
+# Registry order is routing priority when several domains' phrases match
+BUILTIN_DOMAINS = (
+    DomainSpec(
+        name="gem",
+        title="GeM",
+        description="For Government procurement and bidding questions",
+        exemplars=(
+            "government procurement bidding tender contract ministry defence department supplier vendor purchase "
+            "proposal military equipment services maintenance annual contract GeM marketplace public sector acquisition"
+        ),
+        store_path=os.getenv("GEM_VECTOR_STORE_PATH", "faiss_gem_index"),
+        retrieval=GEM,
+        indicators=tuple(PHRASES["gem_indicator"]),
+        keywords=tuple(PHRASES["gem_keyword"]),
+        claims_doc_numbers=True,
+        grading_prompt=(
+            "You are a grader assessing if a document is relevant to a GeM procurement question. "
+            "A document is relevant if it contains information about government bidding, procurement processes, "
+            "requirements, or procedures. "
+            "Give a binary JSON output with 'is_relevant': 'yes' or 'no'."
+        ),
+    ),
+    DomainSpec(
+        name="calamity",
+        title="Calamity",
+        description="For Terraria Calamity mod questions (weapons, bosses, items)",
+        exemplars=(
+            "terraria calamity mod boss weapon item crafting recipe strategy guide gaming video game yharon "
+            "providence devourer astrum supreme calamitas scal draedon exo mechs"
+        ),
+        store_path=os.getenv("CALAMITY_VECTOR_STORE_PATH", "faiss_index_combined"),
+        keywords=tuple(PHRASES["calamity_keyword"]),
+        grading_prompt=(
+            "You are a grader assessing if a document is relevant to a Terraria Calamity mod question. "
+            "A document is relevant if it contains specific information about Calamity mod content "
+            "(weapons, bosses, items, mechanics, etc.). "
+            "Give a binary JSON output with 'is_relevant': 'yes' or 'no'."
+        ),
+        answer_prompt=(
+            "You are a Terraria Calamity mod expert assistant. "
+            "CRITICAL RULES:\n"
+            "1. Answer ONLY using information from the provided context\n"
+            "2. If the context doesn't contain enough information, say 'I don't have enough information about that in my knowledge base'\n"
+            "3. Focus specifically on Calamity mod content (weapons, bosses, items, mechanics)\n"
+            "4. Be precise and factual - no speculation or general Terraria advice\n\n"
+            "Context:\n{context}"
+        ),
+    ),
+    DomainSpec(
+        name="general",
+        title="General",
+        description="For general knowledge questions",
+        exemplars=(
+            "general knowledge facts information science history geography mathematics basic questions everyday topics"
+        ),
+        retrieval=NO_RETRIEVAL,
+    ),
+)
+
+
+def load_domain_specs(path: str = CHATBOT_DOMAINS_PATH):
+    """Built-in domains followed by those in domains.json (same name replaces a built-in)"""
+    specs = OrderedDict((spec.name, spec) for spec in BUILTIN_DOMAINS)
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        return list(specs.values())
+
+    known = {f.name for f in fields(DomainSpec)}
+    for entry in entries:
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"Unknown domain settings in {path}: {', '.join(sorted(unknown))}")
+        for key in ("indicators", "keywords"):
+            if key in entry:
+                entry[key] = tuple(entry[key])
+        specs[entry["name"]] = DomainSpec(**entry)
+    print(f"Loaded {len(entries)} domains from {path}")
+    return list(specs.values())
+
+
+class DomainRegistry:
+    """Domains in routing order, plus one phrase matcher over all their routing phrases"""
+
+    def __init__(self, specs, default: str = "general"):
+        self._specs = OrderedDict((spec.name, spec) for spec in specs)
+        self.default = default if default in self._specs else next(iter(self._specs))
+        phrases = {}
+        for spec in self._specs.values():
+            phrases[f"{spec.name}:indicator"] = list(spec.indicators)
+            phrases[f"{spec.name}:keyword"] = list(spec.keywords)
+        self._matcher = PhraseMatcher(phrases)
+        self._exemplar_embeddings = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name) -> bool:
+        return name in self._specs
+
+    def __iter__(self):
+        return iter(self._specs.values())
+
+    def get(self, name: str) -> Optional[DomainSpec]:
+        return self._specs.get(name)
+
+    def names(self) -> list:
+        return list(self._specs)
+
+    def with_store(self) -> list:
+        return [spec for spec in self._specs.values() if spec.has_store]
+
+    def routing_matches(self, question: str):
+        """(domains with an indicator phrase, domains with a keyword phrase), each in registry order"""
+        groups = self._matcher.groups(question)
+        indicated = [name for name in self._specs if f"{name}:indicator" in groups]
+        keyworded = [name for name in self._specs if f"{name}:keyword" in groups]
+        return indicated, keyworded
+
+    def exemplar_embedding(self, name: str, embeddings):
+        """Embedding of a domain's exemplar text (computed once)"""
+        with self._lock:
+            cached = self._exemplar_embeddings.get(name)
+        if cached is None:
+            cached = embeddings.embed_query(self._specs[name].exemplars)
+            with self._lock:
+                self._exemplar_embeddings[name] = cached
+        return cached
+
+    @classmethod
+    def from_env(cls):
+        return cls(load_domain_specs())
+
+
+class StoreUnavailable(Exception):
+    """A store failed to load recently and is not retried yet"""
+
+
+def index_bytes(folder_path) -> int:
+    """Size of a store's index files - what keeping it loaded costs"""
+    path = Path(folder_path)
+    return sum(p.stat().st_size for p in path.glob("*.faiss"))
+
+
+class StoreCache:
+    """Lazily loaded stores keyed by directory, evicted LRU beyond a memory budget
+
+    Evicted stores are only dropped from the cache; requests still holding one
+    keep using it until they finish.
+    """
+
+    def __init__(self, loader, budget_mb: float = CHATBOT_STORE_MEMORY_MB):
+        self.loader = loader
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self._entries = OrderedDict()  # directory -> (domain, store, bytes)
+        self._loading = {}
+        self._failures = {}  # directory -> (monotonic time, error)
+        self._lock = threading.Lock()
+
+    def get(self, domain: str, directory: str):
+        """The loaded store; raises the loader's error, then StoreUnavailable until the retry interval passes"""
+        with self._lock:
+            entry = self._entries.get(directory)
+            if entry is not None:
+                self._entries.move_to_end(directory)
+                return entry[1]
+            failure = self._failures.get(directory)
+            if failure is not None and time.monotonic() - failure[0] < STORE_RETRY_SECONDS:
+                raise StoreUnavailable(f"{domain} store {directory} failed to load: {failure[1]}")
+            loading = self._loading.get(directory)
+            if loading is None:
+                loading = self._loading[directory] = threading.Lock()
+
+        # One loader per directory; others wait for it
+        with loading:
+            with self._lock:
+                entry = self._entries.get(directory)
+                if entry is not None:
+                    self._entries.move_to_end(directory)
+                    return entry[1]
+            try:
+                store = self.loader(domain, directory)
+            except Exception as e:
+                with self._lock:
+                    self._failures[directory] = (time.monotonic(), e)
+                    self._loading.pop(directory, None)
+                raise
+            self.put(domain, directory, store)
+            return store
+
+    def put(self, domain: str, directory: str, store):
+        """Add a store loaded elsewhere (reloads load the new versions before swapping them in)"""
+        size = index_bytes(directory)
+        DOMAIN_STORE_LOADS.inc(domain=domain)
+        with self._lock:
+            self._entries[directory] = (domain, store, size)
+            self._loading.pop(directory, None)
+            self._failures.pop(directory, None)
+            self._evict(keep=directory)
+            DOMAIN_STORE_BYTES.set(self.loaded_bytes())
+        print(f"Loaded {domain} store from {directory} ({size / 1024 / 1024:.1f} MB)")
+
+    def _evict(self, keep):
+        if self.budget_bytes <= 0:
+            return
+        for directory in list(self._entries):
+            if self.loaded_bytes() <= self.budget_bytes:
+                break
+            if directory == keep:
+                continue
+            domain, _, size = self._entries.pop(directory)
+            DOMAIN_STORE_EVICTIONS.inc(domain=domain)
+            print(f"Evicted {domain} store {directory} ({size / 1024 / 1024:.1f} MB) to stay within the memory budget")
+
+    def retain(self, directories):
+        """Drop stores outside `directories` (versions replaced by a reload)"""
+        with self._lock:
+            for directory in [d for d in self._entries if d not in directories]:
+                del self._entries[directory]
+            DOMAIN_STORE_BYTES.set(self.loaded_bytes())
+
+    def loaded_bytes(self) -> int:
+        return sum(size for _, _, size in self._entries.values())
+
+    def items(self) -> list:
+        """(directory, domain, store) for every loaded store"""
+        with self._lock:
+            return [(directory, domain, store) for directory, (domain, store, _) in self._entries.items()]
+
+    def loaded(self) -> dict:
+        """Loaded directories by domain, least recently used first"""
+        with self._lock:
+            return {directory: domain for directory, (domain, _, _) in self._entries.items()}
@@ -0,0 +1,265 @@
+"""
+FAQ Index
+Well-rated question/answer pairs from ChatFeedback, clustered by question
+similarity offline (`manage.py build_faq`) into one entry per cluster with a
+canonical answer. Questions matching an entry are answered from it before the
+graph runs: no LLM calls, same answer every time. Bid numbers and other
+numbers in a question are part of its identity: questions that differ only
+in them are never clustered or matched together.
+
+faq_index/
+    faq.json        {"built_at": ..., "entries": [{"id", "question", "answer", "domain", "votes", "questions"}], "rows": [...]}
+    embeddings.npy  one normalized row per clustered question; rows[i] is its entry
+    dropped.json    ids of entries whose answers got negative feedback since the build
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from .metrics import FAQ_ENTRIES_DROPPED, FAQ_LOOKUPS
+from .query_analysis import analyze_query
+
+FAQ_INDEX_PATH = os.getenv("CHATBOT_FAQ_PATH", "faq_index")
+# Cosine similarity a question needs to an FAQ question to be answered from it
+FAQ_MATCH_THRESHOLD = float(os.getenv("CHATBOT_FAQ_MATCH_THRESHOLD", "0.92"))
+# Questions at least this similar are clustered together at build time
+FAQ_CLUSTER_THRESHOLD = float(os.getenv("CHATBOT_FAQ_CLUSTER_THRESHOLD", "0.85"))
+# Thumbs-up a cluster needs to become an entry
+FAQ_MIN_VOTES = int(os.getenv("CHATBOT_FAQ_MIN_VOTES", "2"))
+# How often lookups check for a rebuilt index or entries dropped by other processes
+FAQ_REFRESH_SECONDS = 5.0
+
+POSITIVE = "thumbs_up"
+NEGATIVE = ("thumbs_down", "correction")
+
+INDEX_FILENAME = "faq.json"
+EMBEDDINGS_FILENAME = "embeddings.npy"
+DROPPED_FILENAME = "dropped.json"
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+
+def question_numbers(question: str) -> tuple:
+    """Bid numbers and any other numbers a question mentions; matching questions must agree on them"""
+    numbers = set(analyze_query(question).doc_numbers) | set(re.findall(r"\d+(?:\.\d+)?", question))
+    return tuple(sorted(numbers))
+
+
+def answer_id(answer: str) -> str:
+    return hashlib.sha1(answer.strip().encode("utf-8")).hexdigest()[:12]
+
+
+def _normalized(matrix) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def cluster_questions(vectors, threshold: float = FAQ_CLUSTER_THRESHOLD, keys=None) -> list:
+    """Cluster index per row: each row joins the first cluster whose first row is similar enough
+    and, when keys are given, has the same key"""
+    vectors = _normalized(vectors)
+    leaders = []
+    labels = []
+    for i, row in enumerate(vectors):
+        similarities = vectors[leaders] @ row if leaders else np.empty(0)
+        if keys is not None:
+            similarities = np.where([keys[leader] == keys[i] for leader in leaders], similarities, -1.0)
+        best = int(np.argmax(similarities)) if len(similarities) else -1
+        if best >= 0 and similarities[best] >= threshold:
+            labels.append(best)
+        else:
+            labels.append(len(leaders))
+            leaders.append(len(labels) - 1)
+    return labels
+
+
+def build_faq(feedback, embeddings, classify=None, min_votes: int = FAQ_MIN_VOTES,
+              cluster_threshold: float = FAQ_CLUSTER_THRESHOLD):
+    """(entries, rows, matrix) from (question, answer, feedback_type) rows
+
+    Answers that ever got negative feedback are left out. Each cluster's
+    canonical answer is its most up-voted one; its question the most asked.
+    """
+    negative = {answer_id(answer) for _, answer, kind in feedback if kind in NEGATIVE}
+    votes = Counter(
+        (normalize_question(question), answer.strip())
+        for question, answer, kind in feedback
+        if kind == POSITIVE and question.strip() and answer.strip() and answer_id(answer) not in negative
+    )
+    if not votes:
+        return [], [], np.zeros((0, 0), dtype=np.float32)
+
+    # Cluster distinct questions, most up-voted first so they lead their clusters
+    question_votes = Counter()
+    for (question, _), count in votes.items():
+        question_votes[question] += count
+    questions = [question for question, _ in question_votes.most_common()]
+    embed = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+    vectors = _normalized(embed(questions))
+    labels = cluster_questions(vectors, cluster_threshold, keys=[question_numbers(question) for question in questions])
+
+    entries = []
+    rows = []
+    keep = []
+    for label in sorted(set(labels)):
+        members = [i for i, l in enumerate(labels) if l == label]
+        member_questions = {questions[i] for i in members}
+        answers = Counter()
+        for (question, answer), count in votes.items():
+            if question in member_questions:
+                answers[answer] += count
+        total = sum(answers.values())
+        if total < min_votes:
+            continue
+        answer = answers.most_common(1)[0][0]
+        canonical = questions[members[0]]
+        entries.append({
+            "id": answer_id(answer),
+            "question": canonical,
+            "answer": answer,
+            "domain": classify(canonical) if classify else "",
+            "votes": total,
+            "questions": [questions[i] for i in members],
+        })
+        rows.extend([len(entries) - 1] * len(members))
+        keep.extend(members)
+    return entries, rows, vectors[keep]
+
+
+def _write_json(path: Path, data):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def save_faq(entries, rows, matrix, folder_path: str = FAQ_INDEX_PATH):
+    """Write the index; a new build starts with no dropped entries"""
+    path = Path(folder_path)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp = path / f".{EMBEDDINGS_FILENAME}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(matrix, dtype=np.float32))
+    os.replace(tmp, path / EMBEDDINGS_FILENAME)
+    _write_json(path / DROPPED_FILENAME, [])
+    _write_json(path / INDEX_FILENAME, {"built_at": time.time(), "entries": entries, "rows": rows})
+
+
+class FaqIndex:
+    """Precomputed FAQ answers, reloaded when the files on disk change"""
+
+    def __init__(self, folder_path: str = FAQ_INDEX_PATH, threshold: float = FAQ_MATCH_THRESHOLD):
+        self.path = Path(folder_path)
+        self.threshold = threshold
+        self.entries = []
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._exact = {}
+        self._numbers = []
+        self._dropped = set()
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _file_stamp(self):
+        stamp = []
+        for name in (INDEX_FILENAME, DROPPED_FILENAME):
+            try:
+                stamp.append((self.path / name).stat().st_mtime_ns)
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def refresh(self) -> bool:
+        """Reload if faq.json or dropped.json changed; returns whether it did"""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+        try:
+            with open(self.path / INDEX_FILENAME) as f:
+                data = json.load(f)
+            matrix = np.load(self.path / EMBEDDINGS_FILENAME)
+            try:
+                with open(self.path / DROPPED_FILENAME) as f:
+                    dropped = set(json.load(f))
+            except FileNotFoundError:
+                dropped = set()
+        except FileNotFoundError:
+            data, matrix, dropped = {"entries": [], "rows": []}, np.zeros((0, 0), dtype=np.float32), set()
+        if len(data["rows"]) != len(matrix):
+            print(f"WARNING: FAQ index {self.path} is being rewritten - keeping the loaded one")
+            return False
+
+        exact = {}
+        for position, entry in enumerate(data["entries"]):
+            if entry["id"] not in dropped:
+                for question in entry["questions"]:
+                    exact.setdefault(question, position)
+        numbers = [question_numbers(entry["question"]) for entry in data["entries"]]
+        with self._lock:
+            self.entries = data["entries"]
+            self._rows = np.asarray(data["rows"], dtype=np.int64)
+            self._matrix = matrix
+            self._exact = exact
+            self._numbers = numbers
+            self._dropped = dropped
+            self._stamp = stamp
+        if self.entries:
+            print(f"Loaded {len(self.entries) - len(dropped)} FAQ entries from {self.path}")
+        return True
+
+    def __len__(self) -> int:
+        return len(self.entries) - len(self._dropped)
+
+    def lookup(self, question: str, embeddings):
+        """Entry answering the question, or None"""
+        if time.monotonic() - self._checked > FAQ_REFRESH_SECONDS:
+            self._checked = time.monotonic()
+            self.refresh()
+        with self._lock:
+            entries, rows, matrix, exact, dropped = self.entries, self._rows, self._matrix, self._exact, self._dropped
+            numbers = self._numbers
+        if len(entries) <= len(dropped):
+            return None
+
+        # Repeated wording needs no embedding at all
+        position = exact.get(normalize_question(question))
+        if position is None:
+            vector = _normalized([embeddings.embed_query(question)])[0]
+            similarities = matrix @ vector
+            wanted = question_numbers(question)
+            for row in np.argsort(-similarities):
+                if similarities[row] < self.threshold:
+                    break
+                entry = int(rows[row])
+                if entries[entry]["id"] not in dropped and numbers[entry] == wanted:
+                    position = entry
+                    break
+        FAQ_LOOKUPS.inc(result="miss" if position is None else "hit")
+        return None if position is None else entries[position]
+
+    def drop_answer(self, answer: str) -> bool:
+        """Stop serving entries with this answer (negative feedback); persisted until the next build"""
+        entry_id = answer_id(answer)
+        with self._lock:
+            if entry_id in self._dropped or not any(entry["id"] == entry_id for entry in self.entries):
+                return False
+            dropped = self._dropped | {entry_id}
+            self._dropped = dropped
+            self._exact = {question: p for question, p in self._exact.items() if self.entries[p]["id"] != entry_id}
+            _write_json(self.path / DROPPED_FILENAME, sorted(dropped))
+            self._stamp = self._file_stamp()
+        FAQ_ENTRIES_DROPPED.inc()
+        print(f"Dropped FAQ entry {entry_id} after negative feedback")
+        return True
@@ -0,0 +1,282 @@
+"""
+Fast-path Answerers
+Trivial questions (arithmetic, unit conversions, the date or time, greetings,
+help) answered locally before the graph runs: no classifier, retrieval or
+LLM calls. Each answerer only fires when the whole question matches its
+pattern; anything else goes through the graph as usual.
+"""
+import ast
+import operator
+import os
+import re
+import time
+
+from django.utils import timezone
+
+from .metrics import FAST_PATH_ANSWERS, FAST_PATH_LOOKUPS, FAST_PATH_SAVED_SECONDS
+from .resilience import LatencyTracker
+
+CHATBOT_FAST_PATH = os.getenv("CHATBOT_FAST_PATH", "true").lower() == "true"
+
+MAX_EXPONENT = 100
+MAX_RESULT = 1e15
+
+
+def _clean(question: str) -> str:
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!.= ").strip()
+
+
+def _number(value: float) -> str:
+    if float(value).is_integer() and abs(value) < MAX_RESULT:
+        return str(int(value))
+    return f"{value:.10g}"
+
+
+# Arithmetic
+
+_LEADING = re.compile(r"^(?:what is|what's|whats|how much is|calculate|compute|evaluate|solve)\s+")
+_WORDS = (
+    (r"\bmultiplied by\b", "*"), (r"\bdivided by\b", "/"), (r"\bto the power of\b", "**"),
+    (r"\bplus\b", "+"), (r"\bminus\b", "-"), (r"\btimes\b", "*"), (r"×", "*"), (r"÷", "/"), (r"\^", "**"),
+    (r"(?<=[\d)])\s+x\s+(?=[\d(])", " * "),  # "3 x 4", but never the x in 0x10
+)
+_EXPRESSION = re.compile(r"^[\d\s.+\-*/%()]+$")
+# Dates and financial years look like arithmetic but aren't: 12/25/2024, 25-12-2024, 2024-25, 2024-2025
+_NOT_ARITHMETIC = (
+    re.compile(r"(?<![\d.])\d+\s*/\s*\d+\s*/\s*\d+(?![\d.])"),
+    re.compile(r"(?<![\d.])\d{1,2}([-.])\d{1,2}\1\d{2,4}(?![\d.])"),
+    re.compile(r"(?<![\d.])\d{4}-\d{2}(?:\d{2})?(?![\d.])"),
+)
+_PERCENT_OF = re.compile(r"^(\d+(?:\.\d+)?)\s*%\s*of\s*(\d+(?:\.\d+)?)$")
+
+_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.UAdd: operator.pos, ast.USub: operator.neg,
+}
+
+
+def _real(value):
+    """Fractional powers of negative numbers come back complex: not an answer"""
+    if type(value) not in (int, float):
+        raise ValueError(f"not a real number: {value}")
+    return value
+
+
+def _evaluate(node):
+    """Numbers and + - * / // % ** only; anything else raises ValueError"""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _real(_OPERATORS[type(node.op)](_evaluate(node.operand)))
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _evaluate(node.left), _evaluate(node.right)
+        if isinstance(node.op, ast.Pow) and (abs(right) > MAX_EXPONENT or abs(left) > MAX_RESULT):
+            raise ValueError("exponent too large")
+        result = _real(_OPERATORS[type(node.op)](left, right))
+        if abs(result) > MAX_RESULT:
+            raise ValueError("result too large")
+        return result
+    raise ValueError(f"unsupported expression: {type(node).__name__}")
+
+
+def answer_arithmetic(text: str, domains=None):
+    expression = _LEADING.sub("", text)
+    percent = _PERCENT_OF.match(expression)
+    if percent:
+        value = float(percent.group(1)) * float(percent.group(2)) / 100
+        return f"{percent.group(1)}% of {percent.group(2)} is {_number(value)}."
+
+    if any(pattern.search(expression) for pattern in _NOT_ARITHMETIC):
+        return None
+    for pattern, symbol in _WORDS:
+        expression = re.sub(pattern, symbol, expression)
+    if not _EXPRESSION.match(expression) or not re.search(r"\d", expression):
+        return None
+    if not re.search(r"\d\s*(?:[+\-*/%]|\*\*)\s*[\d(.-]", expression):
+        return None  # a bare number is not a calculation
+    try:
+        value = _evaluate(ast.parse(expression, mode="eval"))
+    except (SyntaxError, TypeError, ValueError, ZeroDivisionError, OverflowError):
+        return None
+    expression = re.sub(r"\s+", " ", expression).strip()
+    return f"{expression} = {_number(value)}"
+
+
+# Unit conversion
+
+# Unit -> (dimension, size in the dimension's base unit)
+_UNITS = {}
+for names, dimension, size in (
+    (("m", "meter", "meters", "metre", "metres"), "length", 1.0),
+    (("km", "kilometer", "kilometers", "kilometre", "kilometres"), "length", 1000.0),
+    (("cm", "centimeter", "centimeters", "centimetre", "centimetres"), "length", 0.01),
+    (("mm", "millimeter", "millimeters", "millimetre", "millimetres"), "length", 0.001),
+    (("mi", "mile", "miles"), "length", 1609.344),
+    (("yd", "yard", "yards"), "length", 0.9144),
+    (("ft", "foot", "feet"), "length", 0.3048),
+    (("in", "inch", "inches"), "length", 0.0254),
+    (("kg", "kilogram", "kilograms", "kilo", "kilos"), "mass", 1.0),
+    (("g", "gram", "grams"), "mass", 0.001),
+    (("mg", "milligram", "milligrams"), "mass", 1e-6),
+    (("t", "tonne", "tonnes"), "mass", 1000.0),
+    (("lb", "lbs", "pound", "pounds"), "mass", 0.45359237),
+    (("oz", "ounce", "ounces"), "mass", 0.028349523125),
+    (("l", "liter", "liters", "litre", "litres"), "volume", 1.0),
+    (("ml", "milliliter", "milliliters", "millilitre", "millilitres"), "volume", 0.001),
+    (("gal", "gallon", "gallons"), "volume", 3.785411784),
+    (("s", "sec", "secs", "second", "seconds"), "time", 1.0),
+    (("min", "mins", "minute", "minutes"), "time", 60.0),
+    (("h", "hr", "hrs", "hour", "hours"), "time", 3600.0),
+    (("day", "days"), "time", 86400.0),
+    (("week", "weeks"), "time", 604800.0),
+):
+    for name in names:
+        _UNITS[name] = (dimension, size)
+
+_TEMPERATURES = {
+    "c": "C", "°c": "C", "celsius": "C", "centigrade": "C",
+    "f": "F", "°f": "F", "fahrenheit": "F",
+    "k": "K", "kelvin": "K",
+}
+
+_UNIT = r"(?:degrees?\s+)?([a-z°]+)"
+_CONVERT = re.compile(
+    r"^(?:convert|what is|what's|how much is)?\s*(-?\d+(?:\.\d+)?)\s*" + _UNIT + r"\s+(?:to|in|into|as)\s+" + _UNIT + r"$"
+)
+_HOW_MANY = re.compile(r"^how many\s+" + _UNIT + r"\s+(?:are\s+)?(?:there\s+)?in\s+(?:a|an|one|(-?\d+(?:\.\d+)?))\s*" + _UNIT + r"$")
+
+
+def _to_kelvin(value, scale):
+    return {"C": value + 273.15, "F": (value - 32) * 5 / 9 + 273.15, "K": value}[scale]
+
+
+def _from_kelvin(value, scale):
+    return {"C": value - 273.15, "F": (value - 273.15) * 9 / 5 + 32, "K": value}[scale]
+
+
+def convert_units(value: float, source: str, target: str):
+    """Converted value, or None for unknown or mismatched units"""
+    if source in _TEMPERATURES and target in _TEMPERATURES:
+        return _from_kelvin(_to_kelvin(value, _TEMPERATURES[source]), _TEMPERATURES[target])
+    if source in _UNITS and target in _UNITS and _UNITS[source][0] == _UNITS[target][0]:
+        return value * _UNITS[source][1] / _UNITS[target][1]
+    return None
+
+
+def answer_units(text: str, domains=None):
+    match = _CONVERT.match(text)
+    if match:
+        amount, source, target = match.group(1), match.group(2), match.group(3)
+    else:
+        match = _HOW_MANY.match(text)
+        if not match:
+            return None
+        target, amount, source = match.group(1), match.group(2) or "1", match.group(3)
+    value = convert_units(float(amount), source, target)
+    if value is None:
+        return None
+    if source in _TEMPERATURES:
+        labels = {"C": "°C", "F": "°F", "K": "K"}
+        source, target = labels[_TEMPERATURES[source]], labels[_TEMPERATURES[target]]
+    return f"{amount} {source} = {_number(round(value, 6))} {target}"
+
+
+# Date and time
+
+_TIME = re.compile(r"^(?:what(?:'s| is) the (?:current )?time(?: now| right now)?|what time is it(?: now| right now)?)$")
+_DATE = re.compile(r"^(?:what(?:'s| is) (?:the date|today'?s date|the date today|the current date)|what date is it(?: today)?)$")
+_DAY = re.compile(r"^(?:what day is (?:it|today)(?: today)?|what(?:'s| is) the day today)$")
+_YEAR = re.compile(r"^(?:what year is it(?: now)?|what(?:'s| is) the (?:current )?year)$")
+
+
+def answer_datetime(text: str, domains=None):
+    now = timezone.localtime()
+    zone = timezone.get_current_timezone_name()
+    if _TIME.match(text):
+        return f"It's {now:%H:%M} ({zone})."
+    if _DATE.match(text):
+        return f"Today is {now:%A, %d %B %Y}."
+    if _DAY.match(text):
+        return f"Today is {now:%A}."
+    if _YEAR.match(text):
+        return f"It's {now:%Y}."
+    return None
+
+
+# Greetings and help
+
+GREETINGS = {
+    "hi": "Hello! What would you like to know?",
+    "hello": "Hello! What would you like to know?",
+    "hey": "Hey! What would you like to know?",
+    "hi there": "Hello! What would you like to know?",
+    "hello there": "Hello! What would you like to know?",
+    "good morning": "Good morning! What would you like to know?",
+    "good afternoon": "Good afternoon! What would you like to know?",
+    "good evening": "Good evening! What would you like to know?",
+    "thanks": "You're welcome!",
+    "thank you": "You're welcome!",
+    "thanks a lot": "You're welcome!",
+    "thank you so much": "You're welcome!",
+    "bye": "Goodbye!",
+    "goodbye": "Goodbye!",
+}
+
+HELP_QUESTIONS = {
+    "help", "what can you do", "what can you help with", "what can you help me with",
+    "what do you know", "how do i use this", "who are you", "what are you",
+}
+
+
+def answer_greeting(text: str, domains=None):
+    return GREETINGS.get(re.sub(r"[^a-z ]", "", text).strip())
+
+
+def answer_help(text: str, domains=None):
+    if re.sub(r"[^a-z ]", "", text).strip() not in HELP_QUESTIONS or domains is None:
+        return None
+    topics = "".join(f"**{spec.title}** - {spec.description}\n" for spec in domains)
+    return f"I can help you with different types of questions:\n\n{topics}\nJust ask your question."
+
+
+ANSWERERS = (
+    ("greeting", answer_greeting),
+    ("help", answer_help),
+    ("datetime", answer_datetime),
+    ("units", answer_units),
+    ("arithmetic", answer_arithmetic),
+)
+
+
+class FastPath:
+    """Runs the answerers and tracks what a hit saved against recent general-question graph runs"""
+
+    def __init__(self, domains, enabled: bool = CHATBOT_FAST_PATH):
+        self.domains = domains
+        self.enabled = enabled
+        self.graph_latency = LatencyTracker(min_samples=5)
+
+    def answer(self, question: str):
+        """(answerer name, answer) or None"""
+        if not self.enabled or len(question) > 200:
+            return None
+        start = time.perf_counter()
+        text = _clean(question)
+        for name, answerer in ANSWERERS:
+            answer = answerer(text, self.domains)
+            if answer:
+                FAST_PATH_LOOKUPS.inc(result="hit")
+                FAST_PATH_ANSWERS.inc(answerer=name)
+                typical = self.graph_latency.quantile(0.5)
+                if typical is not None:
+                    FAST_PATH_SAVED_SECONDS.observe(max(0.0, typical - (time.perf_counter() - start)))
+                return name, answer
+        FAST_PATH_LOOKUPS.inc(result="miss")
+        return None
+
+    def observe_graph(self, seconds: float):
+        """Duration of a graph run that ended in a general answer"""
+        self.graph_latency.observe(seconds)
@@ -1,28 +1,73 @@
 """
 GeM Document Processing Module
 """
+import contextvars
+import hashlib
+import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from langchain.schema import Document
 
+from .context_packer import pack_context
+from .deadline import CHATBOT_GENERATION_RESERVE, DeadlineExceeded, can_afford, mark_degraded, remaining
+from .gem_summaries import is_summary
+from .metrics import record_cache
+from .near_duplicates import chunk_sources
+from .query_analysis import analyze_query
+
+# "diverse": several searches per question (default)
+# "small_to_big": one search over small chunks, each hit expanded to its neighbours
+GEM_RETRIEVAL_MODE = os.getenv("GEM_RETRIEVAL_MODE", "diverse")
+GEM_NEIGHBOUR_WINDOW = int(os.getenv("GEM_NEIGHBOUR_WINDOW", "1"))
+
+# "single": one prompt with every document (default)
+# "map_reduce": one extraction call per source in parallel, then a merge call
+GEM_MULTI_DOC_GENERATION = os.getenv("GEM_MULTI_DOC_GENERATION", "single")
+GEM_MAP_WORKERS = int(os.getenv("GEM_MAP_WORKERS", "8"))
+GEM_MAP_CACHE_SIZE = int(os.getenv("GEM_MAP_CACHE_SIZE", "512"))
+# Per-source share of the context budget in map_reduce mode
+GEM_MAP_TOKEN_BUDGET = int(os.getenv("GEM_MAP_TOKEN_BUDGET", "2000"))
+
+_map_executor = ThreadPoolExecutor(max_workers=GEM_MAP_WORKERS, thread_name_prefix="gem-map")
+
+NOT_FOUND = "Not found in provided content"
+
+def _belongs_to(doc, doc_number: str) -> bool:
+    """Whether a chunk comes from the given bid (shared chunks belong to several)"""
+    return any(doc_number in source for source in chunk_sources(doc.metadata))
+
 class GemProcessor:
-    def __init__(self, gem_db, llm):
+    def __init__(self, gem_db, llm, summary_db=None, merge_llm=None):
         self.gem_db = gem_db
         self.llm = llm
+        self.summary_db = summary_db
+        self.merge_llm = merge_llm or llm
+        self.retrieval_mode = GEM_RETRIEVAL_MODE
+        self.neighbour_window = GEM_NEIGHBOUR_WINDOW
+        self.multi_doc_generation = GEM_MULTI_DOC_GENERATION
+        self._extractions = OrderedDict()
+        self._extractions_lock = threading.Lock()
     
     def setup_gem_chain(self):
         """Setup GeM procurement QA chain"""
         def gem_chain_invoke(inputs):
             question = inputs.get('input', '')
             context_docs = inputs.get('context', [])
+            plan = inputs.get('query_plan') or analyze_query(question)
             
             if not context_docs:
                 return "No relevant documents found for this GeM query."
             
-            context_text = "\n\n".join([doc.page_content for doc in context_docs])
-            
             # Check if this is a multi-document query
-            multi_doc_indicators = ['each pdf', 'all pdf', 'all documents', 'each document', 'systematic manner', 'compare', 'list all', 'all the bid', 'all bid documents', 'in all']
-            is_multi_doc = any(indicator in question.lower() for indicator in multi_doc_indicators)
+            is_multi_doc = plan.is_multi_doc
+            
+            # Summary records are already one short block per bid - a single call is cheapest
+            if is_multi_doc and self.multi_doc_generation == "map_reduce" and not all(is_summary(doc) for doc in context_docs):
+                return self.map_reduce_answer(question, context_docs, plan)
+            
+            context_text = pack_context(context_docs, per_source=is_multi_doc)
             
             if is_multi_doc:
                 doc_sources = set()
@@ -80,34 +125,136 @@ Provide a comprehensive answer based on the document content:
         
         return DirectChain(gem_chain_invoke)
     
-    def smart_gem_search(self, question: str, k: int = 8):
+    def question_intent(self, question: str, plan=None) -> str:
+        """Known intent name, else the normalized question"""
+        plan = plan or analyze_query(question)
+        if plan.intent:
+            return plan.intent
+        return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+    
+    def _extract_from_source(self, source, docs, question, intent):
+        """Map step: facts answering the question from one source, cached by (source, intent)"""
+        content_hash = hashlib.sha1("\n".join(doc.page_content for doc in docs).encode("utf-8")).hexdigest()
+        key = (source, intent, content_hash)
+        with self._extractions_lock:
+            if key in self._extractions:
+                self._extractions.move_to_end(key)
+                record_cache("gem_map", hit=True)
+                return self._extractions[key]
+        record_cache("gem_map", hit=False)
+        
+        prompt = f"""
+You are extracting facts from ONE GeM procurement document ({source}).
+
+{pack_context(docs, token_budget=GEM_MAP_TOKEN_BUDGET)}
+
+Question: {question}
+
+Extract only the facts from this document that answer the question. Quote dates, numbers and names exactly.
+Answer in at most 5 short lines. If the document does not contain the answer, reply "Not found in provided content".
+"""
+        extraction = self.llm.invoke(prompt).content.strip()
+        
+        with self._extractions_lock:
+            self._extractions[key] = extraction
+            if len(self._extractions) > GEM_MAP_CACHE_SIZE:
+                self._extractions.popitem(last=False)
+        return extraction
+    
+    def map_reduce_answer(self, question: str, context_docs, plan=None):
+        """Per-source extraction in parallel, then one merge call that builds the table"""
+        by_source = {}
+        for doc in context_docs:
+            # A shared chunk is evidence for every bid it was collapsed from
+            for source in chunk_sources(doc.metadata):
+                by_source.setdefault(source or 'Unknown', []).append(doc)
+        intent = self.question_intent(question, plan)
+        print(f"Map-reduce over {len(by_source)} documents (intent: {intent})")
+        
+        futures = {
+            source: _map_executor.submit(
+                contextvars.copy_context().run, self._extract_from_source, source, docs, question, intent
+            )
+            for source, docs in by_source.items()
+        }
+        # Sources still extracting when the map step runs out of time count as not found
+        done, _ = wait(futures.values(), timeout=self._map_timeout())
+        extractions = {}
+        errors = []
+        for source, future in futures.items():
+            if future not in done:
+                future.cancel()
+                print(f"Extraction timed out for {source}")
+                errors.append(DeadlineExceeded(f"Extraction for {source} timed out"))
+                extractions[source] = f"{NOT_FOUND} (extraction timed out)"
+                continue
+            try:
+                extractions[source] = future.result()
+            except Exception as e:
+                print(f"Extraction failed for {source}: {e}")
+                errors.append(e)
+                extractions[source] = "Not available (extraction failed)"
+        
+        # Nothing to merge - let the caller's fallback handling take over
+        if errors and len(errors) == len(futures):
+            raise errors[0]
+        if len(done) < len(futures):
+            mark_degraded("map_extraction")
+        
+        findings = "\n\n".join(f"[Source: {source}]\n{text}" for source, text in sorted(extractions.items()))
+        merge_prompt = f"""
+You are combining findings extracted separately from {len(extractions)} GeM procurement documents.
+
+{findings}
+
+Question: {question}
+
+Present the answer as a table with one row per document source and a column for each requested detail.
+List ALL {len(extractions)} documents. Use "{NOT_FOUND}" where a document has no answer.
+"""
+        return self.merge_llm.invoke(merge_prompt).content
+    
+    def _map_timeout(self):
+        """Seconds the map step may take: the extraction role's timeout, cut so the merge call keeps
+        CHATBOT_GENERATION_RESERVE seconds (or half of what is left) of the request deadline"""
+        role_config = getattr(self.llm, "role_config", None)
+        timeout = role_config.timeout if role_config else None
+        left = remaining()
+        if left is None:
+            return timeout
+        left = max(0.0, max(left - CHATBOT_GENERATION_RESERVE, left / 2))
+        return left if timeout is None else min(timeout, left)
+    
+    def smart_gem_search(self, question: str, k: int = 8, plan=None):
         """Smart GeM search with document-specific filtering"""
         if not self.gem_db:
             return []
+        plan = plan or analyze_query(question)
         
         # Check for multi-document queries
-        multi_doc_indicators = ['each pdf', 'all pdf', 'all documents', 'each document', 'systematic manner', 'compare', 'list all', 'all the bid', 'all bid documents', 'in all']
-        is_multi_doc_query = any(indicator in question.lower() for indicator in multi_doc_indicators)
-        
-        if is_multi_doc_query:
+        if plan.is_multi_doc:
+            if self.summary_db is not None:
+                print("Multi-document query detected - answering from per-bid summaries")
+                return self.summary_search(question)
             print("Multi-document query detected - searching across all PDFs")
             return self.multi_document_search(question, k=50)
         
-        # Extract document number if mentioned
-        doc_pattern = r'\b(\d{7})\b'
-        doc_match = re.search(doc_pattern, question)
+        # Document number if mentioned
+        doc_number = plan.doc_number
+        
+        if self.retrieval_mode == "small_to_big":
+            return self.small_to_big_search(question, k=k, doc_number=doc_number)
         
-        if doc_match:
-            doc_number = doc_match.group(1)
+        if doc_number:
             print(f"Searching specifically in document: {doc_number}")
             
             search_strategies = [question, doc_number]
             
-            if any(term in question.lower() for term in ['document', 'required', 'seller', 'upload', 'eligibility']):
+            if plan.search_focus == "documents":
                 search_strategies.extend(["documents required", "seller documents", "eligibility"])
-            elif any(term in question.lower() for term in ['bid', 'opening', 'date', 'time']):
+            elif plan.search_focus == "bid_dates":
                 search_strategies.extend(["Bid Opening Date/Time", "bid opening", "Bid Details"])
-            elif any(term in question.lower() for term in ['validity', 'period', 'duration']):
+            elif plan.search_focus == "validity":
                 search_strategies.extend(["Bid Offer Validity", "validity period"])
             else:
                 search_strategies.extend(["terms and conditions", "specifications", "requirements"])
@@ -121,7 +268,7 @@ Provide a comprehensive answer based on the document content:
                     source = doc.metadata.get('source', '')
                     content_hash = hash(doc.page_content[:100])
                     
-                    if (doc_number in source and content_hash not in seen_content and len(all_docs) < k):
+                    if (_belongs_to(doc, doc_number) and content_hash not in seen_content and len(all_docs) < k):
                         all_docs.append(doc)
                         seen_content.add(content_hash)
                         print(f"Found chunk from {source} using strategy '{strategy}'")
@@ -134,6 +281,57 @@ Provide a comprehensive answer based on the document content:
         
         return self.gem_db.similarity_search(question, k=k)
     
+    def expand_neighbours(self, docs, window: int = None):
+        """Expand each hit to chunk_ids within `window` of it, fetched straight from the docstore"""
+        window = self.neighbour_window if window is None else window
+        if window <= 0 or not hasattr(self.gem_db.docstore, "get_chunks"):
+            return docs
+        if not can_afford():
+            mark_degraded("neighbour_expansion")
+            return docs
+        
+        expanded = []
+        seen = set()
+        for doc in docs:
+            source = doc.metadata.get('source')
+            chunk_id = doc.metadata.get('chunk_id')
+            if source is None or chunk_id is None:
+                expanded.append(doc)
+                continue
+            
+            last_chunk = doc.metadata.get('total_chunks', chunk_id + window + 1) - 1
+            wanted = [i for i in range(max(0, chunk_id - window), min(last_chunk, chunk_id + window) + 1)
+                      if (source, i) not in seen]
+            # Keep the hit itself first so relevance order is preserved
+            for neighbour in [doc] + self.gem_db.docstore.get_chunks(source, wanted):
+                key = (source, neighbour.metadata.get('chunk_id'))
+                if key not in seen:
+                    seen.add(key)
+                    expanded.append(neighbour)
+        
+        print(f"Expanded {len(docs)} hits to {len(expanded)} chunks (window {window})")
+        return expanded
+    
+    def small_to_big_search(self, question: str, k: int = 8, doc_number: str = None):
+        """Single vector search over small chunks, then neighbour expansion"""
+        if doc_number:
+            hits = self.gem_db.similarity_search(
+                question, k=k, fetch_k=k * 25,
+                filter=lambda metadata: any(doc_number in source for source in chunk_sources(metadata)),
+            )
+            if not hits:
+                print(f"No chunks found for document {doc_number}, using general search")
+                hits = self.gem_db.similarity_search(question, k=k)
+        else:
+            hits = self.gem_db.similarity_search(question, k=k)
+        return self.expand_neighbours(hits)
+    
+    def summary_search(self, question: str):
+        """Every per-bid summary record, most relevant first"""
+        summaries = self.summary_db.similarity_search(question, k=self.summary_db.index.ntotal)
+        print(f"Using {len(summaries)} bid summaries")
+        return summaries
+    
     def multi_document_search(self, question: str, k: int = 50):
         """Search across ALL GeM documents ensuring complete coverage"""
         if not self.gem_db:
@@ -177,7 +375,7 @@ Provide a comprehensive answer based on the document content:
                     missing_docs = self.gem_db.similarity_search(strategy, k=40)
                     for doc in missing_docs:
                         source = doc.metadata.get('source', '')
-                        if doc_num in source:
+                        if _belongs_to(doc, doc_num):
                             if source not in doc_coverage:
                                 doc_coverage[source] = []
                             if len(doc_coverage[source]) < 4:
@@ -199,7 +397,7 @@ Provide a comprehensive answer based on the document content:
             for doc in all_chunks:
                 source = doc.metadata.get('source', '')
                 for missing_doc in missing_docs:
-                    if missing_doc in source:
+                    if _belongs_to(doc, missing_doc):
                         if source not in doc_coverage:
                             doc_coverage[source] = []
                         if len(doc_coverage[source]) < 2:
@@ -232,7 +430,7 @@ Provide a comprehensive answer based on the document content:
         print(f"Using hybrid extraction for document {doc_number}")
         
         all_docs = self.gem_db.similarity_search(doc_number, k=50)
-        doc_chunks = [doc for doc in all_docs if doc_number in doc.metadata.get('source', '')]
+        doc_chunks = [doc for doc in all_docs if _belongs_to(doc, doc_number)]
         
         if not doc_chunks:
             return None
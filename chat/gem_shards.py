@@ -0,0 +1,237 @@
+"""
+Sharded GeM Store
+The GeM corpus split into one FAISS store per bid (or per ministry) under a
+shard directory with a manifest. Questions naming a bid number or a ministry
+only search the matching shards; the rest fan out over every shard on a
+thread pool and the per-shard top-k lists are merged by distance.
+
+faiss_gem_shards/manifest.json:
+
+    {"key": "bid", "shards": {"7893321": {"sources": [...], "bid_numbers": [...], "ministries": [...], "vectors": 40}}}
+"""
+import contextvars
+import heapq
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+
+from .deadline import DeadlineExceeded, remaining
+from .docstore import load_vector_store, save_vector_store
+from .metrics import SHARDS_SEARCHED
+from .near_duplicates import chunk_refs, chunk_sources
+from .query_analysis import analyze_query
+
+GEM_SHARD_STORE_PATH = os.getenv("GEM_SHARD_STORE_PATH", "faiss_gem_shards")
+GEM_SHARD_WORKERS = int(os.getenv("GEM_SHARD_WORKERS", "8"))
+
+MANIFEST_FILENAME = "manifest.json"
+SHARD_KEYS = ("bid", "ministry")
+
+_shard_executor = ThreadPoolExecutor(max_workers=GEM_SHARD_WORKERS, thread_name_prefix="gem-shard")
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", value.lower()).strip("_") or "unknown"
+
+
+def _bid_digits(value: str):
+    match = re.search(r"(\d{7})", value or "")
+    return match.group(1) if match else None
+
+
+def _chunk_key(doc):
+    """Identity of a chunk across shards (shared chunks are stored in each shard they belong to)"""
+    return doc.page_content, tuple(tuple(ref) for ref in chunk_refs(doc.metadata))
+
+
+def shard_names(metadata, key: str = "bid") -> list:
+    """Shards a chunk belongs to (shared chunks can belong to several bids)"""
+    if key == "ministry":
+        return [_slug(metadata.get("ministry") or "unknown")]
+    names = []
+    for source in chunk_sources(metadata):
+        name = _bid_digits(source) or _bid_digits(metadata.get("bid_number", "")) or _slug(source or "unknown")
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def partition(items, key: str = "bid") -> dict:
+    """Group (document, vector) pairs into shards"""
+    if key not in SHARD_KEYS:
+        raise ValueError(f"Unknown shard key {key!r} (expected one of {', '.join(SHARD_KEYS)})")
+    shards = {}
+    for doc, vector in items:
+        for name in shard_names(doc.metadata, key):
+            shards.setdefault(name, []).append((doc, vector))
+    return shards
+
+
+def build_shards(items, embeddings, folder_path: str = GEM_SHARD_STORE_PATH, key: str = "bid") -> dict:
+    """Write one FAISS store per shard plus the manifest; returns the manifest"""
+    path = Path(folder_path)
+    path.mkdir(exist_ok=True, parents=True)
+
+    manifest = {"key": key, "shards": {}}
+    for name, members in sorted(partition(items, key).items()):
+        docs = [doc for doc, _ in members]
+        db = FAISS.from_embeddings(
+            [(doc.page_content, vector) for doc, vector in members], embeddings, metadatas=[doc.metadata for doc in docs]
+        )
+        save_vector_store(db, str(path / name))
+        manifest["shards"][name] = {
+            "sources": sorted({source for doc in docs for source in chunk_sources(doc.metadata)}),
+            "bid_numbers": sorted({doc.metadata["bid_number"] for doc in docs if doc.metadata.get("bid_number")}),
+            "ministries": sorted({doc.metadata["ministry"] for doc in docs if doc.metadata.get("ministry")}),
+            "vectors": len(docs),
+        }
+
+    with open(path / MANIFEST_FILENAME, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def has_shards(folder_path: str = GEM_SHARD_STORE_PATH) -> bool:
+    return (Path(folder_path) / MANIFEST_FILENAME).exists()
+
+
+class _ShardIndex:
+    """Just enough of a FAISS index for callers that read ntotal"""
+
+    def __init__(self, store):
+        self._store = store
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard["vectors"] for shard in self._store.manifest["shards"].values())
+
+
+class ShardedDocstore:
+    """Docstore view over every shard (chunk lookups go to the shard owning the source)"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def get_chunks(self, source: str, chunk_ids):
+        for name in self._store.shards_for_source(source):
+            docstore = self._store.shard(name).docstore
+            if hasattr(docstore, "get_chunks"):
+                chunks = docstore.get_chunks(source, chunk_ids)
+                if chunks:
+                    return chunks
+        return []
+
+    def iter_documents(self):
+        # Shared chunks are stored in every shard they belong to - return them once
+        seen = set()
+        documents = []
+        for name in self._store.manifest["shards"]:
+            for doc in self._store.shard(name).docstore.iter_documents():
+                key = _chunk_key(doc)
+                if key not in seen:
+                    seen.add(key)
+                    documents.append(doc)
+        return documents
+
+
+class ShardedGemStore:
+    """Routes GeM searches to shards; exposes the FAISS calls GemProcessor and ScoredRetriever use
+
+    Shards are loaded on first use, so startup cost doesn't grow with the corpus.
+    """
+
+    def __init__(self, folder_path: str, embeddings):
+        self.path = Path(folder_path)
+        self.embeddings = embeddings
+        with open(self.path / MANIFEST_FILENAME) as f:
+            self.manifest = json.load(f)
+        self.key = self.manifest.get("key", "bid")
+        self.store_name = self.path.name
+        self.index = _ShardIndex(self)
+        self.docstore = ShardedDocstore(self)
+        self._shards = {}
+        self._lock = threading.Lock()
+        self._shard_locks = {}
+
+        # Lowercased ministry name -> shards, for routing questions that name one
+        self._ministries = {}
+        for name, info in self.manifest["shards"].items():
+            for ministry in info.get("ministries", []):
+                self._ministries.setdefault(ministry.lower(), []).append(name)
+
+    def shard(self, name: str):
+        db = self._shards.get(name)
+        if db is not None:
+            return db
+        # One lock per shard, so a cold fan-out loads its shards in parallel
+        with self._lock:
+            lock = self._shard_locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._shards:
+                db = load_vector_store(str(self.path / name), self.embeddings)
+                db.store_name = self.store_name
+                self._shards[name] = db
+            return self._shards[name]
+
+    def shards_for_source(self, source: str) -> list:
+        return [name for name, info in self.manifest["shards"].items() if source in info["sources"]]
+
+    def route(self, query: str) -> list:
+        """Shards to search: those matching a named bid or ministry, otherwise all of them"""
+        plan = analyze_query(query)
+        shards = self.manifest["shards"]
+        if plan.doc_numbers:
+            matched = [
+                name for name, info in shards.items()
+                if any(number in value for number in plan.doc_numbers for value in info["sources"] + info["bid_numbers"])
+            ]
+            if matched:
+                return matched
+
+        lowered = query.lower()
+        matched = [name for ministry, names in self._ministries.items() if ministry in lowered for name in names]
+        if matched:
+            return sorted(set(matched))
+        return list(shards)
+
+    def _search_shard(self, name, embedding, k, filter, fetch_k, kwargs):
+        return self.shard(name).similarity_search_with_score_by_vector(
+            embedding, k=k, filter=filter, fetch_k=fetch_k, **kwargs
+        )
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter=None, fetch_k: int = 20, **kwargs):
+        names = self.route(query)
+        SHARDS_SEARCHED.observe(len(names), key=self.key)
+        embedding = self.embeddings.embed_query(query)
+
+        if len(names) == 1:
+            results = [self._search_shard(names[0], embedding, k, filter, fetch_k, kwargs)]
+        else:
+            futures = [
+                _shard_executor.submit(
+                    contextvars.copy_context().run, self._search_shard, name, embedding, k, filter, fetch_k, kwargs
+                )
+                for name in names
+            ]
+            try:
+                results = [future.result(timeout=remaining()) for future in futures]
+            except FutureTimeoutError as e:
+                raise DeadlineExceeded("Shard fan-out ran out of request budget") from e
+
+        # Every shard uses the same distance, so lower is better across shards. A shared chunk
+        # comes back from each of its shards - keep its best hit only
+        best = {}
+        for hit in (hit for hits in results for hit in hits):
+            key = _chunk_key(hit[0])
+            if key not in best or hit[1] < best[key][1]:
+                best[key] = hit
+        return heapq.nsmallest(k, best.values(), key=lambda hit: hit[1])
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, fetch_k: int = 20, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter, fetch_k=fetch_k, **kwargs)]
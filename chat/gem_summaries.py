@@ -0,0 +1,113 @@
+"""
+Per-bid Summary Records
+One compact record per GeM bid (key fields plus a short extractive abstract),
+indexed in its own vector store so cross-document questions read N summaries
+instead of every raw chunk.
+"""
+import os
+import re
+from collections import Counter
+
+from langchain.schema import Document
+
+from .near_duplicates import chunk_sources
+
+GEM_SUMMARY_STORE_PATH = os.getenv("GEM_SUMMARY_STORE_PATH", "faiss_gem_summaries")
+
+SUMMARY_RECORD_TYPE = "bid_summary"
+
+DATE_TIME = r"([0-9]{2}-[0-9]{2}-[0-9]{4}\s+[0-9]{2}:[0-9]{2}:[0-9]{2})"
+
+# Field label -> pattern whose first group is the value
+SUMMARY_FIELDS = {
+    "Bid End Date/Time": re.compile(r"Bid End Date/Time[^\n]*?" + DATE_TIME, re.IGNORECASE),
+    "Bid Opening Date/Time": re.compile(r"Bid Opening Date/Time[^\n]*?" + DATE_TIME, re.IGNORECASE),
+    "Bid Offer Validity": re.compile(r"Bid Offer Validity[^\n]*?(\d+\s*\(?Days\)?)", re.IGNORECASE),
+    "Item Category": re.compile(r"Item Category[/\s]*([^\n]+?)(?:\s+Contract Period|\n|$)", re.IGNORECASE),
+    "Contract Period": re.compile(r"Contract Period\s*([^\n]+?)(?:\.|\n|$)", re.IGNORECASE),
+    "Evaluation Method": re.compile(r"Evaluation Method\s*([^\n.]+)", re.IGNORECASE),
+    "EMD Required": re.compile(r"EMD Detail[^\n]*?Required\s*(Yes|No)", re.IGNORECASE),
+    "ePBG Required": re.compile(r"ePBG Detail[^\n]*?Required\s*(Yes|No)", re.IGNORECASE),
+    "MSE Purchase Preference": re.compile(r"MSE Purchase Preference\s*(Yes|No)", re.IGNORECASE),
+    "Documents Required": re.compile(r"Documents required from seller\s*([^\n]+)", re.IGNORECASE),
+}
+
+METADATA_FIELDS = {"bid_number": "Bid Number", "ministry": "Ministry", "department": "Department", "category": "Category"}
+
+ABSTRACT_SENTENCES = 3
+ABSTRACT_MAX_CHARS = 500
+
+STOPWORDS = {
+    "the", "of", "and", "to", "in", "a", "is", "for", "by", "be", "with", "on", "as", "or",
+    "are", "at", "this", "that", "shall", "all", "any", "from", "an", "will", "not", "no",
+}
+
+
+def extract_fields(text: str) -> dict:
+    """First match of every summary field in the bid text"""
+    fields = {}
+    for label, pattern in SUMMARY_FIELDS.items():
+        match = pattern.search(text)
+        if match:
+            fields[label] = re.sub(r"\s+", " ", match.group(1)).strip()
+    return fields
+
+
+def extractive_abstract(text: str, sentences: int = ABSTRACT_SENTENCES) -> str:
+    """The highest-scoring sentences (by document word frequency), in document order"""
+    candidates = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n", text) if len(s.strip()) > 40]
+    if not candidates:
+        return ""
+
+    words = Counter(w for w in re.findall(r"[a-z]{3,}", text.lower()) if w not in STOPWORDS)
+    seen = set()
+    scored = []
+    for position, sentence in enumerate(candidates):
+        key = sentence.lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        tokens = [w for w in re.findall(r"[a-z]{3,}", key) if w not in STOPWORDS]
+        if tokens:
+            scored.append((sum(words[w] for w in tokens) / len(tokens), position, sentence))
+
+    best = sorted(sorted(scored, reverse=True)[:sentences], key=lambda item: item[1])
+    return " ".join(sentence for _, _, sentence in best)[:ABSTRACT_MAX_CHARS]
+
+
+def build_bid_summary(source: str, chunks) -> Document:
+    """Summary record for one bid from its chunks"""
+    chunks = sorted(chunks, key=lambda doc: doc.metadata.get("chunk_id", 0))
+    text = "\n".join(doc.page_content for doc in chunks)
+    base = chunks[0].metadata if chunks else {}
+
+    lines = [f"Source: {source}"]
+    metadata = {"source": source, "record_type": SUMMARY_RECORD_TYPE, "chunks": len(chunks)}
+    for key, label in METADATA_FIELDS.items():
+        if base.get(key):
+            lines.append(f"{label}: {base[key]}")
+            metadata[key] = base[key]
+
+    fields = extract_fields(text)
+    lines.extend(f"{label}: {value}" for label, value in fields.items())
+    metadata["fields"] = fields
+
+    abstract = extractive_abstract(text)
+    if abstract:
+        lines.append(f"Abstract: {abstract}")
+
+    return Document(page_content="\n".join(lines), metadata=metadata)
+
+
+def build_bid_summaries(documents):
+    """One summary record per source, in source order"""
+    by_source = {}
+    for doc in documents:
+        # Shared (deduplicated) chunks count towards every bid that contains them
+        for source in chunk_sources(doc.metadata):
+            by_source.setdefault(source or "unknown", []).append(doc)
+    return [build_bid_summary(source, chunks) for source, chunks in sorted(by_source.items())]
+
+
+def is_summary(doc) -> bool:
+    return doc.metadata.get("record_type") == SUMMARY_RECORD_TYPE
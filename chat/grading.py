@@ -0,0 +1,136 @@
+"""
+Score-gated Relevance Grading
+Retrieval keeps the FAISS distance of every chunk. Per-store thresholds
+(fitted by `manage.py calibrate_grading` from logged grader verdicts) let
+clearly relevant chunks skip the LLM grader and clearly irrelevant ones be
+dropped; only the ambiguous band in between is graded by the LLM.
+
+grading_thresholds.json:
+
+    {"faiss_gem_index": {"accept_below": 0.62, "reject_above": 1.15}}
+"""
+import json
+import logging
+import os
+import threading
+from typing import Any, List
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from .metrics import GRADE_DECISIONS
+
+GRADING_THRESHOLDS_PATH = os.getenv("GRADING_THRESHOLDS_PATH", "grading_thresholds.json")
+
+verdict_logger = logging.getLogger("chat.grading")
+
+_thresholds = None
+_thresholds_lock = threading.Lock()
+
+
+class ScoredRetriever(BaseRetriever):
+    """Vector store retriever that keeps the distance score on each returned chunk
+
+    Chunks are copies, so the docstore's cached Documents are never modified.
+    """
+
+    vectorstore: Any
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        store = getattr(self.vectorstore, "store_name", "faiss")
+        return [
+            Document(
+                page_content=doc.page_content,
+                metadata={**doc.metadata, "retrieval_score": float(score), "retrieval_store": store},
+            )
+            for doc, score in self.vectorstore.similarity_search_with_score(query, k=self.k)
+        ]
+
+
+def scores_of(documents):
+    """Distance score per document (None where the retrieval path had none)"""
+    return [doc.metadata.get("retrieval_score") for doc in documents]
+
+
+def load_thresholds(path: str = GRADING_THRESHOLDS_PATH) -> dict:
+    global _thresholds
+    with _thresholds_lock:
+        if _thresholds is None:
+            try:
+                with open(path) as f:
+                    _thresholds = json.load(f)
+                print(f"Loaded grading thresholds for {', '.join(_thresholds) or 'no stores'}")
+            except FileNotFoundError:
+                _thresholds = {}
+        return _thresholds
+
+
+def score_gate(doc, score) -> str:
+    """'accept', 'reject' or 'grade' (ask the LLM) for one retrieved chunk"""
+    store = doc.metadata.get("retrieval_store")
+    limits = load_thresholds().get(store) if store else None
+    if score is None or not limits:
+        decision = "grade"
+    elif score <= limits.get("accept_below", float("-inf")):
+        decision = "accept"
+    elif score >= limits.get("reject_above", float("inf")):
+        decision = "reject"
+    else:
+        decision = "grade"
+    GRADE_DECISIONS.inc(store=store or "none", decision=decision)
+    return decision
+
+
+def log_verdict(doc, score, verdict: str, domain: str):
+    """Record an LLM grader verdict for later calibration"""
+    verdict_logger.info(
+        "Grader verdict",
+        extra={
+            "store": doc.metadata.get("retrieval_store"),
+            "score": score,
+            "verdict": verdict,
+            "domain": domain,
+            "source": doc.metadata.get("source"),
+        },
+    )
+
+
+def fit_thresholds(verdicts, target_precision: float = 0.95, min_samples: int = 30) -> dict:
+    """Thresholds per store from (store, score, is_relevant) verdicts
+
+    accept_below is the largest distance under which at least target_precision
+    of graded chunks were relevant; reject_above is the smallest distance above
+    which at least target_precision were irrelevant.
+    """
+    by_store = {}
+    for store, score, relevant in verdicts:
+        by_store.setdefault(store, []).append((score, relevant))
+
+    thresholds = {}
+    for store, samples in by_store.items():
+        if len(samples) < min_samples:
+            continue
+        samples.sort()
+        limits = {}
+
+        relevant_so_far = 0
+        for count, (score, relevant) in enumerate(samples, start=1):
+            relevant_so_far += relevant
+            if relevant_so_far / count >= target_precision:
+                limits["accept_below"] = score
+
+        irrelevant_so_far = 0
+        for count, (score, relevant) in enumerate(reversed(samples), start=1):
+            irrelevant_so_far += not relevant
+            if irrelevant_so_far / count >= target_precision:
+                limits["reject_above"] = score
+
+        # Keep a band for the LLM between the two cut-offs
+        if "accept_below" in limits and "reject_above" in limits and limits["accept_below"] >= limits["reject_above"]:
+            continue
+        if limits:
+            limits["samples"] = len(samples)
+            thresholds[store] = limits
+    return thresholds
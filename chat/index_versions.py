@@ -0,0 +1,110 @@
+"""
+Versioned Index Directories
+A store path can hold immutable versions plus a CURRENT pointer:
+
+    faiss_gem_index/
+        CURRENT                  -> "20250901-101500-3fa2c1"
+        versions/20250901-101500-3fa2c1/{index.faiss, docstore.sqlite}
+
+Readers resolve CURRENT once per load; publishing a version only rewrites
+CURRENT (atomically), so a running process keeps serving the version it
+loaded until it reloads. Paths without CURRENT are read as plain stores.
+"""
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+CURRENT_FILENAME = "CURRENT"
+VERSIONS_DIRNAME = "versions"
+
+
+def is_versioned(root) -> bool:
+    return (Path(root) / CURRENT_FILENAME).exists()
+
+
+def current_version(root):
+    """Version name CURRENT points at, or None for a plain store"""
+    try:
+        return (Path(root) / CURRENT_FILENAME).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_store(root):
+    """(directory to load, version) for a store path"""
+    version = current_version(root)
+    return store_dir(root, version), version
+
+
+def store_dir(root, version) -> str:
+    """Directory holding `version` of a store (the root itself for unversioned stores)"""
+    return str(root) if version is None else str(Path(root) / VERSIONS_DIRNAME / version)
+
+
+def new_version_path(root) -> Path:
+    """Empty directory for the next version (not visible until published)"""
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+    path = Path(root) / VERSIONS_DIRNAME / name
+    path.mkdir(parents=True)
+    return path
+
+
+def publish(root, version_path):
+    """Point CURRENT at version_path"""
+    current = Path(root) / CURRENT_FILENAME
+    tmp = current.with_name(f".{CURRENT_FILENAME}.{uuid.uuid4().hex[:6]}")
+    tmp.write_text(Path(version_path).name + "\n")
+    os.replace(tmp, current)
+
+
+def list_versions(root) -> list:
+    path = Path(root) / VERSIONS_DIRNAME
+    return sorted(p.name for p in path.iterdir() if p.is_dir()) if path.exists() else []
+
+
+def prune_versions(root, keep: int = 3) -> list:
+    """Delete all but the newest `keep` versions (never the current one); returns the deleted names"""
+    current = current_version(root)
+    old = [name for name in list_versions(root)[:-keep] if name != current] if keep > 0 else []
+    for name in old:
+        shutil.rmtree(Path(root) / VERSIONS_DIRNAME / name)
+    return old
+
+
+def convert_in_place(root) -> Path:
+    """Move a plain store's files into its first version and publish it"""
+    root = Path(root)
+    version_path = new_version_path(root)
+    for entry in root.iterdir():
+        if entry.name != VERSIONS_DIRNAME:
+            shutil.move(str(entry), version_path / entry.name)
+    publish(root, version_path)
+    return version_path
+
+
+class IndexWatcher(threading.Thread):
+    """Polls store versions and calls on_change when any CURRENT pointer moves"""
+
+    def __init__(self, get_versions, on_change, interval: float):
+        super().__init__(name="index-watcher", daemon=True)
+        self.get_versions = get_versions
+        self.on_change = on_change
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        seen = self.get_versions()
+        while not self._stop_event.wait(self.interval):
+            try:
+                versions = self.get_versions()
+                if versions != seen:
+                    self.on_change()
+                    seen = versions  # only once loaded, so a failed reload is retried next poll
+            except Exception as e:
+                print(f"WARNING: Index reload failed, still serving the previous version: {e}")
+
+    def stop(self):
+        self._stop_event.set()
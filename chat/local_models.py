@@ -0,0 +1,77 @@
+"""
+Local Model Stand-ins
+Deterministic chat and embedding models with simulated latency, used by the
+benchmarks and load tests instead of the Gemini API
+"""
+import hashlib
+import re
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+def _simulated_delay(text: str, latency: float, jitter: float) -> float:
+    """Latency plus a jitter that is stable for the same input"""
+    if not jitter:
+        return latency
+    digest = hashlib.md5(text.encode("utf-8")).digest()
+    return latency + jitter * (digest[0] / 255.0)
+
+
+class LocalChatModel(BaseChatModel):
+    """Chat model that answers from the prompt itself"""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "local"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        time.sleep(_simulated_delay(prompt, self.latency, self.jitter))
+
+        human_messages = [m for m in messages if isinstance(m, HumanMessage)]
+        last_human = str(human_messages[-1].content) if human_messages else prompt
+
+        if "is_relevant" in prompt:
+            content = '{"is_relevant": "yes"}'
+        elif "Reformulate the user question" in prompt:
+            content = last_human
+        else:
+            content = f"Local answer based on {len(prompt)} prompt characters: {last_human[:200]}"
+
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+
+class LocalEmbeddings(Embeddings):
+    """Hashed bag-of-words embeddings - similar wording gives similar vectors"""
+
+    def __init__(self, size: int = 256, latency: float = 0.0, jitter: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.jitter = jitter
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            bucket = int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16) % self.size
+            vector[bucket] += 1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(_simulated_delay(text, self.latency, self.jitter))
+        return self._embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(_simulated_delay("".join(texts), self.latency, self.jitter))
+        return [self._embed(text) for text in texts]
@@ -0,0 +1,139 @@
+"""
+Non-blocking Log Pipeline
+Request threads only enqueue log records; one background writer thread formats
+them as JSON lines and does buffered, rotated writes to the log file
+"""
+import contextvars
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+_request_id = contextvars.ContextVar("chatbot_request_id", default="-")
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_STOP = object()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id=None):
+    """Tag every log line emitted inside this block with a request/task id"""
+    token = _request_id.set(request_id or new_request_id())
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """Captures the request id on the emitting thread"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per line, including any `extra=` fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """Rotating file handler that leaves flushing to the writer thread"""
+
+    def flush(self):
+        pass
+
+    def force_flush(self):
+        super().flush()
+
+
+class _LogWriter(threading.Thread):
+    def __init__(self, log_queue, handler, flush_interval):
+        super().__init__(name="chat-log-writer", daemon=True)
+        self.log_queue = log_queue
+        self.handler = handler
+        self.flush_interval = flush_interval
+
+    def run(self):
+        while True:
+            try:
+                record = self.log_queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self.handler.force_flush()
+                continue
+
+            if record is _STOP:
+                self.handler.force_flush()
+                return
+
+            try:
+                self.handler.handle(record)
+            except Exception:
+                self.handler.handleError(record)
+
+            if self.log_queue.empty():
+                self.handler.force_flush()
+
+
+class QueuedRotatingFileHandler(QueueHandler):
+    """Logging handler for the request path: enqueue and return"""
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, flush_interval=1.0):
+        # Created before the queue handler so logging.shutdown() closes it last
+        self.file_handler = BufferedRotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        self.file_handler.setFormatter(StructuredFormatter())
+        super().__init__(queue.SimpleQueue())
+        self.writer = _LogWriter(self.queue, self.file_handler, flush_interval)
+        self.writer.start()
+
+    def prepare(self, record):
+        # Resolve only what can't safely cross threads; JSON formatting happens on the writer thread
+        record = copy.copy(record)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = self.file_handler.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(_STOP)
+            self.writer.join(timeout=5)
+        self.file_handler.close()
+        super().close()
@@ -0,0 +1,173 @@
+"""
+Batch Question Answering
+Runs a JSONL file of questions through the graph on a worker pool and streams
+one JSONL result per question, with per-item stage timings. Question
+embeddings are computed in bulk, retrievals and grader verdicts are shared
+across the batch, and provider calls run at "batch" priority behind
+interactive traffic. The output file doubles as the checkpoint: --resume
+skips questions it already answered. Items answered by an identical item's
+run are marked "coalesced": their timings_ms are that run's stages and
+llm_calls is 0.
+
+    {"id": "q1", "question": "What is the EMD amount for bid GEM/2025/B/7893321?"}
+    {"id": "q2", "question": "How do I beat Yharon?", "user_choice": "calamity"}
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def load_items(path):
+    """Questions from JSONL; items without an 'id' are numbered by line"""
+    items = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            question = record.get("question") or record.get("title") or record.get("body")
+            if not question:
+                continue
+            items.append({
+                "id": str(record.get("id", number)),
+                "question": question,
+                "user_choice": record.get("user_choice", ""),
+            })
+    return items
+
+
+def completed_ids(path) -> set:
+    """Ids answered without error in an earlier run; drops the failed lines from the file"""
+    if not os.path.exists(path):
+        return set()
+    kept = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial line from an interrupted run
+            if "error" not in record:
+                kept.append(record)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        for record in kept:
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp, path)
+    return {record["id"] for record in kept}
+
+
+class Command(BaseCommand):
+    help = "Answer a JSONL file of questions through the chatbot graph and write JSONL results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="JSONL with 'question' (optional 'id', 'user_choice') per line")
+        parser.add_argument("output", help="JSONL results, written as items finish")
+        parser.add_argument("--concurrency", type=int, default=4, help="Questions answered in parallel")
+        parser.add_argument("--embedding-batch", type=int, default=64,
+                            help="Questions embedded per upstream call (0 = embed one by one)")
+        parser.add_argument("--budget", type=float, default=0.0,
+                            help="Per-question deadline in seconds (0 = none)")
+        parser.add_argument("--resume", action="store_true",
+                            help="Skip questions already answered in the output file and append")
+
+    def handle(self, *args, **options):
+        from benchmarks.runner import summarize
+        from chat.batch import BatchCache, batch_scope
+        from chat.chatbot_graph import chatbot_service, create_graph
+        from chat.rate_limit import priority
+
+        items = load_items(options["input"])
+        if not items:
+            raise CommandError(f"No questions in {options['input']}")
+        done = completed_ids(options["output"]) if options["resume"] else set()
+        pending = [item for item in items if item["id"] not in done]
+        self.stdout.write(f"{len(pending)} of {len(items)} questions to answer ({len(done)} already done)")
+
+        app = create_graph(checkpointer=None)
+        cache = BatchCache()
+        results = []
+        write_lock = threading.Lock()
+        window = options["embedding_batch"] or len(pending) or 1
+
+        started = time.perf_counter()
+        with open(options["output"], "a" if options["resume"] else "w") as out:
+            def write(future):
+                record = future.result()
+                with write_lock:
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    results.append(record)
+                    if len(results) % 50 == 0:
+                        self.stdout.write(f"  {len(results)}/{len(pending)} answered")
+
+            executor = ThreadPoolExecutor(max_workers=options["concurrency"], thread_name_prefix="answer-batch")
+            with batch_scope(cache), priority("batch"):
+                for start in range(0, len(pending), window):
+                    chunk = pending[start:start + window]
+                    if options["embedding_batch"]:
+                        self.prime_embeddings(chatbot_service.embeddings, cache, chunk)
+                    for item in chunk:
+                        future = executor.submit(contextvars.copy_context().run, self.answer, app, item, options["budget"])
+                        future.add_done_callback(write)
+            executor.shutdown(wait=True)
+        wall_time = time.perf_counter() - started
+
+        errors = [record for record in results if "error" in record]
+        latency = summarize([record["total_ms"] / 1000 for record in results if "error" not in record])
+        self.stdout.write("=" * 50)
+        self.stdout.write(f"Answered {len(results) - len(errors)}/{len(pending)} in {wall_time:.1f}s "
+                          f"({len(results) / wall_time if wall_time else 0:.2f} questions/s)")
+        if latency.get("count"):
+            self.stdout.write(f"Latency (ms):    p50 {latency['p50_ms']}  p95 {latency['p95_ms']}  max {latency['max_ms']}")
+        stats = cache.stats()
+        self.stdout.write(f"Batch cache: {stats['embeddings']} embeddings, {stats['retrievals']} retrievals, "
+                          f"{stats['grades']} grades")
+        for record in errors[:10]:
+            self.stdout.write(self.style.WARNING(f"  {record['id']}: {record['error']}"))
+        if errors:
+            self.stdout.write(self.style.WARNING(f"{len(errors)} failed - rerun with --resume to retry them"))
+        self.stdout.write("=" * 50)
+
+    def prime_embeddings(self, embeddings, cache, items):
+        """Embed a window of questions in one call so the classifier and retrievers find them cached"""
+        texts = cache.missing_embeddings([item["question"] for item in items])
+        if not texts:
+            return
+        try:
+            cache.add_embeddings(texts, embeddings.embed_queries(texts))
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"Bulk embedding failed, embedding per question: {e}"))
+
+    def answer(self, app, item, budget):
+        from chat.chatbot_graph import run_graph
+        from chat.log_pipeline import request_context
+        from chat.metrics import request_trace
+
+        record = {"id": item["id"], "question": item["question"]}
+        with request_context(f"batch-{item['id']}"), request_trace(path="batch") as trace:
+            try:
+                initial_state = {"question": item["question"], "chat_history": [], "user_choice": item["user_choice"]}
+                final_state = run_graph(app, initial_state, {"configurable": {"thread_id": f"batch-{item['id']}"}}, budget=budget) or {}
+                record.update({
+                    "answer": final_state.get("answer", ""),
+                    "question_type": final_state.get("question_type", ""),
+                    "generation_source": final_state.get("generation_source", ""),
+                    "degraded_stages": final_state.get("degraded_stages", []),
+                })
+            except Exception as e:
+                record["error"] = str(e) or type(e).__name__
+            record["total_ms"] = round((time.perf_counter() - trace.started) * 1000, 1)
+            timings = trace.timings
+            if trace.coalesced_from is not None:
+                record["coalesced"] = True
+                timings = trace.coalesced_from.timings
+            record["timings_ms"] = {name: round(seconds * 1000, 1) for name, seconds in dict(timings).items()}
+            record["llm_calls"] = trace.llm_calls
+        return record
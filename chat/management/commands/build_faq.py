@@ -0,0 +1,37 @@
+"""
+Build the FAQ index from chat feedback
+"""
+from django.core.management.base import BaseCommand
+
+from chat.faq import FAQ_CLUSTER_THRESHOLD, FAQ_INDEX_PATH, FAQ_MIN_VOTES, build_faq, save_faq
+from chat.models import ChatFeedback
+from chat.rate_limit import priority
+
+
+class Command(BaseCommand):
+    help = "Cluster thumbs-up questions from ChatFeedback into an FAQ index answered without the LLM"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=FAQ_INDEX_PATH, help="FAQ index folder")
+        parser.add_argument("--min-votes", type=int, default=FAQ_MIN_VOTES,
+                            help="Thumbs-up a question cluster needs to become an entry")
+        parser.add_argument("--cluster-threshold", type=float, default=FAQ_CLUSTER_THRESHOLD,
+                            help="Cosine similarity at which questions count as the same question")
+
+    def handle(self, *args, **options):
+        from chat.chatbot_service import chatbot_service
+
+        feedback = list(ChatFeedback.objects.values_list("question", "answer", "feedback_type"))
+        self.stdout.write(f"Read {len(feedback)} feedback records")
+
+        with priority("batch"):
+            entries, rows, matrix = build_faq(
+                feedback, chatbot_service.embeddings, classify=chatbot_service.classify_question_type,
+                min_votes=options["min_votes"], cluster_threshold=options["cluster_threshold"],
+            )
+        save_faq(entries, rows, matrix, options["output"])
+
+        for entry in entries:
+            self.stdout.write(f"{entry['votes']:4} votes  [{entry['domain']}] {entry['question'][:70]} "
+                              f"({len(entry['questions'])} phrasings)")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(entries)} FAQ entries to {options['output']}"))
@@ -0,0 +1,51 @@
+"""
+Split the GeM corpus into per-bid or per-ministry shards
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.gem_shards import GEM_SHARD_STORE_PATH, SHARD_KEYS, build_shards
+from chat.index_versions import is_versioned, new_version_path, publish
+from chat.rate_limit import priority
+
+
+class Command(BaseCommand):
+    help = "Build one GeM vector store per bid (or ministry) plus the routing manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--key", choices=SHARD_KEYS, default="bid", help="Shard by bid number or ministry")
+        parser.add_argument("--documents-dir", help="Read GeM PDFs from this folder instead of the loaded GeM index")
+        parser.add_argument("--output", default=GEM_SHARD_STORE_PATH, help="Shard directory")
+
+    def handle(self, *args, **options):
+        from chat.chatbot_service import chatbot_service
+
+        gem_db = chatbot_service.gem_db
+        if options["documents_dir"]:
+            from chat.pdf_processor import GeMPDFProcessor
+            documents = GeMPDFProcessor(options["documents_dir"]).process_all_pdfs()
+            if not documents:
+                raise CommandError("No GeM chunks found")
+            with priority("batch"):
+                vectors = chatbot_service.embeddings.embed_documents([doc.page_content for doc in documents])
+            items = list(zip(documents, vectors))
+        elif gem_db is not None and hasattr(gem_db, "index_to_docstore_id"):
+            # Reuse the stored vectors instead of embedding the corpus again
+            items = [
+                (gem_db.docstore.search(doc_id), gem_db.index.reconstruct(position))
+                for position, doc_id in gem_db.index_to_docstore_id.items()
+            ]
+        else:
+            raise CommandError("No unsharded GeM vector store loaded - pass --documents-dir")
+
+        # Versioned stores get a new version; running services pick it up on reload
+        if is_versioned(options["output"]):
+            version_path = new_version_path(options["output"])
+            manifest = build_shards(items, chatbot_service.embeddings, str(version_path), options["key"])
+            publish(options["output"], version_path)
+        else:
+            manifest = build_shards(items, chatbot_service.embeddings, options["output"], options["key"])
+        for name, info in manifest["shards"].items():
+            self.stdout.write(f"{name}: {info['vectors']} chunks from {len(info['sources'])} sources")
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(manifest['shards'])} shards by {options['key']} to {options['output']}"
+        ))
@@ -0,0 +1,47 @@
+"""
+Build the per-bid GeM summary store
+"""
+from django.core.management.base import BaseCommand, CommandError
+from langchain_community.vectorstores import FAISS
+
+from chat.docstore import save_vector_store
+from chat.gem_summaries import GEM_SUMMARY_STORE_PATH, build_bid_summaries
+from chat.index_versions import is_versioned, new_version_path, publish
+from chat.rate_limit import priority
+
+
+class Command(BaseCommand):
+    help = "Build one summary record per GeM bid and index them in their own vector store"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents-dir", help="Read GeM PDFs from this folder instead of the loaded GeM index")
+        parser.add_argument("--output", default=GEM_SUMMARY_STORE_PATH, help="Summary vector store folder")
+
+    def handle(self, *args, **options):
+        from chat.chatbot_service import chatbot_service
+
+        if options["documents_dir"]:
+            from chat.pdf_processor import GeMPDFProcessor
+            documents = GeMPDFProcessor(options["documents_dir"]).process_all_pdfs()
+        elif chatbot_service.gem_db is not None and hasattr(chatbot_service.gem_db.docstore, "iter_documents"):
+            documents = chatbot_service.gem_db.docstore.iter_documents()
+        else:
+            raise CommandError("No GeM vector store loaded - pass --documents-dir")
+
+        if not documents:
+            raise CommandError("No GeM chunks found")
+
+        summaries = build_bid_summaries(documents)
+        with priority("batch"):
+            db = FAISS.from_documents(summaries, chatbot_service.embeddings)
+        # Versioned stores get a new version; running services pick it up on reload
+        if is_versioned(options["output"]):
+            version_path = new_version_path(options["output"])
+            save_vector_store(db, str(version_path))
+            publish(options["output"], version_path)
+        else:
+            save_vector_store(db, options["output"])
+
+        for summary in summaries:
+            self.stdout.write(f"{summary.metadata['source']}: {len(summary.metadata['fields'])} fields from {summary.metadata['chunks']} chunks")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(summaries)} bid summaries to {options['output']}"))
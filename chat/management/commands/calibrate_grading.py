@@ -0,0 +1,58 @@
+"""
+Fit score-gated grading thresholds from logged grader verdicts
+"""
+import glob
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.grading import GRADING_THRESHOLDS_PATH, fit_thresholds
+
+
+def read_verdicts(paths):
+    """(store, score, is_relevant) from the 'chat.grading' lines of JSON log files"""
+    verdicts = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("logger") != "chat.grading" or entry.get("score") is None:
+                    continue
+                if entry.get("verdict") not in ("yes", "no"):
+                    continue
+                verdicts.append((entry.get("store"), float(entry["score"]), entry["verdict"] == "yes"))
+    return verdicts
+
+
+class Command(BaseCommand):
+    help = "Fit per-store accept/reject distance thresholds from grader verdicts in the chat log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("logs", nargs="*", help="Log files (default: the chat log and its rotated backups)")
+        parser.add_argument("--output", default=GRADING_THRESHOLDS_PATH)
+        parser.add_argument("--precision", type=float, default=0.95, help="Required precision of each cut-off")
+        parser.add_argument("--min-samples", type=int, default=30, help="Verdicts needed per store")
+
+    def handle(self, *args, **options):
+        paths = options["logs"]
+        if not paths:
+            log_file = settings.LOGGING["handlers"]["chat_file"]["filename"]
+            paths = sorted(glob.glob(f"{log_file}*"))
+        if not paths:
+            raise CommandError("No log files found")
+
+        verdicts = read_verdicts(paths)
+        self.stdout.write(f"Read {len(verdicts)} grader verdicts from {len(paths)} file(s)")
+        thresholds = fit_thresholds(verdicts, options["precision"], options["min_samples"])
+        if not thresholds:
+            raise CommandError(f"Not enough verdicts to fit thresholds (need {options['min_samples']} per store)")
+
+        with open(options["output"], "w") as f:
+            json.dump(thresholds, f, indent=2)
+        for store, limits in thresholds.items():
+            self.stdout.write(f"{store}: {limits}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']} - restart the server to apply"))
@@ -0,0 +1,282 @@
+"""
+Load Test Harness
+Replays recorded or synthetic question streams against the chat endpoints at a
+configurable concurrency and arrival rate
+"""
+import http.cookiejar
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+ERROR_ANSWERS = (
+    "I'm experiencing technical difficulties",
+    "Configuration error: Please contact the administrator",
+)
+
+
+def load_questions(path):
+    """Questions from JSONL: 'question', else 'title'/'body' of recorded requests"""
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            question = record.get("question") or record.get("title") or record.get("body")
+            if question:
+                questions.append(question[:1000])
+    return questions
+
+
+class TestClientTransport:
+    """In-process requests through the Django test client"""
+
+    def __init__(self):
+        from django.conf import settings
+        from django.test import Client
+        host = next((h for h in settings.ALLOWED_HOSTS if h and h != "*" and not h.startswith(".")), "localhost")
+        self.client = Client(HTTP_HOST=host)
+        self.client.get("/chat/")  # creates the session
+
+    def post_form(self, path, data):
+        response = self.client.post(path, data)
+        return response.status_code, response.content.decode("utf-8", "replace")
+
+    def post_json(self, path, payload):
+        response = self.client.post(path, json.dumps(payload), content_type="application/json")
+        return response.status_code, response.content.decode("utf-8", "replace")
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.content.decode("utf-8", "replace")
+
+
+class HttpTransport:
+    """Requests against a running server, with its own session and CSRF cookie"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.get("/chat/")
+
+    def _csrf_headers(self):
+        token = next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+        return {"X-CSRFToken": token, "Referer": self.base_url + "/chat/"}
+
+    def _send(self, request):
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode("utf-8", "replace")
+
+    def post_form(self, path, data):
+        body = urllib.parse.urlencode(data).encode("utf-8")
+        return self._send(urllib.request.Request(self.base_url + path, data=body, headers=self._csrf_headers()))
+
+    def post_json(self, path, payload):
+        headers = dict(self._csrf_headers(), **{"Content-Type": "application/json"})
+        body = json.dumps(payload).encode("utf-8")
+        return self._send(urllib.request.Request(self.base_url + path, data=body, headers=headers))
+
+    def get(self, path):
+        return self._send(urllib.request.Request(self.base_url + path))
+
+
+class Command(BaseCommand):
+    help = "Replay question streams against chat_view / async_chat_view and report throughput and latency"
+    # The URL checks import chat.views, which builds the ChatbotService before
+    # handle() can select the local stand-ins
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", help="JSONL file with 'question' (or 'title'/'body') per line")
+        parser.add_argument("--mode", choices=["chat", "async", "mixed"], default="chat",
+                            help="chat = POST /chat/, async = POST /chat/async/ + poll status, mixed = both")
+        parser.add_argument("--requests", type=int, default=50, help="Total requests to send")
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker threads / open sessions")
+        parser.add_argument("--rate", type=float, default=0.0,
+                            help="Arrival rate in requests/second (0 = closed loop, send as fast as workers allow)")
+        parser.add_argument("--poisson", action="store_true", help="Exponential inter-arrival times instead of fixed")
+        parser.add_argument("--base-url", help="Target a running server instead of the in-process test client")
+        parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (seconds)")
+        parser.add_argument("--poll-interval", type=float, default=0.2, help="Async status poll interval (seconds)")
+        parser.add_argument("--real-llm", action="store_true", help="Use the configured provider instead of local stand-ins")
+        parser.add_argument("--llm-latency", type=float, default=0.3, help="Local stand-in LLM latency (seconds)")
+        parser.add_argument("--embedding-latency", type=float, default=0.05, help="Local stand-in embedding latency (seconds)")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Write the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["base_url"]:
+            if not options["real_llm"]:
+                self.stdout.write("Note: start the target server with CHATBOT_MODEL_PROVIDER=local to use the stand-ins")
+        elif not options["real_llm"]:
+            # Read by ChatbotService when chat.views is first imported, on the first request
+            os.environ.update({
+                "CHATBOT_MODEL_PROVIDER": "local",
+                "LOCAL_LLM_LATENCY": str(options["llm_latency"]),
+                "LOCAL_EMBEDDING_LATENCY": str(options["embedding_latency"]),
+            })
+
+        if options["questions"]:
+            questions = load_questions(options["questions"])
+        else:
+            from benchmarks.questions import QUESTIONS
+            questions = [item["question"] for item in QUESTIONS]
+        if not questions:
+            raise CommandError("No questions to replay")
+
+        rng = random.Random(options["seed"])
+        plan = [rng.choice(questions) for _ in range(options["requests"])]
+        report = self.run(plan, options, rng)
+
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def make_transport(self, options):
+        if options["base_url"]:
+            return HttpTransport(options["base_url"], options["timeout"])
+        return TestClientTransport()
+
+    def run(self, plan, options, rng):
+        from benchmarks.runner import summarize
+        from chat.metrics import ASYNC_TASKS_IN_FLIGHT
+
+        local = threading.local()
+        results = []
+        results_lock = threading.Lock()
+        mode = options["mode"]
+
+        def worker(index, question):
+            if not hasattr(local, "transport"):
+                local.transport = self.make_transport(options)
+            request_mode = mode if mode != "mixed" else ("chat" if index % 2 == 0 else "async")
+            start = time.perf_counter()
+            try:
+                if request_mode == "chat":
+                    ok = self.send_chat(local.transport, question)
+                else:
+                    ok = self.send_async(local.transport, question, options)
+                error = None if ok else "error response"
+            except Exception as e:
+                ok, error = False, str(e)
+            with results_lock:
+                results.append({
+                    "mode": request_mode,
+                    "latency": time.perf_counter() - start,
+                    "ok": ok,
+                    "error": error,
+                })
+
+        samples = []
+        stop_sampling = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=options["concurrency"])
+
+        def sampler():
+            while not stop_sampling.wait(0.25):
+                samples.append({
+                    "threads": threading.active_count(),
+                    "queued": executor._work_queue.qsize(),
+                    "async_in_flight": ASYNC_TASKS_IN_FLIGHT.value(),
+                })
+
+        sampling_thread = threading.Thread(target=sampler, daemon=True)
+        sampling_thread.start()
+
+        started = time.perf_counter()
+        next_arrival = started
+        for index, question in enumerate(plan):
+            if options["rate"] > 0:
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_arrival += rng.expovariate(options["rate"]) if options["poisson"] else 1.0 / options["rate"]
+            executor.submit(worker, index, question)
+
+        executor.shutdown(wait=True)
+        wall_time = time.perf_counter() - started
+        stop_sampling.set()
+        sampling_thread.join()
+
+        latencies = [r["latency"] for r in results if r["ok"]]
+        errors = [r for r in results if not r["ok"]]
+        by_mode = {}
+        for request_mode in sorted({r["mode"] for r in results}):
+            by_mode[request_mode] = summarize([r["latency"] for r in results if r["mode"] == request_mode and r["ok"]])
+
+        def peak(key):
+            return max((s[key] for s in samples), default=0)
+
+        def mean(key):
+            return round(sum(s[key] for s in samples) / len(samples), 2) if samples else 0
+
+        return {
+            "config": {key: options[key] for key in ("mode", "requests", "concurrency", "rate", "poisson", "base_url", "real_llm", "llm_latency")},
+            "wall_time_s": round(wall_time, 3),
+            "throughput_rps": round(len(latencies) / wall_time, 3) if wall_time else 0,
+            "error_rate": round(len(errors) / len(results), 4) if results else 0,
+            "errors": sorted({e["error"] for e in errors if e["error"]})[:10],
+            "latency": summarize(latencies),
+            "latency_by_mode": by_mode,
+            "threads": {"peak": peak("threads"), "mean": mean("threads")},
+            "client_queue": {"peak": peak("queued"), "mean": mean("queued")},
+            "async_in_flight": {"peak": peak("async_in_flight"), "mean": mean("async_in_flight")},
+        }
+
+    def send_chat(self, transport, question):
+        status, body = transport.post_form("/chat/", {"question": question})
+        return status == 200 and not any(marker in body for marker in ERROR_ANSWERS)
+
+    def send_async(self, transport, question, options):
+        status, body = transport.post_json("/chat/async/", {"question": question})
+        if status != 200:
+            return False
+        data = json.loads(body)
+        if data.get("status") != "processing":
+            return False
+
+        deadline = time.perf_counter() + options["timeout"]
+        while time.perf_counter() < deadline:
+            time.sleep(options["poll_interval"])
+            status, body = transport.get(f"/chat/status/{data['task_id']}/")
+            result = json.loads(body) if status == 200 else {"status": "error"}
+            if result.get("status") == "completed":
+                return True
+            if result.get("status") in ("error", "not_found"):
+                return False
+        return False
+
+    def print_report(self, report):
+        latency = report["latency"]
+        self.stdout.write("=" * 50)
+        self.stdout.write(f"Requests/second: {report['throughput_rps']}  (wall time {report['wall_time_s']}s)")
+        self.stdout.write(f"Error rate:      {report['error_rate'] * 100:.1f}%")
+        if latency.get("count"):
+            self.stdout.write(
+                f"Latency (ms):    p50 {latency['p50_ms']}  p95 {latency['p95_ms']}  "
+                f"p99 {latency['p99_ms']}  max {latency['max_ms']}"
+            )
+        for request_mode, stats in report["latency_by_mode"].items():
+            if stats.get("count"):
+                self.stdout.write(f"  {request_mode:6} p50 {stats['p50_ms']}  p95 {stats['p95_ms']}  p99 {stats['p99_ms']}")
+        self.stdout.write(
+            f"Threads peak {report['threads']['peak']}, client queue peak {report['client_queue']['peak']}, "
+            f"async tasks in flight peak {report['async_in_flight']['peak']}"
+        )
+        for error in report["errors"]:
+            self.stdout.write(self.style.WARNING(f"  error: {error}"))
+        self.stdout.write("=" * 50)
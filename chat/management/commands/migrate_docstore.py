@@ -0,0 +1,21 @@
+"""
+Convert pickled FAISS docstores into the SQLite docstore
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.docstore import migrate_legacy_store
+
+
+class Command(BaseCommand):
+    help = "Convert index.pkl docstores into docstore.sqlite so they load without unpickling"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Vector store folders, e.g. faiss_gem_index")
+
+    def handle(self, *args, **options):
+        for path in options["paths"]:
+            try:
+                count = migrate_legacy_store(path)
+            except FileNotFoundError as e:
+                raise CommandError(f"{path}: {e}")
+            self.stdout.write(self.style.SUCCESS(f"{path}: migrated {count} chunks to SQLite docstore"))
@@ -0,0 +1,41 @@
+"""
+Publish a built vector store as the next version of a store path
+"""
+import shutil
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.index_versions import convert_in_place, is_versioned, new_version_path, prune_versions, publish
+
+
+class Command(BaseCommand):
+    help = "Copy a built store into <store>/versions/ and point <store>/CURRENT at it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("store", help="Store path the service loads, e.g. faiss_gem_index")
+        parser.add_argument("--from", dest="source", help="Built store folder to publish (omit to convert <store> in place)")
+        parser.add_argument("--keep", type=int, default=3, help="Versions to keep (0 = keep all)")
+
+    def handle(self, *args, **options):
+        store = Path(options["store"])
+
+        if options["source"] is None:
+            if is_versioned(store):
+                raise CommandError(f"{store} is already versioned - pass --from with a new build")
+            if not store.is_dir():
+                raise CommandError(f"No store at {store}")
+            version_path = convert_in_place(store)
+        else:
+            source = Path(options["source"])
+            if not source.is_dir():
+                raise CommandError(f"No built store at {source}")
+            if store.exists() and not is_versioned(store):
+                convert_in_place(store)
+            version_path = new_version_path(store)
+            shutil.copytree(source, version_path, dirs_exist_ok=True)
+            publish(store, version_path)
+
+        self.stdout.write(self.style.SUCCESS(f"{store} now points at {version_path.name}"))
+        for name in prune_versions(store, options["keep"]):
+            self.stdout.write(f"Removed old version {name}")
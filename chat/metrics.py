@@ -0,0 +1,300 @@
+"""
+In-process Metrics and Tracing Spans
+Latency histograms and counters rendered in Prometheus text format, plus
+per-request stage timings for the Server-Timing header
+"""
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    pairs = list(label_key) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] += amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] += amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self, **labels):
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return dict(series, buckets=list(series["buckets"])) if series else None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']:g}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "chatbot_stage_seconds", "Latency of graph nodes, LLM calls, embedding calls and vector searches"
+)
+REQUEST_SECONDS = REGISTRY.histogram("chatbot_request_seconds", "End-to-end request latency")
+LLM_CALLS = REGISTRY.counter("chatbot_llm_calls_total", "LLM calls made")
+LLM_CALLS_PER_REQUEST = REGISTRY.histogram(
+    "chatbot_llm_calls_per_request", "LLM calls made while serving one request", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+)
+EMBEDDING_CALLS = REGISTRY.counter("chatbot_embedding_calls_total", "Embedding calls made")
+CACHE_REQUESTS = REGISTRY.counter("chatbot_cache_requests_total", "Cache lookups by cache and result")
+LLM_IN_FLIGHT = REGISTRY.gauge("chatbot_llm_in_flight", "LLM calls currently running, by role")
+HEDGED_CALLS = REGISTRY.counter("chatbot_hedged_calls_total", "Hedged LLM calls by role and outcome")
+CIRCUIT_STATE = REGISTRY.gauge("chatbot_circuit_state", "Circuit breaker state (0 closed, 1 open, 2 half-open)")
+DEGRADED_ANSWERS = REGISTRY.counter("chatbot_degraded_answers_total", "Answers served from a fallback path")
+DEGRADED_STAGES = REGISTRY.counter(
+    "chatbot_degraded_stages_total", "Stages skipped or cut short because the request deadline was near"
+)
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    "chatbot_rate_limit_wait_seconds", "Time spent queued for provider quota, by limiter and priority"
+)
+RATE_LIMIT_QUEUE_DEPTH = REGISTRY.gauge("chatbot_rate_limit_queue_depth", "Calls waiting for provider quota")
+COALESCED_CALLS = REGISTRY.counter(
+    "chatbot_coalesced_calls_total", "Calls served from an identical call already in flight"
+)
+ASYNC_TASKS_IN_FLIGHT = REGISTRY.gauge("chatbot_async_tasks_in_flight", "Async chat tasks currently running")
+GRADE_DECISIONS = REGISTRY.counter(
+    "chatbot_grade_decisions_total", "Relevance decisions per chunk: accept/reject by score, or grade by LLM"
+)
+SPECULATIVE_RETRIEVALS = REGISTRY.counter(
+    "chatbot_speculative_retrievals_total", "Speculative retrievals by outcome (used, wasted, cancelled)"
+)
+SPECULATION_SAVED_SECONDS = REGISTRY.histogram(
+    "chatbot_speculation_saved_seconds", "Latency saved by retrieving while classifying"
+)
+SPECULATION_WASTED_SECONDS = REGISTRY.histogram(
+    "chatbot_speculation_wasted_seconds", "Time spent on speculative retrievals that were discarded"
+)
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "chatbot_context_tokens", "Estimated prompt context tokens before and after packing",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+CHUNKS_RETRIEVED = REGISTRY.histogram(
+    "chatbot_chunks_retrieved", "Chunks returned by the retrieve node", buckets=(0, 1, 3, 5, 10, 20, 50, 100, 200)
+)
+INDEX_RELOADS = REGISTRY.counter("chatbot_index_reloads_total", "Vector store reloads by outcome (swapped, failed)")
+INDEX_RELOAD_SECONDS = REGISTRY.histogram(
+    "chatbot_index_reload_seconds", "Time to load and warm a new index version before swapping it in"
+)
+DOMAIN_STORE_LOADS = REGISTRY.counter("chatbot_domain_store_loads_total", "Domain vector stores loaded on first use")
+DOMAIN_STORE_EVICTIONS = REGISTRY.counter(
+    "chatbot_domain_store_evictions_total", "Domain vector stores evicted to stay within the memory budget"
+)
+DOMAIN_STORE_BYTES = REGISTRY.gauge("chatbot_domain_store_bytes", "Index bytes of the domain stores currently loaded")
+PROFILES_CAPTURED = REGISTRY.counter("chatbot_profiles_captured_total", "Request profiles written, by profiler")
+FAST_PATH_LOOKUPS = REGISTRY.counter("chatbot_fast_path_lookups_total", "Questions checked by the fast-path answerers, by result")
+FAST_PATH_ANSWERS = REGISTRY.counter("chatbot_fast_path_answers_total", "Questions answered on the fast path, by answerer")
+FAST_PATH_SAVED_SECONDS = REGISTRY.histogram(
+    "chatbot_fast_path_saved_seconds", "Typical general-question graph time minus fast-path time, per fast-path answer"
+)
+FAQ_LOOKUPS = REGISTRY.counter("chatbot_faq_lookups_total", "Questions checked against the FAQ index, by result")
+FAQ_ENTRIES_DROPPED = REGISTRY.counter("chatbot_faq_entries_dropped_total", "FAQ entries dropped after negative feedback")
+SHARDS_SEARCHED = REGISTRY.histogram(
+    "chatbot_gem_shards_searched", "GeM shards searched per query, by shard key",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096),
+)
+
+
+class RequestTrace:
+    """Stage timings collected while one request is being served"""
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.llm_calls = 0
+        self.domain = ""
+        self.path = ""  # bounded label for the request metrics, e.g. a URL name
+        self.profile = None  # RequestProfile while this request is being profiled
+        self.coalesced_from = None  # trace of the identical in-flight run that answered this request
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            self.timings[name] += duration
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds"""
+        with self._lock:
+            parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_trace = contextvars.ContextVar("chatbot_request_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def request_trace(path=""):
+    """Collect stage timings for everything run inside this block"""
+    trace = RequestTrace()
+    trace.path = path
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        REQUEST_SECONDS.observe(time.perf_counter() - trace.started, path=trace.path)
+        LLM_CALLS_PER_REQUEST.observe(trace.llm_calls, path=trace.path)
+
+
+@contextmanager
+def span(kind, name, **labels):
+    """Time a block as a stage of the current request"""
+    trace = _current_trace.get()
+    domain = labels.pop("domain", None) or (trace.domain if trace else "")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, kind=kind, stage=name, domain=domain, **labels)
+        if trace is not None:
+            trace.add(name, duration)
+
+
+def traced_node(name):
+    """Decorator timing a graph node (and profiling it in sampled requests); records the domain once it is known"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(state, *args, **kwargs):
+            trace = _current_trace.get()
+            profile = trace.profile if trace is not None else None
+            with span("node", name), (profile.node(name) if profile is not None else nullcontext()):
+                result = func(state, *args, **kwargs)
+            if trace is not None and isinstance(result, dict) and result.get("question_type"):
+                trace.domain = result["question_type"]
+            return result
+        return wrapper
+    return decorator
+
+
+def record_llm_call(role="default"):
+    LLM_CALLS.inc(role=role)
+    trace = _current_trace.get()
+    if trace is not None:
+        with trace._lock:
+            trace.llm_calls += 1
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
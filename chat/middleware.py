@@ -0,0 +1,44 @@
+"""
+Request Instrumentation Middleware
+"""
+from contextlib import nullcontext
+
+from django.conf import settings
+
+from .log_pipeline import new_request_id, request_context
+from .metrics import request_trace
+from .profiling import profile_request, should_profile
+
+# Endpoints never worth profiling (scrapes, polling, the profile summary itself)
+UNPROFILED_PATHS = ("/metrics/", "/status/", "/admin/profiles/")
+UNMATCHED = "unmatched"
+
+
+def route_label(request) -> str:
+    """URL name of the matched route, so /status/<task_id>/ polls and 404s don't each add a metric series"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return UNMATCHED
+    return match.url_name or match.route or UNMATCHED
+
+
+class ServerTimingMiddleware:
+    """Tags logs with a request id and reports per-stage timings in Server-Timing
+
+    Sampled requests (see chat.profiling) are also profiled per graph node.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get("X-Request-ID") or new_request_id()
+        profiled = not any(part in request.path for part in UNPROFILED_PATHS) and should_profile(request, settings.DEBUG)
+        with request_context(request_id), request_trace(path=UNMATCHED) as trace:
+            with profile_request(request_id, request.path) if profiled else nullcontext({}) as outcome:
+                response = self.get_response(request)
+                outcome["status"] = response.status_code
+            trace.path = route_label(request)
+            response["Server-Timing"] = trace.server_timing()
+            response["X-Request-ID"] = request_id
+        return response
@@ -0,0 +1,72 @@
+"""
+Per-role Model Configuration
+Each LLM role can run on its own model with its own timeout, output limit
+and concurrency limit, e.g.:
+
+    CHATBOT_MODEL_GRADE=gemini-1.5-flash-8b
+    CHATBOT_GRADE_TIMEOUT=10
+    CHATBOT_GRADE_MAX_TOKENS=64
+    CHATBOT_GRADE_CONCURRENCY=8
+    CHATBOT_GRADE_HEDGE=true            # duplicate calls slower than the role's p95
+    CHATBOT_GRADE_BREAKER_FAILURES=5    # consecutive failures before failing fast
+    CHATBOT_GRADE_BREAKER_RESET=30      # seconds before a trial call is let through
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+# rewrite   - history-aware question rewriting
+# grade     - document relevance grading
+# classify  - question routing
+# generate  - answer generation
+# summarize - merges and summaries
+MODEL_ROLES = ("rewrite", "grade", "classify", "generate", "summarize")
+
+ROLE_DEFAULTS = {
+    "rewrite": {"timeout": 15.0, "max_output_tokens": 256},
+    "grade": {"timeout": 10.0, "max_output_tokens": 64},
+    "classify": {"timeout": 10.0, "max_output_tokens": 32},
+    "generate": {"timeout": 60.0, "max_output_tokens": None},
+    "summarize": {"timeout": 30.0, "max_output_tokens": 1024},
+}
+
+
+@dataclass
+class ModelRoleConfig:
+    role: str
+    model: str
+    temperature: float
+    timeout: float
+    max_output_tokens: Optional[int]
+    max_concurrency: int
+    hedge: bool
+    hedge_quantile: float
+    breaker_failures: int
+    breaker_reset: float
+
+
+def _env(role, name, default):
+    return os.getenv(f"CHATBOT_{role.upper()}_{name}", default)
+
+
+def load_role_config(role: str) -> ModelRoleConfig:
+    defaults = ROLE_DEFAULTS[role]
+    max_tokens = _env(role, "MAX_TOKENS", defaults["max_output_tokens"])
+    return ModelRoleConfig(
+        role=role,
+        model=os.getenv(f"CHATBOT_MODEL_{role.upper()}", os.getenv("CHATBOT_MODEL", DEFAULT_MODEL)),
+        temperature=float(_env(role, "TEMPERATURE", 0.1)),
+        timeout=float(_env(role, "TIMEOUT", defaults["timeout"])),
+        max_output_tokens=int(max_tokens) if max_tokens else None,
+        max_concurrency=int(_env(role, "CONCURRENCY", 16)),
+        hedge=_env(role, "HEDGE", "true").lower() == "true",
+        hedge_quantile=float(_env(role, "HEDGE_QUANTILE", 0.95)),
+        breaker_failures=int(_env(role, "BREAKER_FAILURES", 5)),
+        breaker_reset=float(_env(role, "BREAKER_RESET", 30)),
+    )
+
+
+def load_role_configs():
+    return {role: load_role_config(role) for role in MODEL_ROLES}
@@ -0,0 +1,178 @@
+"""
+Instrumented Model Wrappers
+Every LLM and embedding call made by the service goes through these
+"""
+import inspect
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable
+
+from .batch import batch_cache
+from .deadline import DeadlineExceeded, clamp_timeout
+from .metrics import EMBEDDING_CALLS, LLM_IN_FLIGHT, record_llm_call, span
+from .resilience import CircuitBreaker, LatencyTracker, UpstreamError, hedged_call
+from .singleflight import SingleFlight
+
+# Embedding calls running at once under a request deadline
+EMBEDDING_CONCURRENCY = int(os.getenv("CHATBOT_EMBEDDING_CONCURRENCY", "16"))
+
+
+def _prompt_key(input):
+    """Stable text form of an LLM input for coalescing identical calls"""
+    if isinstance(input, str):
+        return input
+    if isinstance(input, PromptValue):
+        return input.to_string()
+    if isinstance(input, (list, tuple)):
+        return "\n".join(f"{getattr(m, 'type', '')}:{getattr(m, 'content', m)}" for m in input)
+    return repr(input)
+
+
+class TracedChatModel(Runnable):
+    """Runnable wrapper around a chat model that records a span per call
+
+    Identical concurrent prompts share one upstream call, and calls run on
+    the role's own pool of max_concurrency threads. Calls slower than the
+    role's recent p95 get a hedged duplicate, and a circuit breaker fails fast
+    with CircuitOpenError while the upstream keeps failing; provider errors
+    are raised as UpstreamError. Each call waits
+    for provider quota from the shared scheduler first, and its timeout is
+    cut to whatever is left of the request deadline.
+    """
+
+    def __init__(self, model, role: str = "default", role_config=None, scheduler=None):
+        self.model = model
+        self.role = role
+        self.role_config = role_config
+        self.scheduler = scheduler
+        max_concurrency = role_config.max_concurrency if role_config else 16
+        self._inflight = SingleFlight(f"llm:{role}")
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"llm-{role}")
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            f"llm:{role}",
+            failure_threshold=role_config.breaker_failures if role_config else 5,
+            reset_timeout=role_config.breaker_reset if role_config else 30.0,
+        )
+
+    def invoke(self, input, config=None, **kwargs):
+        key = (_prompt_key(input), repr(sorted(kwargs.items())))
+        return self._inflight.do(key, lambda: self._call(input, config, **kwargs))
+
+    def _call(self, input, config=None, **kwargs):
+        role_timeout = self.role_config.timeout if self.role_config else None
+        clamp_timeout(role_timeout, f"{self.role} call")
+        self.breaker.before_call()
+        # Quota wait happens before the timeout starts so queueing never trips the breaker.
+        # Any failure before the upstream is called gives back a half-open trial slot.
+        try:
+            if self.scheduler:
+                self.scheduler.acquire()
+            timeout, clamped = clamp_timeout(role_timeout, f"{self.role} call")
+        except BaseException:
+            self.breaker.release()
+            raise
+
+        hedge_after = None
+        if self.role_config and self.role_config.hedge:
+            hedge_after = self.latency.quantile(self.role_config.hedge_quantile)
+
+        attempts = itertools.count()
+
+        def attempt():
+            if next(attempts) and self.scheduler:
+                self.scheduler.acquire()  # a hedged duplicate is a second provider call
+            return self._attempt(input, config, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            result = hedged_call(
+                attempt, self._executor,
+                hedge_after=hedge_after, timeout=timeout, label=self.role,
+            )
+        except TimeoutError as e:
+            if clamped:
+                # Our deadline ran out, not the upstream's patience - don't count it against the breaker
+                self.breaker.release()
+                raise DeadlineExceeded(f"{self.role} call ran out of request budget") from e
+            self.breaker.record_failure()
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            raise UpstreamError(f"{self.role} call failed: {e}") from e
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        self.latency.observe(time.perf_counter() - start)
+        return result
+
+    def _attempt(self, input, config=None, **kwargs):
+        record_llm_call(self.role)
+        LLM_IN_FLIGHT.inc(role=self.role)
+        try:
+            with span("llm", "llm", role=self.role):
+                return self.model.invoke(input, config, **kwargs)
+        finally:
+            LLM_IN_FLIGHT.dec(role=self.role)
+
+
+class TracedEmbeddings(Embeddings):
+    """Embeddings wrapper that records a span per call
+
+    Identical concurrent texts share one upstream call. Under a request
+    deadline the call is abandoned once the deadline passes. Inside a batch,
+    queries embedded ahead of time by embed_queries are served from the
+    batch cache.
+    """
+
+    def __init__(self, embeddings, scheduler=None):
+        self.embeddings = embeddings
+        self.scheduler = scheduler
+        self._inflight = SingleFlight("embedding")
+        self._executor = ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY, thread_name_prefix="embedding")
+
+    def embed_query(self, text):
+        cache = batch_cache()
+        vector = cache.embedding(text) if cache is not None else None
+        if vector is not None:
+            return vector
+        return self._inflight.do(("query", text), lambda: self._embed_query(text))
+
+    def embed_queries(self, texts):
+        """Query embeddings for many texts in one upstream call"""
+        embed = self.embeddings.embed_documents
+        # Document embeddings can differ from query embeddings (Gemini task types)
+        if "task_type" in inspect.signature(embed).parameters:
+            fn = lambda: embed(list(texts), task_type="RETRIEVAL_QUERY")
+        else:
+            fn = lambda: embed(list(texts))
+        return self._bounded(fn, "queries", cost=len(texts))
+
+    def embed_documents(self, texts):
+        return self._inflight.do(("documents", tuple(texts)), lambda: self._embed_documents(texts))
+
+    def _embed_query(self, text):
+        return self._bounded(lambda: self.embeddings.embed_query(text), "query")
+
+    def _embed_documents(self, texts):
+        return self._bounded(lambda: self.embeddings.embed_documents(texts), "documents", cost=len(texts))
+
+    def _bounded(self, fn, method, cost=1):
+        clamp_timeout(None, "embedding")
+        if self.scheduler:
+            self.scheduler.acquire(max(1, cost))
+        timeout, _ = clamp_timeout(None, "embedding")
+        EMBEDDING_CALLS.inc(method=method)
+        with span("embedding", "embedding"):
+            if timeout is None:
+                return fn()
+            try:
+                return hedged_call(fn, self._executor, timeout=timeout, label="embedding")
+            except TimeoutError as e:
+                raise DeadlineExceeded("Embedding call ran out of request budget") from e
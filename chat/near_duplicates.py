@@ -0,0 +1,98 @@
+"""
+Duplicate Chunk Detection
+Finds chunks that repeat word for word across GeM bids (terms and conditions,
+buyer instructions). Each group is stored once as a shared chunk that records
+every (source, chunk_id) it stands for.
+
+Only chunks that are identical after normalization (case, whitespace,
+punctuation) are shared, and never chunks carrying bid-specific facts - bid
+numbers, dates or amounts. Two "Bid Details" chunks that differ only in
+their dates keep their own text, so every bid is answered from its own values.
+"""
+import hashlib
+import re
+
+from langchain.schema import Document
+
+_MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+
+# Text that differs from bid to bid and must never be shared between bids
+BID_FACT_PATTERNS = [
+    re.compile(r"\bgem/\d{4}/[a-z]/\d+", re.IGNORECASE),                            # bid numbers
+    re.compile(r"\b\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}\b"),                              # 01-08-2025, 1/8/25
+    re.compile(r"\b\d{4}-\d{1,2}-\d{1,2}\b"),                                        # 2025-08-01
+    re.compile(rf"\b\d{{1,2}}(?:st|nd|rd|th)?\s+{_MONTHS},?\s+\d{{4}}\b", re.IGNORECASE),  # 1 August 2025
+    re.compile(rf"\b{_MONTHS}\s+\d{{1,2}},?\s+\d{{4}}\b", re.IGNORECASE),                # August 1, 2025
+    re.compile(r"(?:₹|\brs\.?|\binr)\s*\d", re.IGNORECASE),                          # Rs. 50,000
+    re.compile(r"\b\d{1,3}(?:,\d{2,3})+(?:\.\d+)?\b"),                               # 1,50,000
+    re.compile(r"\b\d+(?:\.\d+)?\s*(?:lakhs?|crores?)\b", re.IGNORECASE),
+]
+
+
+def chunk_sources(metadata) -> list:
+    """Every source a chunk belongs to (shared chunks list several)"""
+    return metadata.get("sources") or [metadata.get("source", "")]
+
+
+def chunk_refs(metadata) -> list:
+    """Every (source, chunk_id) position a chunk stands for"""
+    if metadata.get("shared_refs"):
+        return [tuple(ref) for ref in metadata["shared_refs"]]
+    if "source" in metadata and metadata.get("chunk_id") is not None:
+        return [(metadata["source"], metadata["chunk_id"])]
+    return []
+
+
+def normalize_chunk(text: str) -> str:
+    """Lower-cased words only: layout and punctuation differences don't keep duplicates apart"""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def has_bid_facts(text: str) -> bool:
+    """Whether the text carries a bid number, date or amount"""
+    return any(pattern.search(text) for pattern in BID_FACT_PATTERNS)
+
+
+def find_duplicates(texts):
+    """Groups of indexes whose texts are identical after normalization; texts with bid facts stay alone"""
+    groups = {}
+    for i, text in enumerate(texts):
+        normalized = normalize_chunk(text)
+        if not normalized or has_bid_facts(text):
+            key = i
+        else:
+            key = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
+
+
+def deduplicate_chunks(documents):
+    """Collapse duplicate chunks into shared chunks; returns (documents, report)"""
+    groups = find_duplicates([doc.page_content for doc in documents])
+
+    result = []
+    shared = 0
+    for members in sorted(groups, key=lambda members: members[0]):
+        first = documents[members[0]]
+        if len(members) == 1:
+            result.append(first)
+            continue
+        shared += 1
+        refs = [(documents[i].metadata.get("source", ""), documents[i].metadata.get("chunk_id")) for i in members]
+        metadata = {
+            **first.metadata,
+            "shared": True,
+            "sources": sorted({source for source, _ in refs}),
+            "shared_refs": [[source, chunk_id] for source, chunk_id in refs],
+        }
+        result.append(Document(page_content=first.page_content, metadata=metadata))
+
+    before = len(documents)
+    report = {
+        "chunks_before": before,
+        "chunks_after": len(result),
+        "shared_chunks": shared,
+        "duplicates_removed": before - len(result),
+        "reduction_pct": round(100.0 * (before - len(result)) / before, 1) if before else 0.0,
+    }
+    return result, report
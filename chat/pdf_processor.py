@@ -9,12 +9,17 @@ from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+from .near_duplicates import chunk_sources, deduplicate_chunks
+
 class GeMPDFProcessor:
-    def __init__(self, documents_dir: str):
+    def __init__(self, documents_dir: str, chunk_size: int = 800, chunk_overlap: int = 100, deduplicate: bool = True):
+        # Use smaller chunks (e.g. 300/40) for GEM_RETRIEVAL_MODE=small_to_big
         self.documents_dir = documents_dir
+        self.deduplicate = deduplicate
+        self.dedup_report = None
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=100,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
             separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
         )
     
@@ -138,22 +143,37 @@ class GeMPDFProcessor:
         
         print("=" * 50)
         print(f"Total documents created: {len(all_documents)}")
+        
+        if self.deduplicate:
+            all_documents = self.deduplicate_chunks(all_documents)
         return all_documents
     
+    def deduplicate_chunks(self, documents: List[Document]) -> List[Document]:
+        """Store boilerplate repeated across bids once, as shared chunks"""
+        documents, self.dedup_report = deduplicate_chunks(documents)
+        report = self.dedup_report
+        print(f"Duplicate pass: {report['chunks_before']} -> {report['chunks_after']} chunks "
+              f"({report['shared_chunks']} shared, {report['reduction_pct']}% smaller index)")
+        return documents
+    
     def get_processing_summary(self, documents: List[Document]) -> Dict:
         """Get summary of processed documents"""
         summary = {
             'total_chunks': len(documents),
             'documents': {},
             'ministries': set(),
-            'categories': set()
+            'categories': set(),
+            'shared_chunks': 0
         }
         
         for doc in documents:
-            source = doc.metadata.get('source', 'unknown')
-            if source not in summary['documents']:
-                summary['documents'][source] = 0
-            summary['documents'][source] += 1
+            if doc.metadata.get('shared'):
+                summary['shared_chunks'] += 1
+            for source in chunk_sources(doc.metadata):
+                source = source or 'unknown'
+                if source not in summary['documents']:
+                    summary['documents'][source] = 0
+                summary['documents'][source] += 1
             
             if 'ministry' in doc.metadata:
                 summary['ministries'].add(doc.metadata['ministry'])
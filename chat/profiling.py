@@ -0,0 +1,329 @@
+"""
+Sampled Request Profiling
+Opt-in memory and CPU profiles of single requests, broken down by graph node.
+A request is profiled with probability CHATBOT_PROFILE_SAMPLE_RATE, or when it
+carries the X-Chatbot-Profile header (matching CHATBOT_PROFILE_TOKEN, or any
+value while DEBUG is on). Each profile goes to its own folder:
+
+    profiles/20250901-101500-3fa2c1d4/
+        summary.json     duration, RSS before/after, per-node time and allocations, top allocation sites
+        <node>.prof      cProfile stats per node (CHATBOT_PROFILER=cprofile; open with pstats or snakeviz)
+        stacks.folded    sampled stacks per node (CHATBOT_PROFILER=sample; flamegraph.pl / speedscope)
+
+tracemalloc is process-wide, so allocations of concurrent requests show up
+in a profiled request's numbers; profile under light load for clean data.
+Work handed to other threads (speculative retrieval, shard fan-out) is not
+in the CPU profiles.
+"""
+import cProfile
+import json
+import linecache
+import os
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from .log_pipeline import new_request_id
+from .metrics import PROFILES_CAPTURED, current_trace
+
+CHATBOT_PROFILE_SAMPLE_RATE = float(os.getenv("CHATBOT_PROFILE_SAMPLE_RATE", "0"))
+CHATBOT_PROFILE_DIR = os.getenv("CHATBOT_PROFILE_DIR", "profiles")
+# "cprofile" (deterministic, per node), "sample" (stack sampling) or "memory" (tracemalloc only)
+CHATBOT_PROFILER = os.getenv("CHATBOT_PROFILER", "cprofile")
+CHATBOT_PROFILE_TOKEN = os.getenv("CHATBOT_PROFILE_TOKEN", "")
+CHATBOT_PROFILE_KEEP = int(os.getenv("CHATBOT_PROFILE_KEEP", "50"))
+SAMPLE_INTERVAL = float(os.getenv("CHATBOT_PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+PROFILE_HEADER = "X-Chatbot-Profile"
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 20
+# Allocations made by the profiling machinery itself
+_OWN_ALLOCATIONS = [
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, linecache.__file__),
+]
+
+# Profile folder names: <time>-<request id slug>; pruning never touches anything else
+_PROFILE_NAME = re.compile(r"^\d{8}-\d{6}-[A-Za-z0-9-]+$")
+
+# Summaries of the latest profiles, for the admin endpoint
+recent_profiles = deque(maxlen=20)
+
+_tracing_users = 0
+_tracing_lock = threading.Lock()
+
+
+def rss_bytes():
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+
+
+def sampled() -> bool:
+    return CHATBOT_PROFILE_SAMPLE_RATE > 0 and random.random() < CHATBOT_PROFILE_SAMPLE_RATE
+
+
+def should_profile(request, debug: bool = False) -> bool:
+    header = request.headers.get(PROFILE_HEADER)
+    if header and ((CHATBOT_PROFILE_TOKEN and header == CHATBOT_PROFILE_TOKEN) or (not CHATBOT_PROFILE_TOKEN and debug)):
+        return True
+    return sampled()
+
+
+def _slug(request_id: str) -> str:
+    """Request ids come from the client (X-Request-ID) - keep only [A-Za-z0-9-] for folder names"""
+    return re.sub(r"[^A-Za-z0-9-]", "", request_id or "")[:32] or new_request_id()
+
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's stack, counting folded stacks under the node running at the time"""
+
+    def __init__(self, profile, thread_id):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.profile = profile
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join([self.profile.node_name or "request"] + names[::-1])] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """Memory and CPU profile of one request; nodes report into it through node()"""
+
+    def __init__(self, request_id: str, path: str = "", profiler: str = CHATBOT_PROFILER,
+                 folder: str = CHATBOT_PROFILE_DIR):
+        self.request_id = request_id
+        self.path = path
+        self.profiler = profiler
+        self.root = Path(folder).resolve()
+        self.folder = (self.root / f"{datetime.now():%Y%m%d-%H%M%S}-{_slug(request_id)}").resolve()
+        if self.folder.parent != self.root:
+            raise ValueError(f"Profile folder {self.folder} is outside {self.root}")
+        self.nodes = {}
+        self.node_name = None
+        self._profilers = {}
+        self._sampler = None
+
+    def start(self):
+        _start_tracing()
+        self.started = time.perf_counter()
+        self.rss_before = rss_bytes()
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(_OWN_ALLOCATIONS)
+        if self.profiler == "sample":
+            self._sampler = _StackSampler(self, threading.get_ident())
+            self._sampler.start()
+
+    @contextmanager
+    def node(self, name: str):
+        """Time, allocation growth and allocation peak of one node run"""
+        stats = self.nodes.setdefault(name, {"runs": 0, "seconds": 0.0, "allocated_bytes": 0, "peak_bytes": 0})
+        previous, self.node_name = self.node_name, name
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        profiler = None
+        if self.profiler == "cprofile" and previous is None:
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            after, peak = tracemalloc.get_traced_memory()
+            stats["runs"] += 1
+            stats["seconds"] += time.perf_counter() - start
+            stats["allocated_bytes"] += after - before
+            stats["peak_bytes"] = max(stats["peak_bytes"], peak - before)
+            self.node_name = previous
+
+    def finish(self, status=None) -> dict:
+        try:
+            if self._sampler is not None:
+                self._sampler.stop()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_OWN_ALLOCATIONS)
+            top = snapshot.compare_to(self._snapshot, "lineno")[:TOP_ALLOCATIONS]
+        finally:
+            _stop_tracing()
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        for name, profiler in self._profilers.items():
+            profiler.dump_stats(str(self.folder / f"{name}.prof"))
+        if self._sampler is not None:
+            with open(self.folder / "stacks.folded", "w") as f:
+                for stack, count in self._sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+        summary = {
+            "request_id": self.request_id,
+            "path": self.path,
+            "status": status,
+            "profiler": self.profiler,
+            "folder": str(self.folder),
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "rss_before_bytes": self.rss_before,
+            "rss_after_bytes": rss_bytes(),
+            "nodes": {name: {**stats, "seconds": round(stats["seconds"], 4)} for name, stats in self.nodes.items()},
+            "top_allocations": [
+                {"site": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in top
+            ],
+        }
+        with open(self.folder / "summary.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        recent_profiles.append(summary)
+        PROFILES_CAPTURED.inc(profiler=self.profiler)
+        prune_profiles(self.root)
+        return summary
+
+
+def prune_profiles(folder=CHATBOT_PROFILE_DIR, keep: int = CHATBOT_PROFILE_KEEP):
+    """Delete all but the newest `keep` profile folders directly under the profile directory"""
+    folders = sorted(
+        (p for p in Path(folder).iterdir() if p.is_dir() and _PROFILE_NAME.match(p.name)),
+        key=lambda p: p.stat().st_mtime,
+    )
+    for old in folders[:-keep] if keep > 0 else []:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+@contextmanager
+def profile_request(request_id: str, path: str = ""):
+    """Profile everything run inside the block as one request (needs an active request trace)"""
+    trace = current_trace()
+    profile = RequestProfile(request_id, path)
+    profile.start()
+    if trace is not None:
+        trace.profile = profile
+    outcome = {"status": None}
+    try:
+        yield outcome
+    finally:
+        if trace is not None:
+            trace.profile = None
+        try:
+            profile.finish(outcome["status"])
+        except Exception as e:
+            print(f"WARNING: Could not write profile for request {request_id}: {e}")
+
+
+def _text_bytes(documents) -> int:
+    return sum(len(doc.page_content) + len(json.dumps(doc.metadata, default=str)) for doc in documents)
+
+
+def store_size(db) -> dict:
+    """Resident size of a vector store: vectors plus the docstore's in-memory documents"""
+    if db is None:
+        return {}
+    if hasattr(db, "_shards"):  # ShardedGemStore - only loaded shards take memory
+        shards = [store_size(shard) for shard in list(db._shards.values())]
+        return {
+            "shards_loaded": len(shards),
+            "vectors": sum(s["vectors"] for s in shards),
+            "index_bytes": sum(s["index_bytes"] for s in shards),
+            "docstore_documents": sum(s["docstore_documents"] for s in shards),
+            "docstore_bytes": sum(s["docstore_bytes"] for s in shards),
+        }
+    index = db.index
+    try:
+        per_vector = index.sa_code_size()
+    except Exception:
+        per_vector = index.d * 4
+    docstore = db.docstore
+    if hasattr(docstore, "_cache"):  # SQLiteDocstore: only its LRU is in memory
+        documents = list(docstore._cache.values())
+    else:
+        documents = list(getattr(docstore, "_dict", {}).values())
+    return {
+        "vectors": index.ntotal,
+        "index_bytes": index.ntotal * per_vector,
+        "docstore_documents": len(documents),
+        "docstore_bytes": _text_bytes(documents),
+    }
+
+
+def memory_report(service) -> dict:
+    """Process RSS plus the resident size of every loaded vector store and cache"""
+    from .chatbot_graph import _recent_answers
+    from .query_analysis import analyze_query
+
+    stores = {}
+    bundle = service.indexes
+    if bundle.gem_loaded:
+        stores["gem"] = store_size(bundle.gem_db)
+        stores["gem_summaries"] = store_size(bundle.gem_summary_db)
+    for directory, domain, (retriever, _) in service.stores.items():
+        stores[f"{domain}:{directory}"] = store_size(retriever.vectorstore)
+
+    caches = {
+        "query_analysis": {"entries": analyze_query.cache_info().currsize},
+        "recent_answers": {
+            "entries": len(_recent_answers),
+            "bytes": sum(len(str(answer)) for answer in list(_recent_answers.values())),
+        },
+        "faq": {"entries": len(service.faq), "matrix_bytes": int(service.faq._matrix.nbytes)},
+        "domain_stores": {"loaded": len(service.stores.loaded()), "index_file_bytes": service.stores.loaded_bytes()},
+    }
+    if bundle.gem_loaded:
+        extractions = list(bundle.gem_processor._extractions.values())
+        caches["gem_map"] = {"entries": len(extractions), "bytes": sum(len(str(value)) for value in extractions)}
+
+    return {
+        "rss_bytes": rss_bytes(),
+        "stores": stores,
+        "caches": caches,
+        "profiling": {
+            "sample_rate": CHATBOT_PROFILE_SAMPLE_RATE,
+            "profiler": CHATBOT_PROFILER,
+            "folder": CHATBOT_PROFILE_DIR,
+            "tracing": tracemalloc.is_tracing(),
+        },
+    }
@@ -0,0 +1,127 @@
+"""
+Query Analysis
+Scans a question once and produces a QueryPlan (document numbers, dates,
+routing and intent flags) that the classifier, the graph nodes and the GeM
+processor all read, so their keyword lists cannot drift apart.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+DOC_NUMBER_PATTERN = re.compile(r"\b(\d{7})\b")
+DATE_PATTERN = re.compile(r"\b(\d{2}-\d{2}-\d{4})\b")
+
+# Phrase lists matched as substrings of the lowercased question
+PHRASES = {
+    # Questions spanning every GeM document
+    "multi_doc": [
+        "each pdf", "all pdf", "all documents", "each document", "systematic manner", "compare",
+        "list all", "all the bid", "all bid documents", "in all", "for all",
+    ],
+    # Strong GeM signals - route to GeM before any embedding call
+    "gem_indicator": [
+        "bidding", "bid", "tender", "procurement", "gem", "ministry", "organisation", "item category", "documents",
+    ],
+    # Keyword fallback when semantic classification is unclear
+    "gem_keyword": [
+        "gem", "procurement", "bidding", "tender", "ministry", "government", "bid", "contract", "purchase",
+        "supplier", "vendor", "amc", "maintenance", "defence", "department", "proposal",
+    ],
+    "calamity_keyword": [
+        "calamity", "terraria", "boss", "weapon", "item", "mod", "yharon", "supreme", "devourer", "providence", "astrum",
+    ],
+    # What a document-specific GeM search should look for
+    "focus_documents": ["document", "required", "seller", "upload", "eligibility"],
+    "focus_bid_dates": ["bid", "opening", "date", "time"],
+    "focus_validity": ["validity", "period", "duration"],
+    # Question intents; questions with the same intent share GeM per-source extractions
+    "intent_bid_opening": ["bid opening", "opening date", "opening time"],
+    "intent_bid_end": ["bid end", "end date", "closing date", "deadline"],
+    "intent_validity": ["validity", "valid for"],
+    "intent_documents_required": ["documents required", "document required", "seller documents", "eligibility"],
+    "intent_emd": ["emd", "earnest money"],
+    "intent_evaluation": ["evaluation method", "evaluation"],
+    "intent_category": ["item category", "category", "items"],
+}
+
+# First match wins
+FOCUS_ORDER = ("documents", "bid_dates", "validity")
+INTENT_ORDER = (
+    "bid_opening", "bid_end", "validity", "documents_required", "emd", "evaluation", "category",
+)
+
+
+class PhraseMatcher:
+    """Finds every listed phrase in one regex pass
+
+    The alternation is wrapped in a lookahead so matches can overlap, and
+    ordered longest first; any shorter phrase matching at the same position
+    is a prefix of the longest one, so its groups are folded into it.
+    """
+
+    def __init__(self, phrases):
+        groups_by_phrase = {}
+        for group, items in phrases.items():
+            for phrase in items:
+                groups_by_phrase.setdefault(phrase, set()).add(group)
+
+        self._groups = {}
+        for phrase in groups_by_phrase:
+            self._groups[phrase] = frozenset().union(
+                *(groups for other, groups in groups_by_phrase.items() if phrase.startswith(other))
+            )
+
+        ordered = sorted(groups_by_phrase, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(re.escape(phrase) for phrase in ordered) + "))")
+
+    def groups(self, text: str) -> frozenset:
+        found = set()
+        for match in self._pattern.finditer(text.lower()):
+            found |= self._groups[match.group(1)]
+        return frozenset(found)
+
+
+_matcher = PhraseMatcher(PHRASES)
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    question: str
+    doc_numbers: Tuple[str, ...] = ()
+    dates: Tuple[str, ...] = ()
+    is_multi_doc: bool = False
+    gem_indicator: bool = False
+    gem_keyword: bool = False
+    calamity_keyword: bool = False
+    search_focus: Optional[str] = None
+    intent: Optional[str] = None
+
+    @property
+    def doc_number(self) -> Optional[str]:
+        return self.doc_numbers[0] if self.doc_numbers else None
+
+
+@lru_cache(maxsize=1024)
+def analyze_query(question: str) -> QueryPlan:
+    """QueryPlan for a question (cached, so every caller shares one scan)"""
+    groups = _matcher.groups(question)
+    return QueryPlan(
+        question=question,
+        doc_numbers=tuple(DOC_NUMBER_PATTERN.findall(question)),
+        dates=tuple(DATE_PATTERN.findall(question)),
+        is_multi_doc="multi_doc" in groups,
+        gem_indicator="gem_indicator" in groups,
+        gem_keyword="gem_keyword" in groups,
+        calamity_keyword="calamity_keyword" in groups,
+        search_focus=next((focus for focus in FOCUS_ORDER if f"focus_{focus}" in groups), None),
+        intent=next((intent for intent in INTENT_ORDER if f"intent_{intent}" in groups), None),
+    )
+
+
+def plan_for(state) -> QueryPlan:
+    """The plan stored in graph state, re-analysed if it belongs to an earlier question"""
+    plan = state.get("query_plan")
+    if not isinstance(plan, QueryPlan) or plan.question != state["question"]:
+        plan = analyze_query(state["question"])
+    return plan
@@ -1,26 +1,32 @@
 """
 Question Classification Module
 """
-import re
 import numpy as np
 
+from .query_analysis import analyze_query
+
 class QuestionClassifier:
-    def __init__(self, embeddings, llm):
+    def __init__(self, embeddings, llm, domains):
         self.embeddings = embeddings
         self.llm = llm
+        self.domains = domains
     
-    def classify_question_type(self, question: str) -> str:
+    def classify_question_type(self, question: str, plan=None) -> str:
         """Classify question using semantic search with keyword fallback"""
+        plan = plan or analyze_query(question)
+        
         # Check if question mentions specific document number
-        if re.search(r'\b\d{7}\b', question):
-            print(f"Document-specific question detected - classifying as gem")
-            return "gem"
+        if plan.doc_numbers:
+            for spec in self.domains:
+                if spec.claims_doc_numbers:
+                    print(f"Document-specific question detected - classifying as {spec.name}")
+                    return spec.name
         
-        # Check for GeM-related terms
-        gem_indicators = ['bidding', 'bid', 'tender', 'procurement', 'gem', 'ministry', 'organisation', 'item category', 'documents']
-        if any(indicator in question.lower() for indicator in gem_indicators):
-            print(f"GeM-related question detected - classifying as gem")
-            return "gem"
+        # Check for strong domain terms (e.g. GeM bidding vocabulary)
+        indicated, keyworded = self.domains.routing_matches(question)
+        if indicated:
+            print(f"{self.domains.get(indicated[0]).title}-related question detected - classifying as {indicated[0]}")
+            return indicated[0]
         
         # Try semantic classification first
         semantic_result = self._classify_semantic(question)
@@ -28,24 +34,19 @@ class QuestionClassifier:
             return semantic_result
         
         # Fallback to keyword matching
-        return self._classify_keywords(question)
+        return self._classify_keywords(keyworded)
     
     def _classify_semantic(self, question: str) -> str:
         """Semantic classification using embeddings"""
         try:
             question_embedding = self.embeddings.embed_query(question)
             
-            category_descriptions = {
-                "gem": "government procurement bidding tender contract ministry defence department supplier vendor purchase proposal military equipment services maintenance annual contract GeM marketplace public sector acquisition",
-                "calamity": "terraria calamity mod boss weapon item crafting recipe strategy guide gaming video game yharon providence devourer astrum supreme calamitas scal draedon exo mechs",
-                "general": "general knowledge facts information science history geography mathematics basic questions everyday topics"
-            }
-            
             similarities = {}
-            for category, description in category_descriptions.items():
-                category_embedding = self.embeddings.embed_query(description)
-                similarity = self._cosine_similarity(question_embedding, category_embedding)
-                similarities[category] = similarity
+            for spec in self.domains:
+                if not spec.exemplars:
+                    continue
+                category_embedding = self.domains.exemplar_embedding(spec.name, self.embeddings)
+                similarities[spec.name] = self._cosine_similarity(question_embedding, category_embedding)
             
             best_category = max(similarities, key=similarities.get)
             best_score = similarities[best_category]
@@ -61,23 +62,14 @@ class QuestionClassifier:
             print(f"Semantic classification failed: {e}")
             return "unclear"
     
-    def _classify_keywords(self, question: str) -> str:
+    def _classify_keywords(self, keyworded) -> str:
         """Fallback keyword classification"""
-        question_lower = question.lower()
-        
-        gem_keywords = ['gem', 'procurement', 'bidding', 'tender', 'ministry', 'government', 'bid', 'contract', 'purchase', 'supplier', 'vendor', 'amc', 'maintenance', 'defence', 'department', 'proposal']
-        calamity_keywords = ['calamity', 'terraria', 'boss', 'weapon', 'item', 'mod', 'yharon', 'supreme', 'devourer', 'providence', 'astrum']
-        
-        if any(keyword in question_lower for keyword in gem_keywords):
-            print("Keyword classification: gem")
-            return "gem"
-        
-        if any(keyword in question_lower for keyword in calamity_keywords):
-            print("Keyword classification: calamity")
-            return "calamity"
+        if keyworded:
+            print(f"Keyword classification: {keyworded[0]}")
+            return keyworded[0]
         
-        print("Keyword classification: general")
-        return "general"
+        print(f"Keyword classification: {self.domains.default}")
+        return self.domains.default
     
     def _cosine_similarity(self, vec1, vec2):
         """Calculate cosine similarity between two vectors"""
@@ -91,4 +83,4 @@ class QuestionClassifier:
         if norm1 == 0 or norm2 == 0:
             return 0
         
-        return dot_product / (norm1 * norm2)
\ No newline at end of file
+        return dot_product / (norm1 * norm2)
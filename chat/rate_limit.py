@@ -0,0 +1,168 @@
+"""
+Provider Quota Scheduler
+Token-bucket rate limiting for LLM and embedding calls with priority classes,
+so interactive chat is served before async jobs and batch ingestion.
+
+    CHATBOT_LLM_RATE=4              # calls/second across all roles (0 = unlimited)
+    CHATBOT_LLM_BURST=8
+    CHATBOT_EMBEDDING_RATE=20       # texts/second: a batch costs one token per text
+    CHATBOT_EMBEDDING_BURST=40
+    CHATBOT_RATE_LIMIT_DB=ratelimit.sqlite   # share the buckets between processes
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .deadline import DeadlineExceeded, remaining
+from .metrics import RATE_LIMIT_QUEUE_DEPTH, RATE_LIMIT_WAIT_SECONDS
+
+PRIORITIES = {"interactive": 0, "async": 1, "batch": 2}
+
+_priority = contextvars.ContextVar("chatbot_call_priority", default="interactive")
+
+
+@contextmanager
+def priority(name: str):
+    """Run the block's provider calls at this priority class"""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority class: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class TokenBucket:
+    """Process-local token bucket"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, cost: float = 1.0) -> float:
+        """Take tokens and return 0, or return the seconds until they will be available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= cost:
+                self._tokens -= cost
+                return 0.0
+            return (cost - self._tokens) / self.rate
+
+
+class SQLiteTokenBucket:
+    """Token bucket stored in SQLite so several worker processes share one quota"""
+
+    def __init__(self, db_path: str, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+        )
+
+    def try_acquire(self, cost: float = 1.0) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT tokens, updated FROM token_buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                tokens = self.capacity if row is None else min(self.capacity, row[0] + (now - row[1]) * self.rate)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / self.rate
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                    (self.name, tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+
+class RateLimitScheduler:
+    """Hands out bucket tokens strictly in priority order, FIFO within a class"""
+
+    def __init__(self, name: str, bucket=None):
+        self.name = name
+        self.bucket = bucket
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, name: str):
+        rate = float(os.getenv(f"CHATBOT_{name.upper()}_RATE", "0"))
+        if rate <= 0:
+            return cls(name)
+        capacity = float(os.getenv(f"CHATBOT_{name.upper()}_BURST", str(max(1.0, rate))))
+        db_path = os.getenv("CHATBOT_RATE_LIMIT_DB")
+        if db_path:
+            return cls(name, SQLiteTokenBucket(db_path, name, rate, capacity))
+        return cls(name, TokenBucket(rate, capacity))
+
+    def acquire(self, cost: float = 1.0):
+        """Block until this call may go to the provider; DeadlineExceeded if the request deadline comes first"""
+        priority_name = current_priority()
+        if self.bucket is None:
+            return
+
+        start = time.monotonic()
+        left = remaining()
+        deadline = None if left is None else start + left
+
+        def time_left(wait):
+            if deadline is None:
+                return wait
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise DeadlineExceeded(f"Request deadline passed waiting for {self.name} quota")
+            return min(wait, left)
+
+        cost = min(cost, self.bucket.capacity)  # a batch larger than the burst still gets through
+        entry = (PRIORITIES[priority_name], next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            RATE_LIMIT_QUEUE_DEPTH.inc(limiter=self.name)
+        try:
+            while True:
+                with self._cond:
+                    while self._waiters[0] != entry:
+                        self._cond.wait(timeout=time_left(1.0))
+                # Outside the lock: the SQLite bucket can block on other processes
+                time_left(0.0)
+                wait = self.bucket.try_acquire(cost)
+                if wait == 0:
+                    break
+                with self._cond:
+                    self._cond.wait(timeout=time_left(wait))
+        finally:
+            with self._cond:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                RATE_LIMIT_QUEUE_DEPTH.dec(limiter=self.name)
+                self._cond.notify_all()
+
+        RATE_LIMIT_WAIT_SECONDS.observe(time.monotonic() - start, limiter=self.name, priority=priority_name)
@@ -0,0 +1,144 @@
+"""
+LLM Call Resilience
+Hedged requests for tail latency and per-role circuit breakers
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .metrics import CIRCUIT_STATE, HEDGED_CALLS
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is currently failing"""
+
+
+class UpstreamError(Exception):
+    """The provider failed a call (rate limited, server error, bad response)"""
+
+
+# Failures a caller can answer around with a degraded result
+UNAVAILABLE_ERRORS = (CircuitOpenError, UpstreamError, TimeoutError)
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float):
+        """None until enough samples have been seen"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """closed -> open after consecutive failures -> half-open after a cool-down"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    _STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, breaker=name)
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.set(self._STATE_VALUES[state], breaker=self.name)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+        raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def release(self):
+        """Give back a half-open trial slot without judging the upstream"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+def hedged_call(fn, executor, hedge_after=None, timeout=None, label=""):
+    """Run fn on executor; if it hasn't finished after hedge_after seconds, start
+    a duplicate and return whichever succeeds first. Raises TimeoutError after
+    timeout. Losing and timed-out attempts are cancelled if they haven't started.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    primary = executor.submit(contextvars.copy_context().run, fn)
+    if hedge_after is None:
+        try:
+            return primary.result(timeout=remaining())
+        except FutureTimeoutError:
+            primary.cancel()
+            raise TimeoutError(f"{label} call timed out after {timeout}s")
+
+    done, _ = wait([primary], timeout=hedge_after if deadline is None else min(hedge_after, remaining()))
+    if done:
+        return primary.result()
+
+    HEDGED_CALLS.inc(role=label, outcome="fired")
+    hedge = executor.submit(contextvars.copy_context().run, fn)
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    HEDGED_CALLS.inc(role=label, outcome="hedge_won" if future is hedge else "primary_won")
+                    return future.result()
+                error = future.exception()
+    finally:
+        for future in pending:
+            future.cancel()
+
+    if error is not None and not pending:
+        raise error
+    raise TimeoutError(f"{label} call timed out after {timeout}s")
@@ -0,0 +1,66 @@
+"""
+In-flight Request Coalescing
+Concurrent calls with the same key share one execution; the result is handed
+to every waiter
+"""
+import threading
+
+from .deadline import DeadlineExceeded, remaining
+from .metrics import COALESCED_CALLS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time
+
+    Waiters receive the leader's result object itself, so callers must treat
+    results as read-only. If the leader fails, waiters retry once through the
+    group (one of them becomes the new leader, the rest wait on it); if that
+    fails too, its error is raised to every waiter. A waiter whose request
+    deadline passes first stops waiting with DeadlineExceeded.
+    """
+
+    def __init__(self, name: str, retries: int = 1):
+        self.name = name
+        self.retries = retries
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        for _ in range(self.retries + 1):
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+
+            if leader:
+                try:
+                    call.result = fn()
+                    return call.result
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        self._calls.pop(key, None)
+                    call.done.set()
+
+            left = remaining()
+            if not call.done.wait(timeout=None if left is None else max(0.0, left)):
+                raise DeadlineExceeded(f"Request deadline passed waiting for a shared {self.name} call")
+            if call.error is None:
+                COALESCED_CALLS.inc(group=self.name)
+                return call.result
+
+        raise call.error
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
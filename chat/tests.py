@@ -1,3 +1,467 @@
-from django.test import TestCase
+import ast
+import itertools
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from django.urls import reverse
+from langchain.schema import Document
+
+from . import chatbot_graph
+from .deadline import DeadlineExceeded, deadline_scope, new_deadline
+from .domains import BUILTIN_DOMAINS, GEM, DomainRegistry, DomainSpec
+from .fast_path import _clean, _evaluate, answer_arithmetic
+from .faq import FaqIndex, build_faq, question_numbers, save_faq
+from .gem_processor import GemProcessor
+from .index_versions import IndexWatcher
+from .local_models import LocalEmbeddings
+from .model_wrappers import TracedChatModel
+from .near_duplicates import chunk_sources, deduplicate_chunks, has_bid_facts
+from .rate_limit import RateLimitScheduler, SQLiteTokenBucket, TokenBucket, priority
+from .resilience import CircuitBreaker, CircuitOpenError, hedged_call
+from .singleflight import SingleFlight
+
+
+def _chunk(text, bid_number, chunk_id=0):
+    return Document(page_content=text, metadata={"source": f"GeM-Bidding-{bid_number}.pdf", "chunk_id": chunk_id})
+
+
+class DeduplicateChunksTests(SimpleTestCase):
+    def test_identical_boilerplate_is_shared_across_bids(self):
+        text = "General Terms and Conditions The seller shall comply with all buyer added terms and conditions"
+        documents, report = deduplicate_chunks([_chunk(text, "7893321", 3), _chunk(text, "8046605", 5)])
+
+        self.assertEqual(len(documents), 1)
+        self.assertEqual(report["shared_chunks"], 1)
+        self.assertEqual(chunk_sources(documents[0].metadata),
+                         ["GeM-Bidding-7893321.pdf", "GeM-Bidding-8046605.pdf"])
+        self.assertEqual(documents[0].metadata["shared_refs"],
+                         [["GeM-Bidding-7893321.pdf", 3], ["GeM-Bidding-8046605.pdf", 5]])
+
+    def test_layout_and_punctuation_differences_are_shared(self):
+        documents, _ = deduplicate_chunks([
+            _chunk("Buyer instructions:\nBidders are advised to read the bid document carefully.", "7893321"),
+            _chunk("BUYER INSTRUCTIONS  Bidders are advised to read the bid document carefully", "8046605"),
+        ])
+        self.assertEqual(len(documents), 1)
+
+    def test_bid_details_with_different_dates_are_kept_per_bid(self):
+        template = ("Bid Details Bid End Date/Time {end} 11:00:00 Bid Opening Date/Time {end} 11:30:00 "
+                    "Ministry Of Defence Organisation Name Indian Army Office Name Pune")
+        first = _chunk(template.format(end="12-08-2025"), "7893321")
+        second = _chunk(template.format(end="19-08-2025"), "8046605")
+        documents, report = deduplicate_chunks([first, second])
+
+        self.assertEqual(report["shared_chunks"], 0)
+        self.assertEqual([doc.page_content for doc in documents], [first.page_content, second.page_content])
+        self.assertEqual([chunk_sources(doc.metadata) for doc in documents],
+                         [["GeM-Bidding-7893321.pdf"], ["GeM-Bidding-8046605.pdf"]])
+
+    def test_identical_chunks_with_bid_facts_are_never_shared(self):
+        for text in (
+            "EMD Amount Rs. 50,000 payable to the buyer",
+            "Estimated bid value 1,50,000 for the contract period",
+            "Contract value 2.5 lakh for the contract period",
+            "Bid opening on 1 August 2025 at the buyer office",
+            "See GEM/2025/B/7893321 for the buyer added terms",
+        ):
+            with self.subTest(text=text):
+                documents, report = deduplicate_chunks([_chunk(text, "7893321"), _chunk(text, "8046605")])
+                self.assertEqual(len(documents), 2)
+                self.assertEqual(report["shared_chunks"], 0)
+
+    def test_near_duplicates_are_not_shared(self):
+        documents, _ = deduplicate_chunks([
+            _chunk("Documents required from seller Experience Criteria, Past Performance, Bidder Turnover", "7893321"),
+            _chunk("Documents required from seller Experience Criteria, Past Performance", "8046605"),
+        ])
+        self.assertEqual(len(documents), 2)
+
+    def test_bid_facts(self):
+        self.assertTrue(has_bid_facts("Bid End Date/Time 12-08-2025 11:00:00"))
+        self.assertTrue(has_bid_facts("Opening 2025-08-12"))
+        self.assertTrue(has_bid_facts("₹5000 EMD"))
+        self.assertFalse(has_bid_facts("Bid Offer Validity (From End Date) 120 (Days)"))
+        self.assertFalse(has_bid_facts("Contract Period 1 Year(s)"))
+
+
+class FaqTests(SimpleTestCase):
+    FIRST = "What is the EMD for bid GEM/2025/B/7893321?"
+    SECOND = "What is the EMD for bid GEM/2025/B/8046605?"
+
+    def setUp(self):
+        self.embeddings = LocalEmbeddings()
+        feedback = [(self.FIRST, "EMD is Rs. 50,000", "thumbs_up")] * 3
+        feedback += [(self.SECOND, "EMD is Rs. 20,000", "thumbs_up")] * 2
+        self.entries, rows, matrix = build_faq(feedback, self.embeddings, min_votes=2, cluster_threshold=0.5)
+        folder = self.enterContext(tempfile.TemporaryDirectory())
+        save_faq(self.entries, rows, matrix, folder)
+        self.index = FaqIndex(folder, threshold=0.5)
+
+    def test_questions_about_different_bids_are_separate_entries(self):
+        self.assertEqual(sorted(entry["answer"] for entry in self.entries), ["EMD is Rs. 20,000", "EMD is Rs. 50,000"])
+
+    def test_lookup_requires_the_same_bid_number(self):
+        self.assertEqual(self.index.lookup(self.SECOND, self.embeddings)["answer"], "EMD is Rs. 20,000")
+        self.assertEqual(self.index.lookup("EMD for bid GEM/2025/B/7893321", self.embeddings)["answer"],
+                         "EMD is Rs. 50,000")
+        self.assertIsNone(self.index.lookup("What is the EMD for bid GEM/2025/B/7975925?", self.embeddings))
+
+    def test_question_numbers(self):
+        self.assertEqual(question_numbers(self.FIRST), ("2025", "7893321"))
+        self.assertEqual(question_numbers("How do I beat Yharon?"), ())
+
+
+class ArithmeticFastPathTests(SimpleTestCase):
+    def answer(self, question):
+        return answer_arithmetic(_clean(question))
+
+    def test_answers_plain_arithmetic(self):
+        self.assertEqual(self.answer("What is 2 + 2?"), "2 + 2 = 4")
+        self.assertEqual(self.answer("calculate 3 times 4"), "3 * 4 = 12")
+        self.assertEqual(self.answer("100/4"), "100/4 = 25")
+        self.assertEqual(self.answer("what is 15% of 200"), "15% of 200 is 30.")
+        self.assertEqual(self.answer("what is 3 x 4"), "3 * 4 = 12")
+        self.assertEqual(self.answer("what is 3×4"), "3*4 = 12")
+
+    def test_dates_and_financial_years_are_not_arithmetic(self):
+        for question in ("What is 12/25/2024?", "what is 2024-25", "what is 2024-2025", "25-12-2024",
+                         "1.5.2024", "12/5/2"):
+            with self.subTest(question=question):
+                self.assertIsNone(self.answer(question))
+
+    def test_bare_numbers_and_words_are_not_arithmetic(self):
+        for question in ("what is 42", "what is pi", "how much is a GeM bid", "what is 2 + x", "what is 0x10",
+                         "what is 2x3"):
+            with self.subTest(question=question):
+                self.assertIsNone(self.answer(question))
+
+    def test_evaluator_limits(self):
+        for question in ("2 ** 1000", "10 ** 20", "99999999 * 99999999", "10 / 0", "5 % 0",
+                         "what is 2*(-8)**0.5", "what is 2 * (-4)^0.5", "what is (-8) ** 0.5"):
+            with self.subTest(question=question):
+                self.assertIsNone(self.answer(question))
+        for expression in ("a + 1", "abs(-1)", "[1, 2]", "1 if 1 else 2", "'a' * 3", "2 * (-8) ** 0.5"):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ValueError):
+                    _evaluate(ast.parse(expression, mode="eval"))
+
+
+def _run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        group = SingleFlight("test")
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        threads = _run_threads(5, lambda: results.append(group.do("key", fn)))
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_followers_receive_the_leaders_error(self):
+        group = SingleFlight("test", retries=0)
+        release = threading.Event()
+        calls = []
+        errors = []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            raise RuntimeError("503 from upstream")
+
+        def call():
+            try:
+                group.do("key", fn)
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = _run_threads(5, call)
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([str(e) for e in errors], ["503 from upstream"] * 5)
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_failed_call_is_retried_once_through_the_group(self):
+        group = SingleFlight("test", retries=1)
+        calls = []
+        errors = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.1)
+            raise RuntimeError("503 from upstream")
+
+        def call():
+            try:
+                group.do("key", fn)
+            except RuntimeError as e:
+                errors.append(e)
+
+        for thread in _run_threads(8, call):
+            thread.join(5)
+        self.assertLessEqual(len(calls), 2)
+        self.assertEqual(len(errors), 8)
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_key_is_released_after_failure(self):
+        group = SingleFlight("test")
+        with self.assertRaises(ValueError):
+            group.do("key", lambda: (_ for _ in ()).throw(ValueError("bad")))
+        self.assertEqual(group.in_flight(), 0)
+        self.assertEqual(group.do("key", lambda: "fresh"), "fresh")
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_open_half_open_closed(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()  # only one trial call at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.before_call()
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_quota_error_gives_back_the_trial_slot(self):
+        class FailingScheduler:
+            def acquire(self, cost=1):
+                raise RuntimeError("quota store unavailable")
+
+        model = TracedChatModel(model=None, role="test", scheduler=FailingScheduler())
+        model.breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.0)
+        model.breaker.record_failure()
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                model._call("question")
+        self.assertEqual(model.breaker.state, CircuitBreaker.HALF_OPEN)
+        model.breaker.before_call()
+
+
+class HedgedCallTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown, wait=False)
+
+    def test_hedge_fires_after_threshold_and_wins(self):
+        attempts = itertools.count()
+
+        def fn():
+            if next(attempts) == 0:
+                time.sleep(0.5)
+                return "primary"
+            return "hedge"
+
+        start = time.monotonic()
+        self.assertEqual(hedged_call(fn, self.executor, hedge_after=0.05, timeout=2, label="test"), "hedge")
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(next(attempts), 2)
+
+    def test_fast_call_is_not_hedged(self):
+        calls = []
+        self.assertEqual(hedged_call(lambda: calls.append(1) or "ok", self.executor,
+                                     hedge_after=0.5, timeout=2, label="test"), "ok")
+        self.assertEqual(len(calls), 1)
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            hedged_call(lambda: time.sleep(0.3), self.executor, hedge_after=0.05, timeout=0.1, label="test")
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        self.db_path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "ratelimit.sqlite")
+
+    def test_sqlite_bucket_refills_and_is_shared(self):
+        bucket = SQLiteTokenBucket(self.db_path, "llm", rate=20, capacity=1)
+        other_process = SQLiteTokenBucket(self.db_path, "llm", rate=20, capacity=1)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertGreater(other_process.try_acquire(), 0)
+        time.sleep(0.06)
+        self.assertEqual(other_process.try_acquire(), 0)
+        self.assertGreater(bucket.try_acquire(), 0)
+
+    def test_interactive_calls_are_served_before_queued_batch_calls(self):
+        scheduler = RateLimitScheduler("test", SQLiteTokenBucket(self.db_path, "test", rate=20, capacity=1))
+        scheduler.acquire()  # drain the burst so everyone below has to queue
+        order = []
+
+        def call(name):
+            with priority(name):
+                scheduler.acquire()
+            order.append(name)
+
+        threads = []
+        for name in ["batch"] * 3 + ["interactive"] * 3:
+            threads.append(threading.Thread(target=call, args=(name,)))
+            threads[-1].start()
+            time.sleep(0.005)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(order, ["interactive"] * 3 + ["batch"] * 3)
+
+    def test_deadline_while_queued(self):
+        scheduler = RateLimitScheduler("test", TokenBucket(rate=1, capacity=1))
+        scheduler.acquire()
+        with deadline_scope(new_deadline(0.05)):
+            with self.assertRaises(DeadlineExceeded):
+                scheduler.acquire()
+
+
+class _ChunkStore:
+    def __init__(self, source, total):
+        self.chunks = {i: Document(page_content=f"chunk {i}", metadata={"source": source, "chunk_id": i})
+                       for i in range(total)}
+
+    def get_chunks(self, source, chunk_ids):
+        return [self.chunks[i] for i in chunk_ids]
+
+
+class SmallToBigGradingTests(SimpleTestCase):
+    def test_neighbours_of_every_accepted_hit_reach_generation(self):
+        source = "GeM-Bidding-7893321.pdf"
+        store = _ChunkStore(source, 40)
+        hits = [Document(page_content=f"chunk {i}", metadata={"source": source, "chunk_id": i, "total_chunks": 40,
+                                                              "retrieval_score": 0.1 * n})
+                for n, i in enumerate((10, 20, 30))]
+        processor = GemProcessor(SimpleNamespace(docstore=store), llm=None)
+        processor.retrieval_mode = "small_to_big"
+        processor.neighbour_window = 1
+        service = SimpleNamespace(domains=DomainRegistry(BUILTIN_DOMAINS), gem_processor=processor, llm_for=lambda role: str)
+
+        def gate(doc, score):
+            return "reject" if doc.metadata["chunk_id"] == 20 else "accept"
+
+        with mock.patch.object(chatbot_graph, "chatbot_service", service), \
+                mock.patch.object(chatbot_graph, "score_gate", gate):
+            result = chatbot_graph.grade_documents({
+                "question": "What documents are required from the seller?", "question_type": "gem",
+                "documents": hits, "chat_history": [],
+            })
+
+        self.assertEqual([doc.metadata["chunk_id"] for doc in result["documents"]], [10, 9, 11, 30, 29, 31])
+        self.assertEqual(result["scores"], [0.0, None, None, 0.2, None, None])
+
+
+class MapReduceTests(SimpleTestCase):
+    def test_shared_chunks_reach_every_source_they_stand_for(self):
+        terms = Document(page_content="Buyer added terms", metadata={
+            "source": "GeM-Bidding-7893321.pdf", "chunk_id": 3, "shared": True,
+            "sources": ["GeM-Bidding-7893321.pdf", "GeM-Bidding-8046605.pdf"],
+        })
+        details = _chunk("Bid Details EMD Rs. 50,000", "7893321", 1)
+        merge_llm = mock.Mock()
+        merge_llm.invoke.return_value.content = "table"
+        processor = GemProcessor(None, llm=None, merge_llm=merge_llm)
+        extracted = {}
+
+        def extract(source, docs, question, intent):
+            extracted[source] = [doc.page_content for doc in docs]
+            return "found"
+
+        with mock.patch.object(processor, "_extract_from_source", extract):
+            self.assertEqual(processor.map_reduce_answer("Compare the terms of both bids", [terms, details]), "table")
+        self.assertEqual(extracted, {
+            "GeM-Bidding-7893321.pdf": ["Buyer added terms", "Bid Details EMD Rs. 50,000"],
+            "GeM-Bidding-8046605.pdf": ["Buyer added terms"],
+        })
+
+
+class DeadlineDegradationTests(SimpleTestCase):
+    def test_retrieval_for_a_chosen_domain_degrades_at_the_deadline(self):
+        with mock.patch.object(chatbot_graph, "_retrieve_for", side_effect=DeadlineExceeded("no time left")):
+            result = chatbot_graph.classify_and_retrieve({
+                "question": "What is the EMD amount?", "chat_history": [], "user_choice": "gem",
+            })
+        self.assertEqual(result["documents"], [])
+        self.assertEqual(result["degraded_stages"], ["retrieval"])
+
+    def test_chat_view_reports_degraded_stages(self):
+        from . import views
+
+        self.enterContext(self.settings(SESSION_FILE_PATH=self.enterContext(tempfile.TemporaryDirectory())))
+        final_state = {"answer": "EMD is Rs. 50,000", "degraded_stages": ["retrieval", "grading"]}
+        with mock.patch.object(views, "run_graph", return_value=final_state):
+            response = self.client.post(reverse("chat_view"), {"question": "What is the EMD amount?"})
+        self.assertEqual(response[views.DEGRADED_HEADER], "retrieval,grading")
+
+
+class IndexWatcherTests(SimpleTestCase):
+    def test_failed_reload_is_retried_on_the_next_poll(self):
+        polls = itertools.count()
+        reloads = []
+        reloaded = threading.Event()
+
+        def get_versions():
+            return {"gem": "v1" if next(polls) == 0 else "v2"}
+
+        def on_change():
+            reloads.append(1)
+            if len(reloads) == 1:
+                raise OSError("v2 is still being copied")
+            reloaded.set()
+
+        watcher = IndexWatcher(get_versions, on_change, interval=0.01)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        self.assertTrue(reloaded.wait(2))
+        time.sleep(0.05)
+        self.assertEqual(len(reloads), 2)  # the successful reload is not repeated
+
+
+class GemDomainTests(SimpleTestCase):
+    def test_degraded_answer_uses_structured_extraction_for_any_gem_domain(self):
+        tenders = DomainSpec(name="tenders", title="Tenders", description="State tenders", retrieval=GEM)
+        processor = mock.Mock()
+        processor.extract_structured_field.return_value = [Document(page_content="EMD Amount: Rs. 50,000")]
+        service = SimpleNamespace(domains=DomainRegistry(BUILTIN_DOMAINS + (tenders,)), gem_processor=processor)
+
+        with mock.patch.object(chatbot_graph, "chatbot_service", service):
+            answer = chatbot_graph._degraded_answer({
+                "question": "What is the EMD for GEM/2025/B/7893321?", "question_type": "tenders",
+                "documents": [_chunk("EMD Amount Rs. 50,000", "7893321")],
+            })
+        self.assertEqual(answer, "EMD Amount: Rs. 50,000")
+        processor.extract_structured_field.assert_called_once()
@@ -10,4 +10,7 @@ urlpatterns = [
     path('status/<str:task_id>/', views.chat_status_view, name='chat_status'),
     path('demo/', views.async_demo_view, name='async_demo'),
     path('test/', views.test_logging, name='test_logging'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('admin/indexes/', views.reload_indexes_view, name='reload_indexes'),
+    path('admin/profiles/', views.profiles_view, name='profiles'),
 ]
\ No newline at end of file
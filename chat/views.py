@@ -1,13 +1,18 @@
 # chat/views.py
 
 import logging
+import threading
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 
 logger = logging.getLogger(__name__)
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from .models import ChatFeedback
+from .faq import NEGATIVE as NEGATIVE_FEEDBACK
+from .metrics import REGISTRY
+from .profiling import memory_report, recent_profiles
 from langchain_core.messages import HumanMessage, AIMessage
-from .chatbot_graph import create_graph
+from .chatbot_graph import create_graph, run_graph
 from .chatbot_service import get_chatbot_service, memory_saver
 
 # Force fresh instance
@@ -19,8 +24,11 @@ import json
 # Create fresh graph with fresh service
 chatbot_app = create_graph(checkpointer=memory_saver)
 
+DEGRADED_HEADER = "X-Chatbot-Degraded"
+
 def chat_view(request):
     chat_history = request.session.get('chat_history', [])
+    degraded_stages = []
 
     if request.method == 'POST':
         question = request.POST.get('question', '').strip()
@@ -46,7 +54,7 @@ def chat_view(request):
                 langchain_chat_history.append(AIMessage(content=chat['content']))
         
         # Check if this is a disambiguation choice
-        if question.lower() in ['calamity', 'gem', 'general']:
+        if question.lower() in chatbot_service.domains:
             original_question = request.session.get('original_question', 'unknown')
             initial_state = {
                 "question": original_question,
@@ -65,21 +73,20 @@ def chat_view(request):
         
         try:
             # Handle workflow that might end with disambiguation
-            final_state = None
-            for state in chatbot_app.stream(initial_state, config=config):
-                final_state = state
-            
-            if final_state and isinstance(final_state, dict) and len(final_state) == 1:
-                final_state = list(final_state.values())[0]
+            final_state = run_graph(chatbot_app, initial_state, config)
             
             answer = final_state.get('answer', 'Sorry, I encountered an error.') if final_state else 'No response'
             
             # Store original question if disambiguation triggered
             if final_state and final_state.get('generation_source') == 'disambiguation':
                 request.session['original_question'] = question
+            
+            if final_state and final_state.get('degraded_stages'):
+                degraded_stages = final_state['degraded_stages']
+                logger.warning("Answer degraded to meet deadline", extra={"stages": degraded_stages})
                 
         except Exception as e:
-            logger.error(f"Chat processing error for question '{question[:50]}...': {str(e)}")
+            logger.error("Chat processing error", extra={"question": question[:50], "error": str(e)})
             
             # Check for API key issues
             if "API_KEY_INVALID" in str(e) or "API key not valid" in str(e):
@@ -97,7 +104,11 @@ def chat_view(request):
     request.session['chat_history'] = chat_history
     # Show only last 3 exchanges (6 messages) to user
     display_history = chat_history[-6:] if len(chat_history) > 6 else chat_history
-    return render(request, 'chat/chat.html', {'chat_history': display_history})
+    response = render(request, 'chat/chat.html', {'chat_history': display_history})
+    if degraded_stages:
+        # Stages skipped or cut short to meet the deadline, e.g. "retrieval,grading"
+        response[DEGRADED_HEADER] = ",".join(degraded_stages)
+    return response
 
 def feedback_view(request):
     if request.method == 'POST':
@@ -112,6 +123,10 @@ def feedback_view(request):
             feedback_type=feedback_type
         )
         
+        # A precomputed answer that users reject stops being served
+        if feedback_type in NEGATIVE_FEEDBACK and answer:
+            chatbot_service.faq.drop_answer(answer)
+        
         return JsonResponse({'status': 'success', 'message': 'Thanks for your feedback!'})
     
     return JsonResponse({'status': 'error'})
@@ -119,18 +134,10 @@ def feedback_view(request):
 def async_chat_view(request):
     """Start async chat processing"""
     if request.method == 'POST':
-        import sys
-        import os
-        from datetime import datetime
-        
         data = json.loads(request.body)
         question = data.get('question', '').strip()
         
-        # Log to file since terminal doesn't show
-        log_file = os.path.join(os.path.dirname(__file__), '..', 'debug.log')
-        with open(log_file, 'a') as f:
-            f.write(f"\n>>> ASYNC ENDPOINT HIT at {datetime.now()} <<<\n")
-            f.write(f"Raw question: '{question}'\n")
+        logger.info("Async endpoint hit", extra={"question": question[:50]})
         
         # Input validation
         if not question or len(question) < 3 or len(question) > 1000:
@@ -139,23 +146,45 @@ def async_chat_view(request):
         chat_history = request.session.get('chat_history', [])
         
         # Start async processing
-        with open(log_file, 'a') as f:
-            f.write(f"\n=== STARTING ASYNC PROCESSING ===\n")
-            f.write(f"Question: {question[:50]}...\n")
-        
         task_id = AsyncChatProcessor.process_chat_async(
             question, chat_history, request.session.session_key
         )
         
-        with open(log_file, 'a') as f:
-            f.write(f"Task ID: {task_id[:8]}...\n")
-            f.write(f"User will get INSTANT response with task_id\n")
-            f.write(f"=== ASYNC TASK QUEUED ===\n\n")
+        logger.info("Async task queued", extra={"task_id": task_id[:8]})
         
         return JsonResponse({'status': 'processing', 'task_id': task_id})
     
     return JsonResponse({'status': 'error'})
 
+def metrics_view(request):
+    """Prometheus text-format metrics"""
+    return HttpResponse(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _reload_in_background(force):
+    try:
+        chatbot_service.reload_indexes(force=force)
+    except Exception as e:
+        logger.error("Index reload failed", extra={"error": str(e)})
+
+@staff_member_required
+def reload_indexes_view(request):
+    """Index versions being served (GET) or start loading the published ones (POST)"""
+    if request.method == 'POST':
+        force = request.POST.get('force') == 'true'
+        threading.Thread(target=_reload_in_background, args=(force,), name="index-reload", daemon=True).start()
+        return JsonResponse({'status': 'reloading', 'published': chatbot_service.store_versions()}, status=202)
+    
+    return JsonResponse({
+        'status': 'ok',
+        'serving': chatbot_service.indexes.versions,
+        'published': chatbot_service.store_versions(),
+    })
+
+@staff_member_required
+def profiles_view(request):
+    """Resident size of stores and caches, plus summaries of the latest request profiles"""
+    return JsonResponse({**memory_report(chatbot_service), 'recent_profiles': list(recent_profiles)[::-1]})
+
 def chat_status_view(request, task_id):
     """Get status of async chat processing"""
     status = AsyncChatProcessor.get_task_status(task_id)
@@ -163,41 +192,10 @@ def chat_status_view(request, task_id):
 
 def async_demo_view(request):
     """Demo page for async chat"""
-    import sys
-    import os
-    from datetime import datetime
-    
-    # Log to both terminal and file
-    log_msg = f"\n=== ASYNC DEMO PAGE LOADED at {datetime.now()} ===\n"
-    print(log_msg)
-    sys.stdout.flush()
-    
-    # Also write to log file
-    log_file = os.path.join(os.path.dirname(__file__), '..', 'debug.log')
-    with open(log_file, 'a') as f:
-        f.write(log_msg)
-        f.write("User accessed /chat/demo/\n")
-        f.write("=== DEMO PAGE READY ===\n\n")
-    
+    logger.info("Async demo page loaded")
     return render(request, 'chat/async_chat.html')
 
 def test_logging(request):
     """Simple test to verify logging works"""
-    import sys
-    import os
-    from datetime import datetime
-    
-    # Write to both terminal AND file
-    log_msg = f"\n*** LOGGING TEST at {datetime.now()} ***\n"
-    print(log_msg)
-    sys.stdout.flush()
-    
-    # Also write to a log file
-    log_file = os.path.join(os.path.dirname(__file__), '..', 'debug.log')
-    with open(log_file, 'a') as f:
-        f.write(log_msg)
-        f.write(f"Request method: {request.method}\n")
-        f.write(f"Request path: {request.path}\n")
-        f.write("*** TEST COMPLETE ***\n\n")
-    
-    return JsonResponse({'message': f'Check terminal AND {log_file} for logs!', 'status': 'success'})
\ No newline at end of file
+    logger.info("Logging test", extra={"method": request.method, "path": request.path})
+    return JsonResponse({'message': 'Check debug.log for the logging test entry', 'status': 'success'})
\ No newline at end of file
@@ -65,6 +65,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'chat.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'chatbot_project.urls'
@@ -143,6 +144,32 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# Logging
+# Request threads only enqueue records; a background thread writes debug.log
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'chat.log_pipeline.RequestIdFilter'},
+    },
+    'handlers': {
+        'chat_file': {
+            '()': 'chat.log_pipeline.QueuedRotatingFileHandler',
+            'filename': os.getenv('CHAT_LOG_FILE', str(BASE_DIR / 'debug.log')),
+            'max_bytes': int(os.getenv('CHAT_LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            'backup_count': int(os.getenv('CHAT_LOG_BACKUP_COUNT', '5')),
+            'filters': ['request_id'],
+        },
+    },
+    'loggers': {
+        'chat': {
+            'handlers': ['chat_file'],
+            'level': os.getenv('CHAT_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 import os
 SESSION_ENGINE = 'django.contrib.sessions.backends.file'
 SESSION_FILE_PATH = os.path.join(BASE_DIR, 'sessions')